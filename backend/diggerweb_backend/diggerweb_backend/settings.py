@@ -11,7 +11,9 @@ https://docs.djangoproject.com/en/3.2/ref/settings/
 """
 
 from pathlib import Path
+import logging
 import os
+import tempfile
 from dotenv import load_dotenv, find_dotenv
 import dj_database_url
 
@@ -43,6 +45,7 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
 	'diggerweb_backend.discogs_api.apps.DiscogsApiConfig',
+	'diggerweb_backend.shops_api.apps.ShopsApiConfig',
 	'rest_framework',
 	'corsheaders'
 ]
@@ -50,6 +53,9 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    # Compression first and ETags after it, so that they are computed on the uncompressed content
+    'diggerweb_backend.discogs_api.http_cache.APIGZipMiddleware',
+    'django.middleware.http.ConditionalGetMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -99,9 +105,39 @@ if not DATABASES['default']:
          'default': {
              'ENGINE': 'django.db.backends.sqlite3',
              'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+             # On disk, so that the pool threads of the tests can write along with the main one
+             'TEST': {'NAME': os.path.join(BASE_DIR, 'test_db.sqlite3')},
          }
      }
 
+# Cache shared by the search pages and the sessions. DJANGO_CACHE_BACKEND=file (default) shares it between
+# the workers of the machine, 'memcached' (needs pymemcache) and 'db' (needs "manage.py createcachetable")
+# between the machines. 'locmem' keeps it in every worker: the invalidations of the cached searches then only
+# reach the worker making them. DJANGO_CACHE_LOCATION is the directory, the memcached servers (comma
+# separated) or the table
+CACHE_BACKENDS = {
+    'locmem': ('django.core.cache.backends.locmem.LocMemCache', 'diggerweb'),
+    'file': ('django.core.cache.backends.filebased.FileBasedCache', os.path.join(tempfile.gettempdir(), 'diggerweb-cache')),
+    'memcached': ('django.core.cache.backends.memcached.PyMemcacheCache', '127.0.0.1:11211'),
+    'db': ('django.core.cache.backends.db.DatabaseCache', 'diggerweb_cache'),
+}
+CACHE_BACKEND, CACHE_DEFAULT_LOCATION = CACHE_BACKENDS[os.getenv('DJANGO_CACHE_BACKEND', 'file')]
+CACHE_LOCATION = os.getenv('DJANGO_CACHE_LOCATION', CACHE_DEFAULT_LOCATION)
+# Memcached evicts by itself, the other backends cull their entries past MAX_ENTRIES
+CACHE_IS_MEMCACHED = CACHE_BACKEND.endswith('MemcacheCache')
+
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': CACHE_LOCATION.split(',') if CACHE_IS_MEMCACHED else CACHE_LOCATION,
+        'TIMEOUT': int(os.getenv('DJANGO_CACHE_TIMEOUT', '300')),
+        'OPTIONS': {} if CACHE_IS_MEMCACHED else {'MAX_ENTRIES': int(os.getenv('DJANGO_CACHE_MAX_ENTRIES', '10000'))},
+    }
+}
+
+# Sessions are read from the cache and written through to the database, so they survive a cache restart
+SESSION_ENGINE = os.getenv('DJANGO_SESSION_ENGINE', 'django.contrib.sessions.backends.cached_db')
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -146,3 +182,158 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Discogs API
+# Parallel marketplace stats lookups per worker process
+DISCOGS_STATS_MAX_WORKERS = int(os.getenv('DISCOGS_STATS_MAX_WORKERS', '8'))
+
+# Requests per minute assumed until Discogs reports the real budget in its headers
+DISCOGS_RATE_LIMIT_DEFAULT = int(os.getenv('DISCOGS_RATE_LIMIT_DEFAULT', '60'))
+DISCOGS_RATE_LIMIT_MAX_RETRIES = int(os.getenv('DISCOGS_RATE_LIMIT_MAX_RETRIES', '3'))
+DISCOGS_RATE_LIMIT_BACKOFF_BASE = float(os.getenv('DISCOGS_RATE_LIMIT_BACKOFF_BASE', '1.0'))
+DISCOGS_RATE_LIMIT_BACKOFF_MAX = float(os.getenv('DISCOGS_RATE_LIMIT_BACKOFF_MAX', '30.0'))
+
+# The budget of every token is shared by the worker processes through files in this directory, which must be
+# local to the machine. Crawls and stats refreshes leave these fractions of it to the calls with higher priority
+DISCOGS_RATE_LIMIT_DIR = os.getenv('DISCOGS_RATE_LIMIT_DIR', os.path.join(tempfile.gettempdir(), 'diggerweb-ratelimit'))
+DISCOGS_RATE_LIMIT_RESERVE_REFRESH = float(os.getenv('DISCOGS_RATE_LIMIT_RESERVE_REFRESH', '0.2'))
+DISCOGS_RATE_LIMIT_RESERVE_CRAWL = float(os.getenv('DISCOGS_RATE_LIMIT_RESERVE_CRAWL', '0.4'))
+
+# Marketplace stats cache: entries older than the TTL are served stale and refreshed in background,
+# entries older than the max stale age are refetched before answering
+DISCOGS_STATS_TTL = int(os.getenv('DISCOGS_STATS_TTL', '3600'))
+DISCOGS_STATS_MAX_STALE = int(os.getenv('DISCOGS_STATS_MAX_STALE', str(7 * 24 * 3600)))
+DISCOGS_STATS_CACHE_SIZE = int(os.getenv('DISCOGS_STATS_CACHE_SIZE', '10000'))
+DISCOGS_STATS_REFRESH_WORKERS = int(os.getenv('DISCOGS_STATS_REFRESH_WORKERS', '2'))
+
+# Full inventory snapshots: a new crawl starts when the latest snapshot is older than the max age,
+# a running crawl that hasn't saved a page for the stall timeout is considered dead
+DISCOGS_CRAWL_WORKERS = int(os.getenv('DISCOGS_CRAWL_WORKERS', '2'))
+DISCOGS_CRAWL_STALL_TIMEOUT = int(os.getenv('DISCOGS_CRAWL_STALL_TIMEOUT', '600'))
+DISCOGS_SNAPSHOT_MAX_AGE = int(os.getenv('DISCOGS_SNAPSHOT_MAX_AGE', str(24 * 3600)))
+# Refreshes are incremental syncs, but the whole inventory is crawled again once the last full crawl is this old
+DISCOGS_SNAPSHOT_FULL_CRAWL_AGE = int(os.getenv('DISCOGS_SNAPSHOT_FULL_CRAWL_AGE', str(7 * 24 * 3600)))
+
+# Batch searches: at most this many sellers per request, their inventory pages downloaded in parallel
+DISCOGS_BATCH_MAX_SELLERS = int(os.getenv('DISCOGS_BATCH_MAX_SELLERS', '10'))
+DISCOGS_BATCH_MAX_WORKERS = int(os.getenv('DISCOGS_BATCH_MAX_WORKERS', '4'))
+
+# Wantlists of the authorized user: checked again for changes after the TTL, fully reloaded after the max age.
+# Live matches scan at most this many inventory pages per request
+DISCOGS_WANTLIST_TTL = int(os.getenv('DISCOGS_WANTLIST_TTL', '300'))
+DISCOGS_WANTLIST_MAX_AGE = int(os.getenv('DISCOGS_WANTLIST_MAX_AGE', '3600'))
+DISCOGS_WANTLIST_MAX_PAGES = int(os.getenv('DISCOGS_WANTLIST_MAX_PAGES', '50'))
+
+# Price and availability history: hourly points are kept for the raw days, then one point per day up to
+# the retention. Trends cover the default days when the request doesn't say
+DISCOGS_HISTORY_RAW_DAYS = int(os.getenv('DISCOGS_HISTORY_RAW_DAYS', '30'))
+DISCOGS_HISTORY_RETENTION_DAYS = int(os.getenv('DISCOGS_HISTORY_RETENTION_DAYS', '730'))
+DISCOGS_HISTORY_DEFAULT_DAYS = int(os.getenv('DISCOGS_HISTORY_DEFAULT_DAYS', '90'))
+
+# Snapshot listings read per query by the inventory exports
+DISCOGS_EXPORT_CHUNK_SIZE = int(os.getenv('DISCOGS_EXPORT_CHUNK_SIZE', '500'))
+
+# Listings of the cross-seller offers index not seen again by a search or a crawl for this long are dropped
+DISCOGS_OFFERS_MAX_AGE = int(os.getenv('DISCOGS_OFFERS_MAX_AGE', str(7 * 24 * 3600)))
+
+# Lookups on other shops (shops_api): shops enabled, default time limit of a shop (SHOPS_<NAME>_TIMEOUT sets
+# the one of a shop, SHOPS_<NAME>_URL points it elsewhere), connections per shop, parallel lookups, how long
+# a parsed search page is reused and results per shop. No shop is enabled by default: the selectors of the
+# adapters have only been checked against the stand-in pages of shops_api/fixtures, not against the live
+# sites, so enable a shop (e.g. SHOPS_ENABLED=decks,hardwax,juno) once its adapter has been checked
+SHOPS_ENABLED = os.getenv('SHOPS_ENABLED', '')
+SHOPS_TIMEOUT = float(os.getenv('SHOPS_TIMEOUT', '4.0'))
+SHOPS_MAX_CONNECTIONS = int(os.getenv('SHOPS_MAX_CONNECTIONS', '4'))
+SHOPS_MAX_WORKERS = int(os.getenv('SHOPS_MAX_WORKERS', '12'))
+SHOPS_CACHE_TTL = int(os.getenv('SHOPS_CACHE_TTL', '900'))
+SHOPS_CACHE_SIZE = int(os.getenv('SHOPS_CACHE_SIZE', '1024'))
+SHOPS_MAX_RESULTS = int(os.getenv('SHOPS_MAX_RESULTS', '10'))
+
+# Background jobs (run_jobs command): threads per worker, lease of a running job, queue polling, retries
+# with exponential delay and how long finished jobs are kept
+DISCOGS_JOBS_THREADS = int(os.getenv('DISCOGS_JOBS_THREADS', '2'))
+DISCOGS_JOBS_LEASE = int(os.getenv('DISCOGS_JOBS_LEASE', '300'))
+DISCOGS_JOBS_POLL_INTERVAL = float(os.getenv('DISCOGS_JOBS_POLL_INTERVAL', '5'))
+DISCOGS_JOBS_MAX_ATTEMPTS = int(os.getenv('DISCOGS_JOBS_MAX_ATTEMPTS', '3'))
+DISCOGS_JOBS_RETRY_DELAY = int(os.getenv('DISCOGS_JOBS_RETRY_DELAY', '60'))
+DISCOGS_JOBS_RETENTION = int(os.getenv('DISCOGS_JOBS_RETENTION', str(7 * 24 * 3600)))
+
+# Default refresh intervals of the watched sellers, spread by +/- DISCOGS_WATCH_JITTER of the interval.
+# A stats refresh updates at most DISCOGS_WATCH_STATS_BATCH releases, the oldest first
+DISCOGS_WATCH_INVENTORY_INTERVAL = int(os.getenv('DISCOGS_WATCH_INVENTORY_INTERVAL', str(6 * 3600)))
+DISCOGS_WATCH_STATS_INTERVAL = int(os.getenv('DISCOGS_WATCH_STATS_INTERVAL', '1800'))
+DISCOGS_WATCH_JITTER = float(os.getenv('DISCOGS_WATCH_JITTER', '0.1'))
+DISCOGS_WATCH_STATS_BATCH = int(os.getenv('DISCOGS_WATCH_STATS_BATCH', '500'))
+
+# Search pages can be reused by the browser for this long (never longer than DISCOGS_STATS_TTL), then
+# revalidated with their ETag
+DISCOGS_SEARCH_MAX_AGE = int(os.getenv('DISCOGS_SEARCH_MAX_AGE', '60'))
+
+# Search pages are kept in the DISCOGS_SEARCH_CACHE cache for this long (never longer than DISCOGS_STATS_TTL)
+# and served to every client asking the same page; 0 switches it off. They are dropped as soon as the seller
+# gets a new snapshot or fresh stats
+DISCOGS_SEARCH_CACHE = os.getenv('DISCOGS_SEARCH_CACHE', 'default')
+DISCOGS_SEARCH_CACHE_TTL = int(os.getenv('DISCOGS_SEARCH_CACHE_TTL', '120'))
+
+# Pages answered at their deadline (deadline_ms) can be completed with their continuation token for this long
+DISCOGS_CONTINUATION_TTL = int(os.getenv('DISCOGS_CONTINUATION_TTL', '600'))
+
+# Keep-alive connection pool of the async search path (one per ASGI worker)
+DISCOGS_HTTP_MAX_CONNECTIONS = int(os.getenv('DISCOGS_HTTP_MAX_CONNECTIONS', '20'))
+DISCOGS_HTTP_MAX_KEEPALIVE = int(os.getenv('DISCOGS_HTTP_MAX_KEEPALIVE', '10'))
+DISCOGS_HTTP_KEEPALIVE_EXPIRY = float(os.getenv('DISCOGS_HTTP_KEEPALIVE_EXPIRY', '30.0'))
+DISCOGS_HTTP_TIMEOUT = float(os.getenv('DISCOGS_HTTP_TIMEOUT', '15.0'))
+
+# Credentials and token identity are kept in memory; the identity is verified again after the TTL or a 401
+DISCOGS_CREDENTIALS_CACHE_TTL = int(os.getenv('DISCOGS_CREDENTIALS_CACHE_TTL', '60'))
+DISCOGS_IDENTITY_TTL = int(os.getenv('DISCOGS_IDENTITY_TTL', '900'))
+
+# A token rejected with a 401 that still passes the identity check (a one-off signature rejection) is kept
+# out of the calls for this many seconds. It leaves the pool only when the identity check is rejected too
+DISCOGS_UNAUTHORIZED_COOLDOWN = float(os.getenv('DISCOGS_UNAUTHORIZED_COOLDOWN', '30'))
+
+# Coalescing of identical searches and stats lookups: the lock files (and the short lived results shared
+# between the workers) live in this directory, which must be local to the machine. Keys share a bounded
+# number of lock files, expired results are deleted by every worker at most every PRUNE_INTERVAL seconds
+DISCOGS_SINGLEFLIGHT_DIR = os.getenv('DISCOGS_SINGLEFLIGHT_DIR', os.path.join(tempfile.gettempdir(), 'diggerweb-singleflight'))
+DISCOGS_SINGLEFLIGHT_LOCK_TIMEOUT = float(os.getenv('DISCOGS_SINGLEFLIGHT_LOCK_TIMEOUT', '120'))
+DISCOGS_SINGLEFLIGHT_RESULT_TTL = float(os.getenv('DISCOGS_SINGLEFLIGHT_RESULT_TTL', '15'))
+DISCOGS_SINGLEFLIGHT_LOCK_BUCKETS = int(os.getenv('DISCOGS_SINGLEFLIGHT_LOCK_BUCKETS', '1024'))
+DISCOGS_SINGLEFLIGHT_PRUNE_INTERVAL = float(os.getenv('DISCOGS_SINGLEFLIGHT_PRUNE_INTERVAL', '300'))
+
+# Metrics: every worker saves its counters in this directory (local to the machine) at most every
+# DISCOGS_METRICS_FLUSH_INTERVAL seconds, the /api/discogs/metrics/ endpoint adds them up
+DISCOGS_METRICS_DIR = os.getenv('DISCOGS_METRICS_DIR', os.path.join(tempfile.gettempdir(), 'diggerweb-metrics'))
+DISCOGS_METRICS_FLUSH_INTERVAL = float(os.getenv('DISCOGS_METRICS_FLUSH_INTERVAL', '5'))
+
+# Logging of the Discogs app: DISCOGS_LOG_LEVEL=OFF switches it off, DISCOGS_LOG_FORMAT=plain drops the
+# logfmt fields for human readable lines
+DISCOGS_LOG_LEVEL = os.getenv('DISCOGS_LOG_LEVEL', 'INFO').upper()
+DISCOGS_LOG_FORMAT = os.getenv('DISCOGS_LOG_FORMAT', 'logfmt')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'logfmt': {
+            '()': 'diggerweb_backend.discogs_api.log_format.LogfmtFormatter',
+        },
+        'plain': {
+            'format': '%(asctime)s %(levelname)s %(name)s: %(message)s',
+        },
+    },
+    'handlers': {
+        'discogs_console': {
+            'class': 'logging.StreamHandler',
+            'formatter': DISCOGS_LOG_FORMAT,
+        },
+    },
+    'loggers': {
+        'diggerweb_backend.discogs_api': {
+            'handlers': ['discogs_console'],
+            'level': logging.CRITICAL + 1 if DISCOGS_LOG_LEVEL == 'OFF' else DISCOGS_LOG_LEVEL,
+            'propagate': False,
+        },
+    },
+}
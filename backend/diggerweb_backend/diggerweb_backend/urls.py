@@ -18,5 +18,6 @@ from django.urls import path, include
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-	path('api/discogs/', include('diggerweb_backend.discogs_api.urls'))
+	path('api/discogs/', include('diggerweb_backend.discogs_api.urls')),
+	path('api/shops/', include('diggerweb_backend.shops_api.urls'))
 ]
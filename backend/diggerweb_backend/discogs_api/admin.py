@@ -1,3 +1,16 @@
 from django.contrib import admin
 
+from .models import Job, WatchedSeller
+
 # Register your models here.
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('kind', 'key', 'status', 'attempts', 'max_attempts', 'run_after', 'locked_by', 'finished_at')
+    list_filter = ('status', 'kind')
+    search_fields = ('key', 'last_error')
+
+@admin.register(WatchedSeller)
+class WatchedSellerAdmin(admin.ModelAdmin):
+    list_display = ('seller', 'inventory_interval', 'stats_interval', 'next_inventory_at', 'next_stats_at')
+    search_fields = ('seller__username',)
@@ -0,0 +1,147 @@
+# Copyright 2025 Giorgio Gamba
+
+import asyncio
+import json
+import logging
+import time
+import weakref
+
+import httpx
+from discogs_client.exceptions import HTTPError
+from django.conf import settings
+from asgiref.sync import sync_to_async
+from oauthlib import oauth1
+
+from .constants import APPLICATION_AGENT_NAME, DISCOGS_CONSUMER_KEY, DISCOGS_CONSUMER_SECRET, DISCOGS_IDENTITY_URL, HTTP_TOO_MANY_REQUESTS
+from .client import CLIENT_POOL, HTTP_UNAUTHORIZED, has_other_account
+from .credentials import CREDENTIAL_POOL, is_shared_url
+from .metrics import record_throttle_wait, record_upstream_call
+from .ratelimit import PRIORITY_NAMES, current_priority, get_rate_limiter, parse_retry_after
+from .utils import revoke_access_token
+
+logger = logging.getLogger(__name__)
+
+# One keep-alive connection pool per event loop (one per uvicorn worker), shared by every request of the loop
+_http_clients = weakref.WeakKeyDictionary()
+
+def get_http_client():
+    loop = asyncio.get_running_loop()
+    http_client = _http_clients.get(loop)
+    if http_client is None or http_client.is_closed:
+        limits = httpx.Limits(
+            max_connections=settings.DISCOGS_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.DISCOGS_HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=settings.DISCOGS_HTTP_KEEPALIVE_EXPIRY,
+        )
+        http_client = httpx.AsyncClient(limits=limits, timeout=settings.DISCOGS_HTTP_TIMEOUT)
+        _http_clients[loop] = http_client
+    return http_client
+
+# The rate limiters keep their state in files locked with a blocking flock, shared with the other workers:
+# waiting for those locks on the event loop would stall every request of the worker, so they run in threads.
+# The limiters don't touch the DB, so they don't need the thread sensitive executor
+def off_loop(fn, *args):
+    return sync_to_async(fn, thread_sensitive=False)(*args)
+
+# Asyncio counterpart of DiscogsClient: OAuth 1.0a signed GET requests on the shared connection pool,
+# governed by the same per token rate limiters. Calls to shared resources are spread over the given pool of
+# credentials (loaded beforehand, as the DB can't be read from the event loop), like with the sync client.
+# Errors are raised as discogs_client HTTPError, like the sync client
+class AsyncDiscogsClient:
+
+    def __init__(self, access_token, access_secret, consumer_key=DISCOGS_CONSUMER_KEY, consumer_secret=DISCOGS_CONSUMER_SECRET, credentials=None):
+        self.oauth = oauth1.Client(consumer_key, client_secret=consumer_secret,
+                                   resource_owner_key=access_token, resource_owner_secret=access_secret)
+        self.access_token = access_token
+        self.limiter = get_rate_limiter(access_token)
+        self.credentials = credentials or []
+
+    # Returns the signer and the rate limiter of the call, once the limiter allowed it
+    async def schedule(self, url):
+        shared = bool(self.credentials) and is_shared_url(url)
+        priority = current_priority()
+        waited = 0.0
+        while True:
+            if shared:
+                account, wait = await off_loop(CREDENTIAL_POOL.try_acquire, priority, self.credentials)
+            else:
+                account, wait = (self.oauth, self.limiter), await off_loop(self.limiter.try_acquire, priority)
+            if wait <= 0:
+                record_throttle_wait(waited, PRIORITY_NAMES.get(priority))
+                return account
+            await asyncio.sleep(wait)
+            waited += wait
+
+    async def get(self, url):
+        http_client = get_http_client()
+        attempts = settings.DISCOGS_RATE_LIMIT_MAX_RETRIES + 1
+
+        for attempt in range(attempts):
+            signer, limiter = await self.schedule(url)
+
+            headers = {'Accept-Encoding': 'gzip', 'User-Agent': APPLICATION_AGENT_NAME}
+            uri, signed_headers, _ = signer.sign(url, http_method='GET', headers=headers)
+            start = time.perf_counter()
+            resp = await http_client.get(uri, headers=signed_headers)
+            record_upstream_call(url, resp.status_code, time.perf_counter() - start)
+
+            if resp.status_code == HTTP_UNAUTHORIZED:
+                await self.handle_unauthorized(http_client, signer, limiter, url)
+
+                # A shared call can still be made with another account of the pool
+                if signer is not self.oauth and has_other_account(self.credentials, signer.resource_owner_key):
+                    continue
+
+            if resp.status_code != HTTP_TOO_MANY_REQUESTS:
+                await off_loop(limiter.update_from_headers, resp.headers)
+                break
+
+            delay = await off_loop(limiter.register_throttled, parse_retry_after(resp.headers))
+            logger.warning("Discogs rate limit hit on %s (attempt %d/%d), backing off %.1fs", url, attempt + 1, attempts, delay)
+
+        if resp.status_code == 204:
+            return None
+
+        try:
+            body = json.loads(resp.content.decode('utf8'))
+        except ValueError:
+            # Gateways in front of Discogs answer their errors (502, 503) with an HTML page
+            if 200 <= resp.status_code < 300:
+                raise
+            raise HTTPError(resp.reason_phrase or "Unexpected response", resp.status_code)
+
+        if 200 <= resp.status_code < 300:
+            return body
+        raise HTTPError(body.get('message') if isinstance(body, dict) else None, resp.status_code)
+
+    # Same as RateLimitedFetcher.handle_unauthorized: the token is revoked only when the identity call is rejected too
+    async def handle_unauthorized(self, http_client, signer, limiter, url):
+        access_token = signer.resource_owner_key
+        CLIENT_POOL.invalidate(access_token)
+
+        if url.startswith(DISCOGS_IDENTITY_URL) or await self.identity_rejected(http_client, signer, limiter):
+            await sync_to_async(revoke_access_token)(access_token)
+            self.credentials = [account for account in self.credentials if account[0] != access_token]
+        else:
+            logger.warning("Discogs rejected credentials %s... on %s but not on the identity check, cooling down", access_token[:4], url)
+            await off_loop(limiter.cool_down, settings.DISCOGS_UNAUTHORIZED_COOLDOWN)
+
+    async def identity_rejected(self, http_client, signer, limiter):
+        while True:
+            wait = await off_loop(limiter.try_acquire)
+            if wait <= 0:
+                break
+            await asyncio.sleep(wait)
+
+        uri, signed_headers, _ = signer.sign(DISCOGS_IDENTITY_URL, http_method='GET', headers={'User-Agent': APPLICATION_AGENT_NAME})
+        start = time.perf_counter()
+        try:
+            resp = await http_client.get(uri, headers=signed_headers)
+        except httpx.HTTPError as e:
+            logger.warning("Identity check of credentials %s... failed: %s", signer.resource_owner_key[:4], e)
+            return False
+        record_upstream_call(DISCOGS_IDENTITY_URL, resp.status_code, time.perf_counter() - start)
+        return resp.status_code == HTTP_UNAUTHORIZED
+
+    async def identity(self):
+        return await self.get(DISCOGS_IDENTITY_URL)
@@ -0,0 +1,186 @@
+# Copyright 2025 Giorgio Gamba
+
+import asyncio
+import logging
+import weakref
+
+import discogs_client
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import JsonResponse
+from django.urls import reverse
+
+from .async_client import AsyncDiscogsClient
+from .client import CLIENT_POOL, get_authenticated_client
+from .constants import DISCOGS_MARKETPLACE_STATS_URL
+from .metrics import PHASE_CREDENTIALS, PHASE_IDENTITY, PHASE_INVENTORY, PHASE_STATS, request_timing, timed
+from .listings import inventory_page_url, parse_inventory_response, parse_pagination_params, get_release_id, build_item, num_for_sale_sort_key
+from .stats import lookup_cached_stats, store_stats
+from .utils import load_credentials_pool
+from .views import DISCOGS_API_ERROR, ERROR_KEY, DISCOGS_AUTHORIZE_KEY, finish_live_page
+
+logger = logging.getLogger(__name__)
+
+# Asyncio counterpart of fetch_marketplace_stats
+async def fetch_marketplace_stats_async(client, release_id):
+    try:
+        stats = await client.get(f"{DISCOGS_MARKETPLACE_STATS_URL}{release_id}")
+
+    except discogs_client.exceptions.HTTPError as stats_http_err:
+        logger.warning("HTTPError %s while retrieving stats for release %s: %s", stats_http_err.status_code, release_id, stats_http_err.msg)
+        return None, f"Stats not available ({stats_http_err.status_code})"
+
+    except Exception as stats_e:
+        logger.warning("Unexpected error while retrieving stats for release %s: %s", release_id, stats_e)
+        return None, f"Error - Stats not availble"
+
+    if stats:
+        await sync_to_async(store_stats)(release_id, stats)
+    return stats, None
+
+# Stats lookups in flight on this event loop: concurrent searches wait for the same task instead of
+# repeating the call. The file locks used by the sync path would block the loop, so this stays per worker
+_inflight_stats = weakref.WeakKeyDictionary()
+
+async def fetch_marketplace_stats_coalesced_async(client, release_id):
+    inflight = _inflight_stats.setdefault(asyncio.get_running_loop(), {})
+
+    task = inflight.get(release_id)
+    if task is None:
+        task = asyncio.ensure_future(fetch_marketplace_stats_async(client, release_id))
+        inflight[release_id] = task
+        task.add_done_callback(lambda _: inflight.pop(release_id, None))
+
+    return await asyncio.shield(task)
+
+# Same results as DiscogsSearchView.searchUserInventory_API_Filtered, with the stats lookups running as
+# coroutines. Release details, price history, offers and cheaper_elsewhere come from the same finish_live_page
+async def search_user_inventory_async(client, refresh_client, username, page_num, items_per_page):
+
+    logger.debug("Looking for \"For Sale\" items at page %d for user %s (%d items/page) [async]", page_num, username, items_per_page)
+
+    with timed(PHASE_INVENTORY):
+        response_data = await client.get(inventory_page_url(username, page_num, items_per_page))
+    listings_data, pagination_info = parse_inventory_response(response_data, page_num, items_per_page)
+
+    release_ids = [release_id for release_id in (get_release_id(listing_dict) for listing_dict in listings_data) if release_id]
+
+    # Stale cache entries are refreshed by the background pool, which needs a regular client
+    cached, missing = await sync_to_async(lookup_cached_stats)(refresh_client, release_ids)
+    stats_by_release = {release_id: (stats, None) for release_id, stats in cached.items()}
+
+    semaphore = asyncio.Semaphore(settings.DISCOGS_STATS_MAX_WORKERS)
+
+    async def fetch(release_id):
+        async with semaphore:
+            stats_by_release[release_id] = await fetch_marketplace_stats_coalesced_async(client, release_id)
+
+    with timed(PHASE_STATS):
+        await asyncio.gather(*(fetch(release_id) for release_id in missing))
+
+    output_results = []
+    for listing_dict in listings_data:
+        try:
+            release_id = get_release_id(listing_dict)
+            if not release_id:
+                continue
+
+            stats_response, stats_error_msg = stats_by_release[release_id]
+            output_results.append(build_item(listing_dict, stats_response, stats_error_msg))
+
+        except Exception as item_e:
+            listing_id_str = listing_dict.get('id', 'Unknown')
+            logger.exception("Skipping item %s, error during elaboration: %s", listing_id_str, item_e)
+            output_results.append({'id': listing_id_str,'error': f"Unexpected error while elaborating: {item_e}"})
+
+    output_results.sort(key=num_for_sale_sort_key, reverse=False)
+
+    await sync_to_async(finish_live_page)(username, output_results)
+    return output_results, pagination_info
+
+# Async version of the live mode of DiscogsSearchView for ASGI deployments (uvicorn workers): upstream calls
+# share a keep-alive connection pool and no thread is blocked while waiting for Discogs. Takes 'q', 'page' and
+# 'per_page' and answers with the same pagination and results as the sync view. Unlike it, there is no snapshot
+# mode (watched sellers are searched live too), no 'deadline_ms' with continuations, no shared response cache,
+# no ETag or Cache-Control, and concurrent stats lookups are coalesced only within the worker
+async def discogs_search_async(request):
+    with request_timing('discogs_search_async') as timing:
+        response = await _discogs_search_async(request)
+        timing.status = response.status_code
+    response['Server-Timing'] = timing.server_timing()
+    return response
+
+async def _discogs_search_async(request):
+
+    with timed(PHASE_CREDENTIALS):
+        credentials = await sync_to_async(load_credentials_pool)()
+    access_token, access_secret = credentials[0] if credentials else (None, None)
+
+    if not access_token or not access_secret:
+        logger.info("Authorization data missing. Authorization is needed")
+        auth_url = request.build_absolute_uri(reverse(DISCOGS_AUTHORIZE_KEY))
+        return JsonResponse({
+            ERROR_KEY: "Discogs authorization required.",
+            "authorize_url": auth_url
+        }, status=401)
+
+    client = AsyncDiscogsClient(access_token, access_secret, credentials=credentials)
+
+    try:
+        # Verify authentication by making a simple call, unless it has been verified recently
+        identity = CLIENT_POOL.get_identity_data(access_token)
+        if identity is None:
+            with timed(PHASE_IDENTITY):
+                identity = await client.identity()
+            CLIENT_POOL.store_identity_data(access_token, identity)
+        logger.debug("Authenticated as Discogs user: %s", identity.get('username'))
+
+    except discogs_client.exceptions.HTTPError as auth_error:
+        logger.warning("Discogs authentication failed: %s", auth_error)
+        auth_url = request.build_absolute_uri(reverse(DISCOGS_AUTHORIZE_KEY))
+        return JsonResponse({
+            ERROR_KEY: f"Invalid or expired Discogs credentials. Please re-authorize. ({auth_error})",
+            "authorize_url": auth_url
+        }, status=401)
+
+    except Exception as e:
+        logger.exception("Error initializing Discogs client: %s", e)
+        return JsonResponse({ERROR_KEY: f"Failed to initialize Discogs client: {e}"}, status=500)
+
+    username = request.GET.get('q')
+
+    if not username:
+        return JsonResponse({ERROR_KEY: "Missing 'q' parameter (username)."}, status=400)
+
+    try:
+        page_num, items_per_page = parse_pagination_params(request.GET)
+
+    except ValueError:
+        return JsonResponse({ERROR_KEY: "'page' and 'per_page' parameters must be integers."}, status=400)
+
+    try:
+        refresh_client = get_authenticated_client(access_token, access_secret)
+        output_results, pagination_info = await search_user_inventory_async(client, refresh_client, username, page_num, items_per_page)
+
+        response_data = {
+            'pagination': pagination_info,
+            'results': output_results
+        }
+        return JsonResponse(response_data, status=200)
+
+    except discogs_client.exceptions.HTTPError as http_error:
+        status_code = http_error.status_code
+        if status_code == 401: # Unauthorized during search - token might have been revoked
+            auth_url = request.build_absolute_uri(reverse(DISCOGS_AUTHORIZE_KEY))
+            return JsonResponse({
+                ERROR_KEY: f"Discogs API authentication error ({status_code}). Please re-authorize. ({http_error.msg})",
+                "authorize_url": auth_url
+            }, status=status_code)
+        elif status_code == 404:
+            return JsonResponse({ERROR_KEY: f"Discogs user '{username}' not found or inventory is private/empty. ({http_error.msg})"}, status=status_code)
+        else:
+            return JsonResponse({ERROR_KEY: f"{DISCOGS_API_ERROR} ({status_code}): {http_error.msg}"}, status=status_code)
+
+    except Exception as e:
+        logger.exception("Unexpected server error during search for user %s", username)
+        return JsonResponse({ERROR_KEY: "Server internal error during research"}, status=500)
@@ -0,0 +1,170 @@
+# Copyright 2025 Giorgio Gamba
+
+import contextvars
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal, InvalidOperation
+
+import discogs_client
+import requests
+from django.conf import settings
+
+from .crawler import get_seller
+from .dumps import add_release_details
+from .history import record_listing_prices
+from .filters import item_matches
+from .listings import fetch_inventory_page, get_release_id, build_item, condition_rank, num_for_sale_sort_key
+from .metrics import PHASE_STATS, timed
+from .offers import record_offers
+from .stats import fetch_marketplace_stats_bulk
+
+logger = logging.getLogger(__name__)
+
+# Inventory pages of the sellers of a batch search. Shared by the requests of the worker, the rate limiter
+# decides how fast they actually go
+BATCH_EXECUTOR = ThreadPoolExecutor(max_workers=settings.DISCOGS_BATCH_MAX_WORKERS, thread_name_prefix='discogs-batch')
+
+# Fields of an item describing the copy on sale, as opposed to the release
+COPY_FIELDS = ['seller', 'id', 'url', 'price', 'currency', 'condition', 'sleeve_condition', 'status']
+
+# Reads the sellers from the 'q' parameter, given as a comma separated list and/or repeated. Duplicates
+# are dropped (usernames are case insensitive), the order is kept
+def parse_usernames(query_params):
+    usernames = []
+    seen = set()
+    for value in query_params.getlist('q'):
+        for username in value.split(','):
+            username = username.strip()
+            if username and username.lower() not in seen:
+                seen.add(username.lower())
+                usernames.append(username)
+    return usernames
+
+# Downloads the same page of every inventory in parallel. Returns the dicts username -> (listings, pagination)
+# of the sellers found and username -> error of the others (HTTP, API or network errors, invalid responses).
+# A 401 is raised, as it fails the whole batch
+def fetch_inventory_pages(client, usernames, page_num, items_per_page):
+    futures = {}
+    for username in usernames:
+        # Each task runs in a copy of the request context, so it keeps its upstream priority and request timing
+        context = contextvars.copy_context()
+        futures[username] = BATCH_EXECUTOR.submit(context.run, fetch_inventory_page, client, username, page_num, items_per_page)
+
+    pages = {}
+    errors = {}
+    for username, future in futures.items():
+        try:
+            pages[username] = future.result()
+
+        except discogs_client.exceptions.HTTPError as http_error:
+            if getattr(http_error, 'status_code', None) == 401:
+                raise
+            logger.warning("HTTPError during batch search for %s (page %d): %s", username, page_num, http_error)
+            errors[username] = http_error
+
+        except discogs_client.exceptions.DiscogsAPIError as api_error:
+            logger.warning("DiscogsAPIError during batch search for %s (page %d): %s", username, page_num, api_error)
+            errors[username] = api_error
+
+        except requests.RequestException as request_error:
+            logger.warning("Network error during batch search for %s (page %d): %s", username, page_num, request_error)
+            errors[username] = request_error
+
+        except ValueError as val_error:
+            logger.warning("ValueError during batch search for %s (page %d): %s", username, page_num, val_error)
+            errors[username] = val_error
+
+    return pages, errors
+
+def _price(item):
+    try:
+        return Decimal(str(item['price']))
+    except (InvalidOperation, KeyError):
+        return None
+
+# Groups the items by release. Every release lists the cheapest copy of each (condition, currency), best
+# condition first, as prices in different currencies can't be compared
+def merge_by_release(items):
+    releases = {}
+    for item in items:
+        release = releases.get(item['release_id'])
+        if release is None:
+            release = releases[item['release_id']] = {
+                'release_id': item['release_id'],
+                'title': item['title'],
+                'artist': item['artist'],
+                'num_for_sale': item['num_for_sale'],
+                'lowest_price': item['lowest_price'],
+                'lowest_price_currency': item['lowest_price_currency'],
+                'copies': 0,
+                'sellers': [],
+                'cheapest': {},
+            }
+            if 'stats_error' in item:
+                release['stats_error'] = item['stats_error']
+
+        release['copies'] += 1
+        if item['seller'] not in release['sellers']:
+            release['sellers'].append(item['seller'])
+
+        key = (item['condition'], item['currency'])
+        cheapest = release['cheapest'].get(key)
+        price = _price(item)
+        if cheapest is None or (price is not None and (_price(cheapest) is None or price < _price(cheapest))):
+            release['cheapest'][key] = {field: item.get(field) for field in COPY_FIELDS}
+
+    merged = []
+    for release in releases.values():
+        copies = release.pop('cheapest').values()
+        release['cheapest_by_condition'] = sorted(copies, key=lambda copy: (-(condition_rank(copy['condition']) or 0),
+                                                                          copy['currency'] or '',
+                                                                          _price(copy) is None, _price(copy) or 0))
+        merged.append(release)
+
+    merged.sort(key=lambda release: (num_for_sale_sort_key(release), release['release_id']))
+    return merged
+
+# Searches the given page of the inventories of several sellers at once. Marketplace stats are looked up
+# once per release, whatever the number of sellers offering it. Returns the merged releases and the
+# dict username -> pagination info, or error message when the inventory couldn't be read
+def search_inventories(client, usernames, page_num, items_per_page, filters=None):
+    pages, errors = fetch_inventory_pages(client, usernames, page_num, items_per_page)
+
+    release_ids = {get_release_id(listing_dict) for listings_data, _ in pages.values() for listing_dict in listings_data}
+    release_ids.discard(None)
+    with timed(PHASE_STATS):
+        stats_by_release = fetch_marketplace_stats_bulk(client, sorted(release_ids))
+
+    items = []
+    sellers = {}
+    for username in usernames:
+        if username in errors:
+            error = errors[username]
+            sellers[username] = {'error': str(getattr(error, 'msg', error)), 'status': getattr(error, 'status_code', None)}
+            continue
+
+        listings_data, pagination_info = pages[username]
+        seller_items = []
+        for listing_dict in listings_data:
+            release_id = get_release_id(listing_dict)
+            if not release_id:
+                continue
+
+            stats_response, stats_error_msg = stats_by_release[release_id]
+            item = build_item(listing_dict, stats_response, stats_error_msg)
+            item['seller'] = username
+            seller_items.append(item)
+
+        # Every price seen goes to the history and to the offers index, not only the ones matching the filters
+        seller = get_seller(username)
+        record_listing_prices(seller, seller_items)
+        record_offers(seller, seller_items)
+
+        matching = [item for item in seller_items if not filters or item_matches(item, filters)]
+        items.extend(matching)
+        sellers[username] = {'pagination': pagination_info, 'matching': len(matching)}
+
+    merged = add_release_details(merge_by_release(items))
+
+    logger.debug("Batch search of %d sellers: %d items, %d releases looked up", len(usernames), len(items), len(release_ids))
+    return merged, sellers
@@ -0,0 +1,124 @@
+# Copyright 2025 Giorgio Gamba
+
+import json
+import random
+
+# Inventory sizes the generator is meant for
+MIN_LISTINGS = 100
+MAX_LISTINGS = 50000
+
+CONDITIONS = [
+    'Mint (M)',
+    'Near Mint (NM or M-)',
+    'Very Good Plus (VG+)',
+    'Very Good (VG)',
+    'Good Plus (G+)',
+    'Good (G)',
+    'Fair (F)',
+    'Poor (P)',
+]
+
+SLEEVE_CONDITIONS = CONDITIONS + ['Generic', 'Not Graded', 'No Cover']
+
+CURRENCIES = ['EUR', 'USD', 'GBP']
+
+_SYLLABLES = ['ka', 'lo', 'mi', 'ne', 'ro', 'ta', 'vu', 'ze', 'dub', 'tek', 'son', 'bass']
+
+def _name(rng, words):
+    return ' '.join(''.join(rng.choice(_SYLLABLES) for _ in range(rng.randint(2, 3))).capitalize() for _ in range(words))
+
+# A fixture holds everything the mock server replays:
+#   identity    - response of /oauth/identity
+#   inventories - username -> raw listings, in the order of the default inventory sort
+#   stats       - release id (as string, JSON keys) -> response of /marketplace/stats/{id}
+# Recorded responses can be stored in the same format
+def empty_fixture(username='benchmark'):
+    return {
+        'identity': {'id': 1, 'username': username, 'resource_url': f"https://api.discogs.com/users/{username}", 'consumer_name': 'diggerweb'},
+        'inventories': {},
+        'stats': {},
+    }
+
+# Adds a synthetic inventory of the given size to the fixture. Releases are drawn from a pool smaller than
+# the inventory, so that some of them repeat as they do in real shops. The same seed gives the same inventory
+def add_synthetic_inventory(fixture, username, listings_count, seed=0, repeated_releases=0.2, first_release_id=1000000):
+    if not MIN_LISTINGS <= listings_count <= MAX_LISTINGS:
+        raise ValueError(f"Inventories must have between {MIN_LISTINGS} and {MAX_LISTINGS} listings")
+
+    rng = random.Random(f"{seed}-{username}")
+    releases_count = max(1, int(listings_count * (1 - repeated_releases)))
+    currency = rng.choice(CURRENCIES)
+
+    releases = []
+    for index in range(releases_count):
+        release_id = first_release_id + index
+        artist = _name(rng, rng.randint(1, 2))
+        title = _name(rng, rng.randint(1, 4))
+        releases.append({
+            'id': release_id,
+            'description': f"{artist} - {title} (LP, Album)",
+            'artist': artist,
+            'title': title,
+            'format': 'LP, Album',
+            'year': rng.randint(1960, 2025),
+            'artists': [{'name': artist}],
+            'resource_url': f"https://api.discogs.com/releases/{release_id}",
+        })
+
+        # Most releases have few copies on sale, a few of them have hundreds
+        num_for_sale = int(rng.paretovariate(1.2)) - 1
+        lowest_price = round(rng.lognormvariate(2.3, 0.8), 2)
+        fixture['stats'].setdefault(str(release_id), {
+            'num_for_sale': num_for_sale,
+            'lowest_price': {'value': lowest_price, 'currency': currency} if num_for_sale else None,
+            'blocked_from_sale': False,
+        })
+
+    listings = []
+    # Listing ids are unique among the sellers of the fixture
+    listing_base = 100000000 + len(fixture['inventories']) * MAX_LISTINGS
+    for index in range(listings_count):
+        release = releases[index % releases_count] if index < releases_count else rng.choice(releases)
+        listing_id = listing_base + index
+        listings.append({
+            'id': listing_id,
+            'status': 'For Sale',
+            'uri': f"https://www.discogs.com/sell/item/{listing_id}",
+            'resource_url': f"https://api.discogs.com/marketplace/listings/{listing_id}",
+            'price': {'value': round(rng.lognormvariate(2.5, 0.7), 2), 'currency': currency},
+            'condition': rng.choice(CONDITIONS[:6]),
+            'sleeve_condition': rng.choice(SLEEVE_CONDITIONS),
+            'posted': f"2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T12:00:00-07:00",
+            'release': release,
+        })
+
+    fixture['inventories'][username] = listings
+    return fixture
+
+# sellers is a list of (username, listings count). overlap is the fraction of release ids that each
+# seller shares with the previous one
+def generate_fixture(sellers, seed=0, overlap=0.0):
+    fixture = empty_fixture()
+    first_release_id = 1000000
+    for username, listings_count in sellers:
+        add_synthetic_inventory(fixture, username, listings_count, seed=seed, first_release_id=first_release_id)
+        first_release_id += max(1, int(listings_count * (1 - overlap)))
+    return fixture
+
+def save_fixture(fixture, path):
+    with open(path, 'w') as fixture_file:
+        json.dump(fixture, fixture_file)
+
+def load_fixture(path):
+    with open(path) as fixture_file:
+        return json.load(fixture_file)
+
+# Parses "username:count" command line values into the sellers list of generate_fixture
+def parse_sellers(values):
+    sellers = []
+    for value in values:
+        username, _, listings_count = value.partition(':')
+        if not username or not listings_count.isdigit():
+            raise ValueError(f"Invalid seller '{value}', expected username:listings")
+        sellers.append((username, int(listings_count)))
+    return sellers
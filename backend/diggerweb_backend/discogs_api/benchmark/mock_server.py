@@ -0,0 +1,183 @@
+# Copyright 2025 Giorgio Gamba
+
+import json
+import math
+import random
+import re
+import threading
+import time
+from collections import Counter, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from ..constants import RATELIMIT_HEADER, RATELIMIT_REMAINING_HEADER, HTTP_TOO_MANY_REQUESTS
+
+INVENTORY_PATH = re.compile(r'^/users/([^/]+)/inventory/?$')
+STATS_PATH = re.compile(r'^/marketplace/stats/(\d+)/?$')
+IDENTITY_PATH = '/oauth/identity'
+OAUTH_TOKEN = re.compile(r'oauth_token="([^"]*)"')
+
+# Endpoints counted by the server
+ENDPOINT_INVENTORY = 'inventory'
+ENDPOINT_STATS = 'stats'
+ENDPOINT_IDENTITY = 'identity'
+ENDPOINT_OTHER = 'other'
+
+# Stand-in of the Discogs API replaying the responses of a fixture (see fixtures.py), with the latency,
+# the moving window rate limit (per access token) and the random 429s of the real one. Signatures are not checked
+class MockDiscogsServer:
+
+    def __init__(self, fixture, host='127.0.0.1', port=0, latency=0.05, jitter=0.0, rate_limit=60, throttle_probability=0.0, seed=0):
+        self.fixture = fixture
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit = rate_limit
+        self.throttle_probability = throttle_probability
+
+        self.lock = threading.Lock()
+        self.rng = random.Random(seed)
+        self.calls = Counter()
+        self.throttled = Counter()
+        # Access token -> times of its requests accepted in the last minute
+        self.windows = {}
+
+        # Inventories sorted by listing date, newest first, for sort=listed&sort_order=desc
+        self.listed_desc = {username: sorted(listings, key=lambda listing: listing['id'], reverse=True)
+                            for username, listings in fixture['inventories'].items()}
+
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name='mock-discogs', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def serve_forever(self):
+        self.httpd.serve_forever()
+
+    def reset_counters(self):
+        with self.lock:
+            self.calls.clear()
+            self.throttled.clear()
+
+    def counters(self):
+        with self.lock:
+            return dict(self.calls), dict(self.throttled)
+
+    # Registers a request signed with the token. Returns the remaining budget of the token, or None when the
+    # request must get a 429
+    def _admit(self, endpoint, token=''):
+        with self.lock:
+            now = time.monotonic()
+            window = self.windows.setdefault(token, deque())
+            while window and now - window[0] >= 60.0:
+                window.popleft()
+
+            self.calls[endpoint] += 1
+            if len(window) >= self.rate_limit or self.rng.random() < self.throttle_probability:
+                self.throttled[endpoint] += 1
+                return None
+
+            window.append(now)
+            return self.rate_limit - len(window)
+
+    def _delay(self):
+        with self.lock:
+            delay = self.latency + (self.rng.uniform(-self.jitter, self.jitter) if self.jitter else 0.0)
+        if delay > 0:
+            time.sleep(delay)
+
+    def inventory_page(self, username, query):
+        listings = self.fixture['inventories'].get(username)
+        if listings is None:
+            return 404, {'message': "User does not exist or may have been deleted."}
+
+        if query.get('sort') == 'listed' and query.get('sort_order') == 'desc':
+            listings = self.listed_desc[username]
+
+        try:
+            page_num = max(1, int(query.get('page', 1)))
+            items_per_page = min(100, max(1, int(query.get('per_page', 50))))
+        except ValueError:
+            return 400, {'message': "Invalid pagination parameters."}
+
+        pages = math.ceil(len(listings) / items_per_page)
+        if page_num > max(pages, 1):
+            return 404, {'message': "Page out of range."}
+
+        offset = (page_num - 1) * items_per_page
+        return 200, {
+            'pagination': {'page': page_num, 'pages': pages, 'per_page': items_per_page, 'items': len(listings), 'urls': {}},
+            'listings': listings[offset:offset + items_per_page],
+        }
+
+    def marketplace_stats(self, release_id):
+        stats = self.fixture['stats'].get(release_id)
+        if stats is None:
+            return 200, {'num_for_sale': 0, 'lowest_price': None, 'blocked_from_sale': False}
+        return 200, stats
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def log_message(self, *args):
+                pass
+
+            def send_json(self, status_code, body, remaining=None):
+                payload = json.dumps(body).encode('utf8')
+                self.send_response(status_code)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.send_header(RATELIMIT_HEADER, str(server.rate_limit))
+                self.send_header(RATELIMIT_REMAINING_HEADER, str(remaining if remaining is not None else 0))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                query = {name: values[0] for name, values in parse_qs(url.query).items()}
+
+                inventory_match = INVENTORY_PATH.match(url.path)
+                stats_match = STATS_PATH.match(url.path)
+                if inventory_match:
+                    endpoint = ENDPOINT_INVENTORY
+                elif stats_match:
+                    endpoint = ENDPOINT_STATS
+                elif url.path == IDENTITY_PATH:
+                    endpoint = ENDPOINT_IDENTITY
+                else:
+                    endpoint = ENDPOINT_OTHER
+
+                token = OAUTH_TOKEN.search(self.headers.get('Authorization', ''))
+                remaining = server._admit(endpoint, token.group(1) if token else '')
+                if remaining is None:
+                    self.send_json(HTTP_TOO_MANY_REQUESTS, {'message': "You are making requests too quickly."})
+                    return
+
+                server._delay()
+
+                if inventory_match:
+                    status_code, body = server.inventory_page(inventory_match.group(1), query)
+                elif stats_match:
+                    status_code, body = server.marketplace_stats(stats_match.group(1))
+                elif endpoint == ENDPOINT_IDENTITY:
+                    status_code, body = 200, server.fixture['identity']
+                else:
+                    status_code, body = 404, {'message': "The requested resource was not found."}
+
+                self.send_json(status_code, body, remaining)
+
+        return Handler
@@ -0,0 +1,161 @@
+# Copyright 2025 Giorgio Gamba
+
+import math
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from rest_framework.test import APIRequestFactory
+
+from ..client import CLIENT_POOL
+from ..crawler import get_seller, run_snapshot
+from ..models import InventorySnapshot, Listing, MarketplaceStats
+from ..stats import STATS_CACHE
+from ..utils import load_access_token
+from ..views import DiscogsSearchView, SEARCH_MODE_SNAPSHOT
+
+SEARCH_PATH = '/api/discogs/search/'
+
+# Nearest rank percentile of an already sorted list
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+class BenchmarkResult:
+
+    def __init__(self, name, latencies, statuses, duration, calls, throttled, notes=''):
+        self.name = name
+        self.latencies = sorted(latencies)
+        self.statuses = statuses
+        self.duration = duration
+        self.calls = calls
+        self.throttled = throttled
+        self.notes = notes
+
+    @property
+    def requests(self):
+        return len(self.latencies)
+
+    @property
+    def errors(self):
+        return sum(1 for status_code in self.statuses if status_code >= 400)
+
+    def as_dict(self):
+        requests = self.requests or 1
+        return {
+            'scenario': self.name,
+            'requests': self.requests,
+            'errors': self.errors,
+            'p50_ms': round(percentile(self.latencies, 0.50) * 1000, 1) if self.latencies else None,
+            'p95_ms': round(percentile(self.latencies, 0.95) * 1000, 1) if self.latencies else None,
+            'rps': round(self.requests / self.duration, 2) if self.duration else None,
+            'upstream_per_request': round(sum(self.calls.values()) / requests, 2),
+            'upstream_calls': self.calls,
+            'throttled': self.throttled,
+            'notes': self.notes,
+        }
+
+# Drives DiscogsSearchView in process against the mock server. Every scenario starts from the state it
+# declares (cold or warm caches), so the numbers of a run can be compared with the ones of older runs
+class BenchmarkRunner:
+
+    def __init__(self, server, username, per_page=50, pages=10, concurrency=8):
+        self.server = server
+        self.username = username
+        self.per_page = per_page
+        self.pages = pages
+        self.concurrency = concurrency
+        self.factory = APIRequestFactory()
+        self.view = DiscogsSearchView.as_view()
+
+    def reset_caches(self):
+        STATS_CACHE.clear()
+        MarketplaceStats.objects.all().delete()
+
+        access_token, _ = load_access_token()
+        CLIENT_POOL.invalidate(access_token)
+
+        # Search results shared among the workers would answer the next scenario
+        shutil.rmtree(settings.DISCOGS_SINGLEFLIGHT_DIR, ignore_errors=True)
+
+    def search(self, page_num, **params):
+        request = self.factory.get(SEARCH_PATH, {'q': self.username, 'page': page_num, 'per_page': self.per_page, **params})
+        start = time.perf_counter()
+        response = self.view(request)
+        return time.perf_counter() - start, response.status_code
+
+    def measure(self, name, page_nums, concurrency=1, notes='', **params):
+        self.server.reset_counters()
+        latencies = []
+        statuses = []
+        lock = threading.Lock()
+
+        def run(page_num):
+            latency, status_code = self.search(page_num, **params)
+            with lock:
+                latencies.append(latency)
+                statuses.append(status_code)
+
+        start = time.perf_counter()
+        if concurrency == 1:
+            for page_num in page_nums:
+                run(page_num)
+        else:
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                list(executor.map(run, page_nums))
+        duration = time.perf_counter() - start
+
+        calls, throttled = self.server.counters()
+        return BenchmarkResult(name, latencies, statuses, duration, calls, throttled, notes)
+
+    def page_nums(self):
+        inventory_size = len(self.server.fixture['inventories'][self.username])
+        last_page = max(1, math.ceil(inventory_size / self.per_page))
+        return [page_num % last_page + 1 for page_num in range(self.pages)]
+
+    # Live pages one after the other, with nothing cached
+    def cold_sequential(self):
+        self.reset_caches()
+        return self.measure('cold_sequential', self.page_nums())
+
+    # The same pages again: stats come from the cache, the inventory pages from Discogs
+    def warm_sequential(self):
+        self.reset_caches()
+        self.measure('warmup', self.page_nums())
+        shutil.rmtree(settings.DISCOGS_SINGLEFLIGHT_DIR, ignore_errors=True)
+        return self.measure('warm_sequential', self.page_nums())
+
+    # Different pages requested at the same time, sharing the rate budget and the stats pool
+    def cold_concurrent(self):
+        self.reset_caches()
+        return self.measure('cold_concurrent', self.page_nums(), concurrency=self.concurrency)
+
+    # Everybody asks for the same page at the same time: single-flight should make it one search upstream
+    def hot_page(self):
+        self.reset_caches()
+        return self.measure('hot_page', [1] * max(self.pages, self.concurrency), concurrency=self.concurrency)
+
+    # Pages served from the local snapshot, after a full crawl of the inventory
+    def snapshot_pages(self):
+        self.reset_caches()
+        seller = get_seller(self.username)
+        Listing.objects.filter(seller=seller).delete()
+        InventorySnapshot.objects.filter(seller=seller).delete()
+
+        client = CLIENT_POOL.get_client(*load_access_token())
+        snapshot = InventorySnapshot.objects.create(seller=seller, kind=InventorySnapshot.KIND_FULL)
+        start = time.perf_counter()
+        run_snapshot(client, snapshot)
+        crawl_duration = time.perf_counter() - start
+
+        notes = f"crawl of {snapshot.items_done} listings took {crawl_duration:.1f}s"
+        return self.measure('snapshot_pages', self.page_nums(), concurrency=self.concurrency, notes=notes, mode=SEARCH_MODE_SNAPSHOT)
+
+SCENARIOS = ['cold_sequential', 'warm_sequential', 'cold_concurrent', 'hot_page', 'snapshot_pages']
+
+def run_scenarios(runner, names=SCENARIOS):
+    return [getattr(runner, name)() for name in names]
@@ -0,0 +1,176 @@
+# Copyright 2025 Giorgio Gamba
+
+import logging
+import threading
+import time
+
+import discogs_client
+import requests
+from requests.adapters import HTTPAdapter
+from discogs_client.fetchers import OAuth2Fetcher
+from django.conf import settings
+
+from .constants import APPLICATION_AGENT_NAME, BASE_API_URL, DISCOGS_CONSUMER_KEY, DISCOGS_CONSUMER_SECRET, DISCOGS_IDENTITY_URL, HTTP_TOO_MANY_REQUESTS
+from .metrics import record_upstream_call
+from .credentials import CREDENTIAL_POOL, is_shared_url
+from .ratelimit import get_rate_limiter, parse_retry_after
+from .utils import load_credentials_pool, revoke_access_token
+
+logger = logging.getLogger(__name__)
+
+HTTP_UNAUTHORIZED = 401
+
+# OAuth fetcher that waits for the rate limiter before every call and retries after a 429. Calls to shared
+# resources are signed with the account of the pool with the most budget left (see credentials.py)
+class RateLimitedFetcher(OAuth2Fetcher):
+
+    def __init__(self, consumer_key, consumer_secret, token=None, secret=None):
+        self.consumer_key = consumer_key
+        self.limiter = None
+        super().__init__(consumer_key, consumer_secret, token, secret)
+
+        # Keep-alive connections, sized for the parallel stats lookups sharing the client
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=settings.DISCOGS_STATS_MAX_WORKERS)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def store_token(self, token, secret):
+        super().store_token(token, secret)
+        # Calls made before the access token is known (OAuth flow) share the consumer key budget
+        self.limiter = get_rate_limiter(token or self.consumer_key)
+
+    # Returns the signer and the rate limiter of the call, once the limiter allowed it
+    def schedule(self, url):
+        if self.client.resource_owner_key and is_shared_url(url):
+            account = CREDENTIAL_POOL.acquire()
+            if account is not None:
+                return account
+
+        self.limiter.acquire()
+        return self.client, self.limiter
+
+    def fetch(self, client, method, url, data=None, headers=None, json_format=True):
+        attempts = settings.DISCOGS_RATE_LIMIT_MAX_RETRIES + 1
+
+        for attempt in range(attempts):
+            # After a 429 the account is in cooldown, so the retry goes to another one when there is one
+            signer, limiter = self.schedule(url)
+
+            # Signature must be recomputed on every attempt to get a fresh nonce and timestamp
+            uri, signed_headers, body = signer.sign(url, http_method=method, body=data, headers=headers)
+            start = time.perf_counter()
+            resp = self.session.request(method, uri, headers=signed_headers, data=body)
+            record_upstream_call(url, resp.status_code, time.perf_counter() - start)
+
+            if resp.status_code == HTTP_UNAUTHORIZED and signer.resource_owner_key:
+                self.handle_unauthorized(signer, limiter, url)
+
+                # A shared call can still be made with another account of the pool
+                if signer is not self.client and has_other_account(load_credentials_pool(), signer.resource_owner_key):
+                    continue
+
+            if resp.status_code != HTTP_TOO_MANY_REQUESTS:
+                limiter.update_from_headers(resp.headers)
+                return resp.content, resp.status_code
+
+            delay = limiter.register_throttled(parse_retry_after(resp.headers))
+            logger.warning("Discogs rate limit hit on %s (attempt %d/%d), backing off %.1fs", url, attempt + 1, attempts, delay)
+
+        return resp.content, resp.status_code
+
+    # A 401 may be a one-off rejection of the signature (timestamp, nonce): the token only leaves the pool when
+    # the identity call is rejected too, otherwise it sits out a cooldown. Either way the cached identity can't
+    # be trusted anymore
+    def handle_unauthorized(self, signer, limiter, url):
+        CLIENT_POOL.invalidate(signer.resource_owner_key)
+
+        if url.startswith(DISCOGS_IDENTITY_URL) or self.identity_rejected(signer, limiter):
+            revoke_access_token(signer.resource_owner_key)
+        else:
+            logger.warning("Discogs rejected credentials %s... on %s but not on the identity check, cooling down", signer.resource_owner_key[:4], url)
+            limiter.cool_down(settings.DISCOGS_UNAUTHORIZED_COOLDOWN)
+
+    def identity_rejected(self, signer, limiter):
+        limiter.acquire()
+        uri, signed_headers, _ = signer.sign(DISCOGS_IDENTITY_URL, http_method='GET', headers={'User-Agent': APPLICATION_AGENT_NAME})
+        start = time.perf_counter()
+        try:
+            resp = self.session.request('GET', uri, headers=signed_headers)
+        except requests.RequestException as e:
+            logger.warning("Identity check of credentials %s... failed: %s", signer.resource_owner_key[:4], e)
+            return False
+        record_upstream_call(DISCOGS_IDENTITY_URL, resp.status_code, time.perf_counter() - start)
+        return resp.status_code == HTTP_UNAUTHORIZED
+
+def has_other_account(credentials, access_token):
+    return any(token != access_token for token, _ in credentials)
+
+# Discogs client whose calls are governed by the per token rate limiter
+class DiscogsClient(discogs_client.Client):
+    _base_url = BASE_API_URL
+    _request_token_url = f"{BASE_API_URL}/oauth/request_token"
+    _access_token_url = f"{BASE_API_URL}/oauth/access_token"
+
+    def __init__(self, user_agent=APPLICATION_AGENT_NAME, *args, **kwargs):
+        super().__init__(user_agent, *args, **kwargs)
+
+    def set_consumer_key(self, consumer_key, consumer_secret):
+        self._fetcher = RateLimitedFetcher(consumer_key, consumer_secret)
+
+# Builds a client signed with the application consumer key and, when given, with the user access token
+def create_client(access_token=None, access_secret=None):
+    client = DiscogsClient()
+    client.set_consumer_key(DISCOGS_CONSUMER_KEY, DISCOGS_CONSUMER_SECRET)
+    if access_token and access_secret:
+        client.set_token(access_token, access_secret)
+    return client
+
+# Process wide pool of authenticated clients, one per access token, with the identity of the token cached for
+# DISCOGS_IDENTITY_TTL seconds. The identity is checked again after the TTL or after a 401 from any call
+class ClientPool:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clients = {}
+        # access token -> (identity response, validated_at)
+        self.identities = {}
+
+    def get_client(self, access_token, access_secret):
+        with self.lock:
+            client = self.clients.get(access_token)
+            if client is None or client._fetcher.client.resource_owner_secret != access_secret:
+                client = create_client(access_token, access_secret)
+                self.clients[access_token] = client
+            return client
+
+    def get_identity_data(self, access_token):
+        with self.lock:
+            entry = self.identities.get(access_token)
+        if entry is not None and time.monotonic() - entry[1] < settings.DISCOGS_IDENTITY_TTL:
+            return entry[0]
+        return None
+
+    def store_identity_data(self, access_token, identity_data):
+        with self.lock:
+            self.identities[access_token] = (identity_data, time.monotonic())
+
+    def invalidate(self, access_token):
+        with self.lock:
+            self.identities.pop(access_token, None)
+
+CLIENT_POOL = ClientPool()
+
+def get_authenticated_client(access_token, access_secret):
+    return CLIENT_POOL.get_client(access_token, access_secret)
+
+# Same as client.identity(), without the upstream call while the cached identity is still valid
+def get_identity(client):
+    access_token = client._fetcher.client.resource_owner_key
+
+    identity_data = CLIENT_POOL.get_identity_data(access_token)
+    if identity_data is None:
+        identity_data = client._get(DISCOGS_IDENTITY_URL)
+        CLIENT_POOL.store_identity_data(access_token, identity_data)
+
+    return discogs_client.models.User(client, identity_data)
@@ -0,0 +1,21 @@
+# Copyright 2025 Giorgio Gamba
+
+import os
+
+APPLICATION_AGENT_NAME = 'diggerweb/1.0'
+
+# Executes module authorization once that the module is started or re-saved in development
+DISCOGS_CONSUMER_KEY = os.getenv('DISCOGS_CONSUMER_KEY')
+DISCOGS_CONSUMER_SECRET = os.getenv('DISCOGS_CONSUMER_SECRET')
+
+# Can point to a local stand-in of the API, like the benchmark mock server
+BASE_API_URL = os.getenv('DISCOGS_API_BASE_URL', 'https://api.discogs.com').rstrip('/')
+DISCOGS_MARKETPLACE_STATS_URL = f"{BASE_API_URL}/marketplace/stats/"
+DISCOGS_IDENTITY_URL = f"{BASE_API_URL}/oauth/identity"
+
+# Rate limit headers sent back by Discogs on every response
+RATELIMIT_HEADER = 'X-Discogs-Ratelimit'
+RATELIMIT_REMAINING_HEADER = 'X-Discogs-Ratelimit-Remaining'
+RETRY_AFTER_HEADER = 'Retry-After'
+
+HTTP_TOO_MANY_REQUESTS = 429
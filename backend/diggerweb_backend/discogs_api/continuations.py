@@ -0,0 +1,82 @@
+# Copyright 2025 Giorgio Gamba
+
+import logging
+import time
+import uuid
+from concurrent.futures import wait
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .listings import get_release_id, build_item, num_for_sale_sort_key
+from .models import SearchContinuation
+from .stats import submit_marketplace_stats
+
+logger = logging.getLogger(__name__)
+
+# Waits for the stats futures until the deadline (time.monotonic() value, None to wait for all of them).
+# Returns the dict release_id -> (stats, error message) of the lookups done. The others keep running in the
+# stats pool and save their results, they just aren't waited for
+def collect_stats(futures, deadline=None):
+    timeout = max(0.0, deadline - time.monotonic()) if deadline is not None else None
+    wait(futures.values(), timeout=timeout)
+    return {release_id: future.result() for release_id, future in futures.items() if future.done()}
+
+# Items of the page, in the order of DiscogsSearchView. Listings whose stats are still being looked up are
+# returned without them and flagged stats_pending
+def build_page_items(listings_data, stats_by_release):
+    items = []
+    for listing_dict in listings_data:
+        release_id = get_release_id(listing_dict)
+        if not release_id:
+            continue
+
+        if release_id in stats_by_release:
+            stats_response, stats_error_msg = stats_by_release[release_id]
+            items.append(build_item(listing_dict, stats_response, stats_error_msg))
+        else:
+            item = build_item(listing_dict, None)
+            item['stats_pending'] = True
+            items.append(item)
+
+    items.sort(key=num_for_sale_sort_key)
+    return items
+
+# Enriches the listings with the stats known before the deadline. Returns the items and whether all the
+# stats were known
+def _enrich(client, listings_data, deadline):
+    release_ids = [get_release_id(listing_dict) for listing_dict in listings_data]
+    futures = submit_marketplace_stats(client, [release_id for release_id in release_ids if release_id])
+    stats_by_release = collect_stats(futures, deadline)
+    return build_page_items(listings_data, stats_by_release), len(stats_by_release) == len(futures)
+
+# Enriches the listings of a page with the stats known before the deadline. Returns the items, and the
+# token of the continuation saved when some stats were still pending (None otherwise)
+def enrich_page(client, username, page_num, items_per_page, listings_data, pagination_info, deadline=None):
+    items, complete = _enrich(client, listings_data, deadline)
+    if complete:
+        return items, None
+
+    logger.debug("Deadline reached for page %d of %s", page_num, username)
+    return items, save_continuation(username, page_num, items_per_page, listings_data, pagination_info)
+
+def save_continuation(username, page_num, items_per_page, listings_data, pagination_info):
+    # Expired continuations are dropped here, there is no other cleanup
+    SearchContinuation.objects.filter(created_at__lt=timezone.now() - timedelta(seconds=settings.DISCOGS_CONTINUATION_TTL)).delete()
+
+    continuation = SearchContinuation.objects.create(token=uuid.uuid4().hex, username=username, page_num=page_num, items_per_page=items_per_page,
+                                                     listings=listings_data, pagination=pagination_info)
+    return continuation.token
+
+# Returns the continuation of the token, None if unknown or expired
+def load_continuation(token):
+    expiry = timezone.now() - timedelta(seconds=settings.DISCOGS_CONTINUATION_TTL)
+    return SearchContinuation.objects.filter(token=token, created_at__gte=expiry).first()
+
+# Completes the page of a continuation. The stats looked up in background meanwhile are found in the cache,
+# the ones still missing are waited for until the deadline. Returns the items and the token again while
+# stats are still pending. Completed continuations are kept until they expire, so retries still work
+def resume_continuation(client, continuation, deadline=None):
+    items, complete = _enrich(client, continuation.listings, deadline)
+    return items, None if complete else continuation.token
@@ -0,0 +1,453 @@
+# Copyright 2025 Giorgio Gamba
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from .history import record_listing_prices
+from .listings import MAX_ITEMS_PER_PAGE, INVENTORY_STATUS_FOR_SALE, LISTING_STATUS_REMOVED, fetch_inventory_page, get_release_id, build_item, condition_rank, price_ratio
+from .models import Seller, InventorySnapshot, Listing
+from .offers import record_offers, remove_offers
+from .ratelimit import PRIORITY_CRAWL, upstream_priority
+from .response_cache import bump_seller_version
+from .singleflight import file_lock
+from .stats import fetch_marketplace_stats_bulk
+
+logger = logging.getLogger(__name__)
+
+# Crawls are long and rate limited anyway, a couple of them in parallel is enough
+CRAWL_EXECUTOR = ThreadPoolExecutor(max_workers=settings.DISCOGS_CRAWL_WORKERS, thread_name_prefix='discogs-crawl')
+
+LISTING_FIELDS = ['seller', 'snapshot', 'release_id', 'title', 'artist', 'url', 'price', 'currency',
+                  'condition', 'sleeve_condition', 'condition_rank', 'sleeve_condition_rank', 'status',
+                  'num_for_sale', 'lowest_price', 'lowest_price_currency', 'price_ratio', 'stats_error', 'updated_at', 'removed_at']
+
+# Inventory order used by the incremental sync: newest listings first
+SYNC_SORT_PARAMS = {'sort': 'listed', 'sort_order': 'desc'}
+
+def get_seller(username):
+    seller = Seller.objects.filter(username__iexact=username).first()
+    if seller is None:
+        seller, _ = Seller.objects.get_or_create(username=username)
+    return seller
+
+def get_latest_snapshot(seller):
+    return seller.snapshots.filter(status=InventorySnapshot.STATUS_COMPLETE).order_by('-finished_at').first()
+
+# Returns the crawl currently running for the seller, failing the ones that stopped making progress
+def get_running_snapshot(seller):
+    stall_limit = timezone.now() - timedelta(seconds=settings.DISCOGS_CRAWL_STALL_TIMEOUT)
+    seller.snapshots.filter(status=InventorySnapshot.STATUS_RUNNING, updated_at__lt=stall_limit).update(
+        status=InventorySnapshot.STATUS_FAILED, error="Crawl interrupted", finished_at=timezone.now())
+
+    return seller.snapshots.filter(status=InventorySnapshot.STATUS_RUNNING).order_by('-started_at').first()
+
+def _decimal_or_none(value):
+    try:
+        return Decimal(str(value)) if value is not None else None
+    except InvalidOperation:
+        return None
+
+def _truncate(value, max_length):
+    return (value or '')[:max_length]
+
+def _apply_item(listing, item, seller, snapshot, now):
+    listing.seller = seller
+    listing.snapshot = snapshot
+    listing.release_id = item['release_id']
+    listing.title = _truncate(item.get('title'), 512)
+    listing.artist = _truncate(item.get('artist'), 512)
+    listing.url = _truncate(item.get('url'), 512)
+    listing.price = _decimal_or_none(item.get('price'))
+    listing.currency = _truncate(item.get('currency'), 3)
+    listing.condition = _truncate(item.get('condition'), 64)
+    listing.sleeve_condition = _truncate(item.get('sleeve_condition'), 64)
+    listing.condition_rank = condition_rank(item.get('condition'))
+    listing.sleeve_condition_rank = condition_rank(item.get('sleeve_condition'))
+    listing.status = _truncate(item.get('status'), 32)
+    listing.num_for_sale = item.get('num_for_sale')
+    listing.lowest_price = _decimal_or_none(item.get('lowest_price'))
+    listing.lowest_price_currency = _truncate(item.get('lowest_price_currency'), 3)
+    listing.price_ratio = price_ratio(listing.price, listing.currency, listing.lowest_price, listing.lowest_price_currency)
+    listing.stats_error = _truncate(item.get('stats_error'), 255)
+    listing.updated_at = now
+    listing.removed_at = None
+
+# Inserts or updates the given items as listings of the seller. Returns the number of saved listings
+def save_items(seller, snapshot, items):
+    items = [item for item in items if item.get('id') and item.get('release_id')]
+    record_listing_prices(seller, items)
+    record_offers(seller, items)
+    existing = {listing.listing_id: listing for listing in Listing.objects.filter(listing_id__in=[item['id'] for item in items])}
+
+    now = timezone.now()
+    to_create = []
+    to_update = []
+
+    for item in items:
+        listing = existing.get(item['id'])
+        if listing is None:
+            listing = Listing(listing_id=item['id'])
+            to_create.append(listing)
+        else:
+            to_update.append(listing)
+        _apply_item(listing, item, seller, snapshot, now)
+
+    if to_create:
+        Listing.objects.bulk_create(to_create, ignore_conflicts=True)
+    if to_update:
+        Listing.objects.bulk_update(to_update, LISTING_FIELDS)
+
+    return len(items)
+
+# Downloads a page of inventory and returns its items enriched with the marketplace stats
+def fetch_enriched_page(client, username, page_num, **extra_params):
+    listings_data, pagination_info = fetch_inventory_page(client, username, page_num, MAX_ITEMS_PER_PAGE, **extra_params)
+
+    release_ids = [get_release_id(listing_dict) for listing_dict in listings_data]
+    stats_by_release = fetch_marketplace_stats_bulk(client, [release_id for release_id in release_ids if release_id])
+
+    items = []
+    for listing_dict in listings_data:
+        release_id = get_release_id(listing_dict)
+        if release_id:
+            stats_response, stats_error_msg = stats_by_release[release_id]
+            items.append(build_item(listing_dict, stats_response, stats_error_msg))
+
+    return items, pagination_info
+
+# Pulls every inventory page of the seller into the snapshot, then marks as removed the listings it no longer contains
+def crawl_inventory(client, snapshot):
+    seller = snapshot.seller
+    logger.info("Starting inventory crawl of %s (snapshot %d)", seller.username, snapshot.pk)
+
+    page_num = 1
+    while True:
+        items, pagination_info = fetch_enriched_page(client, seller.username, page_num)
+
+        snapshot.items_done += save_items(seller, snapshot, items)
+        snapshot.pages_done = page_num
+        snapshot.pages_total = pagination_info['pages']
+        snapshot.items_total = pagination_info['items']
+        snapshot.save(update_fields=['items_done', 'pages_done', 'pages_total', 'items_total', 'updated_at'])
+
+        if page_num >= pagination_info['pages']:
+            break
+        page_num += 1
+
+    mark_removed(for_sale_listings(seller).exclude(snapshot=snapshot))
+    _complete(snapshot)
+
+    logger.info("Inventory crawl of %s completed: %d listings in %d pages", seller.username, snapshot.items_done, snapshot.pages_done)
+    return snapshot
+
+def mark_removed(listings):
+    remove_offers(listings.values('listing_id'))
+    return listings.update(status=LISTING_STATUS_REMOVED, removed_at=timezone.now(), updated_at=timezone.now())
+
+def _complete(snapshot):
+    snapshot.status = InventorySnapshot.STATUS_COMPLETE
+    snapshot.finished_at = timezone.now()
+    snapshot.save(update_fields=['status', 'finished_at', 'updated_at'])
+    # Cached search pages of the seller were built on the previous snapshot
+    bump_seller_version(snapshot.seller.username)
+
+# Raw inventory pages in "newest first" order, downloaded at most once each
+class InventoryPages:
+
+    def __init__(self, client, username):
+        self.client = client
+        self.username = username
+        self.pages = {}
+        self.pages_total = 0
+        self.items_total = 0
+
+    def get(self, page_num):
+        if page_num not in self.pages:
+            listings_data, pagination_info = fetch_inventory_page(self.client, self.username, page_num, MAX_ITEMS_PER_PAGE, **SYNC_SORT_PARAMS)
+            self.pages[page_num] = listings_data
+            self.pages_total = pagination_info['pages']
+            self.items_total = pagination_info['items']
+        return self.pages[page_num]
+
+    def first_position(self, page_num):
+        return (page_num - 1) * MAX_ITEMS_PER_PAGE
+
+    def fetched_listings(self):
+        for page_num in sorted(self.pages):
+            yield from self.pages[page_num]
+
+class _InconsistentOrder(Exception):
+    pass
+
+# Finds the known listings that vanished from the inventory while downloading as few pages as possible.
+# Known listings keep their relative order upstream, so for every known listing found on a page the
+# distance between its upstream position and its index in the local list counts the listings vanished
+# before it. Gaps where that count changes are bisected until the missing listings are pinned down.
+def _locate_vanished(pages, known, index, new_count, first_page):
+    expected = len(known) + new_count - pages.items_total
+    if expected == 0:
+        return set()
+    if expected < 0:
+        # More listings upstream than the ones we know about: new listings are not all on top
+        raise _InconsistentOrder()
+
+    vanished = set()
+
+    def mark_between(index_from, index_to):
+        for i in range(index_from + 1, index_to):
+            vanished.add(known[i])
+
+    # (upstream position, local index) of the known listings of a page, checked for consistency
+    def anchors(page_num):
+        result = []
+        position = pages.first_position(page_num)
+        for listing_dict in pages.get(page_num):
+            listing_index = index.get(listing_dict.get('id'))
+            if listing_index is None:
+                if page_num != first_page or result:
+                    raise _InconsistentOrder()
+            else:
+                if result:
+                    last_position, last_index = result[-1]
+                    if listing_index <= last_index:
+                        raise _InconsistentOrder()
+                    mark_between(last_index, listing_index)
+                result.append((position, listing_index))
+            position += 1
+
+        if not result:
+            raise _InconsistentOrder()
+        return result
+
+    page_anchors = {first_page: anchors(first_page)}
+    mark_between(-1, page_anchors[first_page][0][1])
+
+    last_page = max(pages.pages_total, first_page)
+    if last_page not in page_anchors:
+        page_anchors[last_page] = anchors(last_page)
+    mark_between(page_anchors[last_page][-1][1], len(known))
+
+    gaps = [(first_page, last_page)] if last_page > first_page else []
+    while gaps and len(vanished) < expected:
+        page_a, page_b = gaps.pop()
+        position_a, index_a = page_anchors[page_a][-1]
+        position_b, index_b = page_anchors[page_b][0]
+
+        if index_b - index_a == position_b - position_a:
+            continue
+        if index_b - index_a < position_b - position_a:
+            raise _InconsistentOrder()
+
+        if page_b == page_a + 1:
+            mark_between(index_a, index_b)
+            continue
+
+        page_m = (page_a + page_b) // 2
+        page_anchors[page_m] = anchors(page_m)
+        gaps.append((page_a, page_m))
+        gaps.append((page_m, page_b))
+
+    if len(vanished) != expected:
+        raise _InconsistentOrder()
+
+    return vanished
+
+# Stats dict of a stored listing, shaped like the API one, so that saving it again keeps its stats
+def _stored_stats(listing):
+    lowest_price = None
+    if listing.lowest_price is not None:
+        lowest_price = {'value': listing.lowest_price, 'currency': listing.lowest_price_currency}
+    return {'num_for_sale': listing.num_for_sale, 'lowest_price': lowest_price}
+
+# Refreshes a snapshot by downloading only the newest listings, down to the first already known one.
+# Marketplace stats are fetched for new listings only, vanished listings are marked as removed.
+# Price changes of listings deeper in the inventory are picked up by the periodic full crawl
+def sync_inventory(client, snapshot):
+    seller = snapshot.seller
+
+    known = list(for_sale_listings(seller).order_by('-listing_id').values_list('listing_id', flat=True))
+    if not known:
+        return crawl_inventory(client, snapshot)
+
+    logger.info("Starting incremental sync of %s (snapshot %d, %d known listings)", seller.username, snapshot.pk, len(known))
+
+    index = {listing_id: i for i, listing_id in enumerate(known)}
+    pages = InventoryPages(client, seller.username)
+
+    page_num = 1
+    while True:
+        listings_data = pages.get(page_num)
+        if any(listing_dict.get('id') in index for listing_dict in listings_data) or page_num >= pages.pages_total:
+            break
+        page_num += 1
+
+    new_count = sum(1 for listing_dict in pages.fetched_listings() if listing_dict.get('id') not in index)
+
+    try:
+        vanished = _locate_vanished(pages, known, index, new_count, page_num)
+    except _InconsistentOrder:
+        # Upstream order doesn't match the local one, compare against the whole inventory instead
+        logger.info("Inventory order of %s changed, scanning all the pages", seller.username)
+        for missing_page in range(1, pages.pages_total + 1):
+            pages.get(missing_page)
+        upstream_ids = set(listing_dict.get('id') for listing_dict in pages.fetched_listings())
+        vanished = set(known) - upstream_ids
+
+    new_listings = []
+    known_listings = []
+    for listing_dict in pages.fetched_listings():
+        if not get_release_id(listing_dict):
+            continue
+        if listing_dict.get('id') in index:
+            known_listings.append(listing_dict)
+        else:
+            new_listings.append(listing_dict)
+
+    # Only new listings need marketplace stats, known ones keep the stored values
+    stats_by_release = fetch_marketplace_stats_bulk(client, [get_release_id(listing_dict) for listing_dict in new_listings])
+    items = [build_item(listing_dict, *stats_by_release[get_release_id(listing_dict)]) for listing_dict in new_listings]
+
+    stored = {listing.listing_id: listing for listing in Listing.objects.filter(listing_id__in=[l.get('id') for l in known_listings])}
+    for listing_dict in known_listings:
+        listing = stored.get(listing_dict.get('id'))
+        stats_response = _stored_stats(listing) if listing else None
+        items.append(build_item(listing_dict, stats_response, listing.stats_error if listing else None))
+
+    snapshot.items_done = save_items(seller, snapshot, items)
+    mark_removed(Listing.objects.filter(listing_id__in=vanished))
+
+    snapshot.pages_done = len(pages.pages)
+    snapshot.pages_total = pages.pages_total
+    snapshot.items_total = pages.items_total
+    snapshot.save(update_fields=['items_done', 'pages_done', 'pages_total', 'items_total', 'updated_at'])
+    _complete(snapshot)
+
+    logger.info("Incremental sync of %s completed: %d new, %d vanished, %d pages downloaded", seller.username, len(new_listings), len(vanished), snapshot.pages_done)
+    return snapshot
+
+# Runs the crawl or the sync matching the snapshot kind. Its calls go after interactive searches and stats refreshes
+def run_snapshot(client, snapshot):
+    with upstream_priority(PRIORITY_CRAWL):
+        if snapshot.kind == InventorySnapshot.KIND_INCREMENTAL:
+            return sync_inventory(client, snapshot)
+        return crawl_inventory(client, snapshot)
+
+# Runs the snapshot in the calling thread, marking it failed if the crawl raises (the error is raised again)
+def execute_snapshot(client, snapshot):
+    try:
+        return run_snapshot(client, snapshot)
+    except Exception as e:
+        logger.exception("Inventory crawl of %s failed: %s", snapshot.seller.username, e)
+        snapshot.status = InventorySnapshot.STATUS_FAILED
+        snapshot.error = str(e)
+        snapshot.finished_at = timezone.now()
+        snapshot.save(update_fields=['status', 'error', 'finished_at', 'updated_at'])
+        raise
+
+def _crawl_task(client, snapshot_id):
+    close_old_connections()
+    snapshot = InventorySnapshot.objects.select_related('seller').get(pk=snapshot_id)
+    try:
+        execute_snapshot(client, snapshot)
+    except Exception:
+        pass
+    finally:
+        close_old_connections()
+
+# Creates the snapshot of a new crawl of the seller unless one is already running.
+# Returns the snapshot and whether it was created: only then the caller has to run it
+def claim_crawl(seller, kind=InventorySnapshot.KIND_FULL):
+    # The lock makes check and creation atomic among the workers, so that a seller is never crawled twice
+    with file_lock(('crawl', seller.pk)):
+        running = get_running_snapshot(seller)
+        if running is not None:
+            return running, False
+
+        return InventorySnapshot.objects.create(seller=seller, kind=kind), True
+
+# Starts a background crawl of the seller unless one is already running. Returns the running snapshot
+def start_crawl(client, seller, kind=InventorySnapshot.KIND_FULL):
+    snapshot, created = claim_crawl(seller, kind)
+    if created:
+        CRAWL_EXECUTOR.submit(_crawl_task, client, snapshot.pk)
+    return snapshot
+
+def _age_seconds(moment):
+    return int((timezone.now() - moment).total_seconds()) if moment else None
+
+# Snapshot age and crawl progress, as reported in the search responses
+def describe_snapshot(snapshot, running):
+    info = {
+        'status': snapshot.status if snapshot else 'missing',
+        'id': snapshot.pk if snapshot else None,
+        'finished_at': snapshot.finished_at if snapshot else None,
+        'age_seconds': _age_seconds(snapshot.finished_at) if snapshot else None,
+        'items': snapshot.items_total if snapshot else 0,
+        'crawl': None,
+    }
+
+    if running is not None:
+        info['crawl'] = {
+            'id': running.pk,
+            'kind': running.kind,
+            'started_at': running.started_at,
+            'pages_done': running.pages_done,
+            'pages_total': running.pages_total,
+            'items_done': running.items_done,
+            'items_total': running.items_total,
+        }
+
+    return info
+
+# Kind of the next refresh: an incremental sync, unless the last full crawl is too old (or missing)
+def next_snapshot_kind(seller):
+    last_full = seller.snapshots.filter(status=InventorySnapshot.STATUS_COMPLETE, kind=InventorySnapshot.KIND_FULL).order_by('-finished_at').first()
+    if last_full is None or _age_seconds(last_full.finished_at) > settings.DISCOGS_SNAPSHOT_FULL_CRAWL_AGE:
+        return InventorySnapshot.KIND_FULL
+    return InventorySnapshot.KIND_INCREMENTAL
+
+# Returns the latest complete snapshot of the seller, together with the running crawl.
+# A refresh is started when there is no snapshot yet, the latest one is too old or it is explicitly requested
+def get_snapshot(client, seller, refresh=False):
+    snapshot = get_latest_snapshot(seller)
+    running = get_running_snapshot(seller)
+
+    too_old = snapshot is not None and _age_seconds(snapshot.finished_at) > settings.DISCOGS_SNAPSHOT_MAX_AGE
+    if running is None and (snapshot is None or too_old or refresh):
+        running = start_crawl(client, seller, next_snapshot_kind(seller))
+
+    return snapshot, running
+
+def for_sale_listings(seller):
+    return seller.listings.filter(status=INVENTORY_STATUS_FOR_SALE)
+
+# Applies fresh marketplace stats ({release id: stats dict}) to the listings of the seller for sale,
+# without downloading the inventory again. Returns the number of updated listings
+def update_listing_stats(seller, stats_by_release):
+    listings = list(for_sale_listings(seller).filter(release_id__in=list(stats_by_release)))
+
+    now = timezone.now()
+    for listing in listings:
+        stats = stats_by_release[listing.release_id]
+        lowest_price = stats.get('lowest_price') or {}
+        listing.num_for_sale = stats.get('num_for_sale')
+        listing.lowest_price = _decimal_or_none(lowest_price.get('value'))
+        listing.lowest_price_currency = _truncate(lowest_price.get('currency'), 3)
+        listing.price_ratio = price_ratio(listing.price, listing.currency, listing.lowest_price, listing.lowest_price_currency)
+        listing.stats_error = ''
+        listing.updated_at = now
+
+    if listings:
+        Listing.objects.bulk_update(listings, ['num_for_sale', 'lowest_price', 'lowest_price_currency', 'price_ratio', 'stats_error', 'updated_at'])
+        # The snapshot served by the searches changed: its pages get a new ETag and drop out of the cache
+        snapshot = get_latest_snapshot(seller)
+        if snapshot is not None:
+            InventorySnapshot.objects.filter(pk=snapshot.pk).update(updated_at=now)
+        bump_seller_version(seller.username)
+    return len(listings)
@@ -0,0 +1,109 @@
+# Copyright 2025 Giorgio Gamba
+
+import re
+import threading
+import time
+from urllib.parse import urlparse
+
+from oauthlib import oauth1
+
+from .constants import DISCOGS_CONSUMER_KEY, DISCOGS_CONSUMER_SECRET
+from .metrics import record_throttle_wait
+from .ratelimit import MAX_POLL_INTERVAL, PRIORITY_NAMES, current_priority, get_rate_limiter
+from .utils import load_credentials_pool
+
+# Resources that read the same whatever the account signing the call: marketplace stats, public inventories
+# and database entries. Calls to them are spread over the pool of credentials, the others (identity,
+# wantlist) keep the token of the account they are made for
+SHARED_PATH = re.compile(r'/(marketplace/stats|users/[^/]+/inventory|releases|masters)(/|$)')
+
+def is_shared_url(url):
+    return SHARED_PATH.search(urlparse(url).path) is not None
+
+# Schedules the upstream calls over the authorized accounts: every call goes to the account with the most
+# budget left, skipping the ones in a 429 cooldown. Revoked accounts aren't in the pool at all. Budgets are
+# the per token rate limiters, shared by all the workers of the machine, so the throughput grows with the
+# number of accounts
+class CredentialPool:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # access token -> OAuth signer of the token
+        self.signers = {}
+
+    def signer(self, access_token, access_secret):
+        with self.lock:
+            signer = self.signers.get(access_token)
+            if signer is None or signer.resource_owner_secret != access_secret:
+                signer = oauth1.Client(DISCOGS_CONSUMER_KEY, client_secret=DISCOGS_CONSUMER_SECRET,
+                                       resource_owner_key=access_token, resource_owner_secret=access_secret)
+                self.signers[access_token] = signer
+            return signer
+
+    # Takes one token of budget from the best account. Returns (signer, limiter) and 0 on success, None and
+    # the seconds to wait otherwise. credentials defaults to the pool saved in the DB (see
+    # utils.load_credentials_pool), asyncio callers pass the one they loaded beforehand
+    def try_acquire(self, priority=None, credentials=None):
+        if credentials is None:
+            credentials = load_credentials_pool()
+
+        candidates = []
+        shortest_wait = MAX_POLL_INTERVAL
+        for access_token, access_secret in credentials:
+            limiter = get_rate_limiter(access_token)
+            remaining, capacity, cooldown = limiter.status()
+            if cooldown > 0:
+                shortest_wait = min(shortest_wait, cooldown)
+            else:
+                candidates.append((remaining, access_token, access_secret, limiter))
+
+        # Most budget left first. A class with lower priority may find the best bucket reserved, and then all the others too
+        candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+        for remaining, access_token, access_secret, limiter in candidates:
+            wait = limiter.try_acquire(priority)
+            if wait <= 0:
+                return (self.signer(access_token, access_secret), limiter), 0.0
+            shortest_wait = min(shortest_wait, wait)
+
+        return None, shortest_wait
+
+    # Blocks until one of the accounts has budget. Returns (signer, limiter), None if the pool is empty
+    def acquire(self, priority=None, credentials=None):
+        if priority is None:
+            priority = current_priority()
+        if credentials is None:
+            credentials = load_credentials_pool()
+        if not credentials:
+            return None
+
+        waited = 0.0
+        while True:
+            account, wait = self.try_acquire(priority, credentials)
+            if account is not None:
+                record_throttle_wait(waited, PRIORITY_NAMES.get(priority, priority))
+                return account
+            time.sleep(wait)
+            waited += wait
+
+CREDENTIAL_POOL = CredentialPool()
+
+# Health of every account of the pool, revoked ones included, for the accounts endpoint. No secrets
+def describe_accounts(rows):
+    accounts = []
+    for row in rows:
+        limiter = get_rate_limiter(row.access_token)
+        remaining, capacity, cooldown = limiter.status()
+        accounts.append({
+            'id': row.pk,
+            'username': row.username or None,
+            'authorized_at': row.last_updated,
+            'revoked_at': row.revoked_at,
+            'active': row.revoked_at is None,
+            'budget': {
+                'token': limiter.token_hash,
+                'remaining': int(remaining),
+                'capacity': capacity,
+                'cooldown_seconds': round(cooldown, 1),
+            },
+        })
+    return accounts
@@ -0,0 +1,199 @@
+# Copyright 2025 Giorgio Gamba
+
+import gzip
+import logging
+import os
+import xml.etree.ElementTree as ET
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Artist, DumpImport, Label, Release
+
+logger = logging.getLogger(__name__)
+
+DUMP_RELEASES = 'releases'
+DUMP_ARTISTS = 'artists'
+DUMP_LABELS = 'labels'
+
+DEFAULT_BATCH_SIZE = 1000
+
+# Releases looked up per query when enriching items, below the SQLite variables limit
+DETAILS_CHUNK = 500
+
+def _text(element, path):
+    value = element.findtext(path)
+    return value.strip() if value else ''
+
+def _int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+# Values longer than the column are cut, a few titles and credits in the dumps are huge
+def _clip(value, max_length):
+    return value[:max_length]
+
+def _join(values, max_length):
+    return _clip(', '.join(value for value in values if value), max_length)
+
+def parse_release(element):
+    formats = []
+    for format_element in element.iterfind('formats/format'):
+        formats.append(format_element.get('name', ''))
+        formats.extend((description.text or '').strip() for description in format_element.iterfind('descriptions/description'))
+
+    label_elements = element.findall('labels/label')
+    master_id = element.find('master_id')
+    released = _text(element, 'released')
+
+    return Release(
+        release_id=int(element.get('id')),
+        title=_clip(_text(element, 'title'), 512),
+        artist=_join((_text(artist, 'name') for artist in element.iterfind('artists/artist')), 512),
+        master_id=_int(master_id.text) if master_id is not None else None,
+        year=_int(released[:4]) or None,
+        country=_clip(_text(element, 'country'), 64),
+        formats=_join(formats, 512),
+        labels=_join((label.get('name', '') for label in label_elements), 512),
+        catno=_join((label.get('catno', '') for label in label_elements), 255),
+        genres=_join(((genre.text or '').strip() for genre in element.iterfind('genres/genre')), 255),
+        styles=_join(((style.text or '').strip() for style in element.iterfind('styles/style')), 512),
+    )
+
+def parse_artist(element):
+    return Artist(
+        artist_id=int(_text(element, 'id')),
+        name=_clip(_text(element, 'name'), 255),
+        realname=_clip(_text(element, 'realname'), 255),
+    )
+
+def parse_label(element):
+    parent = element.find('parentLabel')
+    return Label(
+        label_id=int(_text(element, 'id')),
+        name=_clip(_text(element, 'name'), 255),
+        parent_id=_int(parent.get('id')) if parent is not None else None,
+    )
+
+# Dump kind (the root tag) -> (model, record parser)
+DUMP_KINDS = {
+    DUMP_RELEASES: (Release, parse_release),
+    DUMP_ARTISTS: (Artist, parse_artist),
+    DUMP_LABELS: (Label, parse_label),
+}
+
+def open_dump(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    return open(path, 'rb')
+
+# Yields the dump kind, then every top level record of the dump. Memory stays constant whatever the size
+# of the file: the records already yielded are dropped from the tree
+def iter_records(dump_file):
+    root = None
+    depth = 0
+    for event, element in ET.iterparse(dump_file, events=('start', 'end')):
+        if event == 'start':
+            if root is None:
+                root = element
+                yield root.tag
+            depth += 1
+            continue
+
+        depth -= 1
+        if depth == 1:
+            yield element
+            root.clear()
+
+# Replaces the rows of the batch: deleting and inserting is the portable upsert, and makes a batch
+# committed twice harmless
+def save_batch(model, records):
+    records = list({record.pk: record for record in records}.values())
+    model.objects.filter(pk__in=[record.pk for record in records]).delete()
+    model.objects.bulk_create(records)
+
+# Imports a releases, artists or labels dump, plain or gzipped, in batches. Progress is committed with
+# each batch, so an interrupted import started again with the same file skips the records already saved.
+# Returns the DumpImport of the file
+def import_dump(path, batch_size=DEFAULT_BATCH_SIZE, restart=False, progress=None):
+    file_name = os.path.basename(path)
+    file_size = os.path.getsize(path)
+
+    with open_dump(path) as dump_file:
+        records = iter_records(dump_file)
+        kind = next(records, None)
+        if kind not in DUMP_KINDS:
+            raise ValueError(f"{file_name} is not a Discogs releases, artists or labels dump (root element: {kind})")
+        model, parse = DUMP_KINDS[kind]
+
+        dump_import, _ = DumpImport.objects.get_or_create(file_name=file_name, file_size=file_size, defaults={'kind': kind})
+        if restart or dump_import.status == DumpImport.STATUS_COMPLETE:
+            dump_import.records_done = 0
+        dump_import.status = DumpImport.STATUS_RUNNING
+        dump_import.error = ''
+        dump_import.finished_at = None
+        dump_import.save()
+
+        skip = dump_import.records_done
+        if skip:
+            logger.info("Resuming the import of %s after %d records", file_name, skip)
+
+        try:
+            batch = []
+            for element in records:
+                # Records are still parsed while skipping, but nothing is built nor written
+                if skip:
+                    skip -= 1
+                    continue
+
+                try:
+                    batch.append(parse(element))
+                except (TypeError, ValueError) as parse_error:
+                    logger.warning("Skipping a malformed %s record of %s: %s", kind, file_name, parse_error)
+                    batch.append(None)
+
+                if len(batch) >= batch_size:
+                    _commit_batch(dump_import, model, batch, progress)
+                    batch = []
+
+            if batch:
+                _commit_batch(dump_import, model, batch, progress)
+
+        except Exception as e:
+            dump_import.status = DumpImport.STATUS_FAILED
+            dump_import.error = str(e)
+            dump_import.save(update_fields=['status', 'error', 'updated_at'])
+            raise
+
+    dump_import.status = DumpImport.STATUS_COMPLETE
+    dump_import.finished_at = timezone.now()
+    dump_import.save(update_fields=['status', 'finished_at', 'updated_at'])
+    logger.info("Imported %d %s from %s", dump_import.records_done, kind, file_name)
+    return dump_import
+
+# Malformed records are None in the batch: they count as done, as the next run would skip them anyway
+def _commit_batch(dump_import, model, batch, progress):
+    with transaction.atomic():
+        save_batch(model, [record for record in batch if record is not None])
+        dump_import.records_done += len(batch)
+        dump_import.save(update_fields=['records_done', 'updated_at'])
+
+    if progress is not None:
+        progress(dump_import)
+
+# Adds the release details of the imported dumps to the items, with one query per chunk of releases and no
+# upstream call. Items of releases not imported are left as they are
+def add_release_details(items):
+    release_ids = sorted({item['release_id'] for item in items if item.get('release_id')})
+
+    details = {}
+    for offset in range(0, len(release_ids), DETAILS_CHUNK):
+        for release in Release.objects.filter(release_id__in=release_ids[offset:offset + DETAILS_CHUNK]):
+            details[release.release_id] = release.details()
+
+    for item in items:
+        if item.get('release_id') in details:
+            item.update(details[item['release_id']])
+    return items
@@ -0,0 +1,190 @@
+# Copyright 2025 Giorgio Gamba
+
+import base64
+import binascii
+import csv
+import json
+import logging
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .crawler import for_sale_listings
+from .filters import apply_listing_filters, item_matches
+from .history import record_listing_prices
+from .listings import MAX_ITEMS_PER_PAGE, fetch_inventory_page, get_release_id, build_item
+from .metrics import PHASE_STATS, timed
+from .offers import record_offers
+from .stats import fetch_marketplace_stats_bulk, lookup_cached_stats
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMAT_CSV = 'csv'
+EXPORT_FORMAT_JSONL = 'jsonl'
+
+EXPORT_CONTENT_TYPES = {
+    EXPORT_FORMAT_CSV: 'text/csv; charset=utf-8',
+    EXPORT_FORMAT_JSONL: 'application/jsonl; charset=utf-8',
+}
+
+# Where the rows come from: the last complete snapshot of the inventory, or the Discogs pages
+EXPORT_SOURCE_SNAPSHOT = 'snapshot'
+EXPORT_SOURCE_LIVE = 'live'
+
+# Columns of the CSV, in order. The last one is the cursor resuming the export right after the row
+EXPORT_FIELDS = ['id', 'release_id', 'artist', 'title', 'price', 'currency', 'condition', 'sleeve_condition',
+                 'num_for_sale', 'lowest_price', 'lowest_price_currency', 'url', 'status', 'cursor']
+
+# Listing fields read by the snapshot exports: plain rows are several times cheaper than model instances
+SNAPSHOT_FIELDS = ['listing_id', 'release_id', 'title', 'artist', 'url', 'price', 'currency', 'condition', 'sleeve_condition',
+                   'status', 'num_for_sale', 'lowest_price', 'lowest_price_currency', 'stats_error']
+
+# Rows sent to the client in one block: single rows would each go through the gzip middleware and the socket
+EXPORT_LINES_PER_BLOCK = 100
+
+# Oldest listings first, so that listings added during the export end up after the rows already sent
+LIVE_SORT_PARAMS = {'sort': 'listed', 'sort_order': 'asc'}
+
+# Opaque cursor pointing right after a row: the source, the live page of the row and its listing id
+def encode_export_cursor(source, page_num, listing_id):
+    payload = json.dumps([source, page_num, listing_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf8')).decode('ascii').rstrip('=')
+
+# Returns the (source, page, listing id) of the cursor. Raises ValueError if it is malformed
+def decode_export_cursor(cursor):
+    try:
+        payload = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        source, page_num, listing_id = json.loads(payload.decode('utf8'))
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+        raise ValueError("Invalid 'cursor' parameter.")
+
+    if source not in (EXPORT_SOURCE_SNAPSHOT, EXPORT_SOURCE_LIVE) or not isinstance(listing_id, int) or not isinstance(page_num, int):
+        raise ValueError("Invalid 'cursor' parameter.")
+    return source, page_num, listing_id
+
+def _float_or_none(value):
+    return float(value) if value is not None else None
+
+# Same as Listing.to_item, on a row of SNAPSHOT_FIELDS
+def _snapshot_item(row):
+    item = {
+        'url': row['url'],
+        'release_id': row['release_id'],
+        'title': row['title'],
+        'artist': row['artist'],
+        'num_for_sale': row['num_for_sale'],
+        'lowest_price': _float_or_none(row['lowest_price']),
+        'lowest_price_currency': row['lowest_price_currency'] or None,
+        'price': _float_or_none(row['price']),
+        'currency': row['currency'],
+        'condition': row['condition'],
+        'sleeve_condition': row['sleeve_condition'],
+        'id': row['listing_id'],
+        'status': row['status'],
+    }
+    if row['stats_error']:
+        item['stats_error'] = row['stats_error']
+    item['cursor'] = encode_export_cursor(EXPORT_SOURCE_SNAPSHOT, 0, row['listing_id'])
+    return item
+
+# Items of the snapshot listings of the seller, by listing id, read in keyset chunks: memory and the cost
+# of every query stay the same whatever the size of the inventory and the position of the cursor
+def snapshot_items(seller, filters=None, after_id=None):
+    listings = apply_listing_filters(for_sale_listings(seller), filters or {}).order_by('listing_id').values(*SNAPSHOT_FIELDS)
+    chunk_size = settings.DISCOGS_EXPORT_CHUNK_SIZE
+
+    while True:
+        chunk = listings.filter(listing_id__gt=after_id) if after_id is not None else listings
+        chunk = list(chunk[:chunk_size])
+
+        for row in chunk:
+            yield _snapshot_item(row)
+
+        if len(chunk) < chunk_size:
+            return
+        after_id = chunk[-1]['listing_id']
+
+# Items of the inventory pages downloaded from Discogs, one page at a time, starting from the given page
+# (already downloaded, so that its errors are reported before the response starts) and skipping the
+# listings up to after_id in it. With lookup_stats false only the stats already cached are used
+def live_items(client, seller, first_page, filters=None, after_id=None, lookup_stats=True):
+    page_num, listings_data, pagination_info = first_page
+
+    while True:
+        if after_id is not None:
+            ids = [listing_dict.get('id') for listing_dict in listings_data]
+            if after_id in ids:
+                listings_data = listings_data[ids.index(after_id) + 1:]
+            after_id = None
+
+        release_ids = list({get_release_id(listing_dict) for listing_dict in listings_data} - {None})
+        with timed(PHASE_STATS):
+            if lookup_stats:
+                stats_by_release = fetch_marketplace_stats_bulk(client, release_ids)
+            else:
+                cached, _ = lookup_cached_stats(client, release_ids)
+                stats_by_release = {release_id: (stats, None) for release_id, stats in cached.items()}
+
+        items = []
+        for listing_dict in listings_data:
+            release_id = get_release_id(listing_dict)
+            if release_id:
+                stats_response, stats_error_msg = stats_by_release.get(release_id, (None, None))
+                items.append(build_item(listing_dict, stats_response, stats_error_msg))
+
+        # Every price seen goes to the history and to the offers index, as with the searches
+        record_listing_prices(seller, items)
+        record_offers(seller, items)
+
+        for item in items:
+            if not filters or item_matches(item, filters):
+                item['cursor'] = encode_export_cursor(EXPORT_SOURCE_LIVE, page_num, item['id'])
+                yield item
+
+        if page_num >= pagination_info['pages']:
+            return
+        page_num += 1
+        listings_data, pagination_info = fetch_inventory_page(client, seller.username, page_num, MAX_ITEMS_PER_PAGE, **LIVE_SORT_PARAMS)
+
+def fetch_first_page(client, username, page_num):
+    listings_data, pagination_info = fetch_inventory_page(client, username, page_num, MAX_ITEMS_PER_PAGE, **LIVE_SORT_PARAMS)
+    return page_num, listings_data, pagination_info
+
+# File-like object handing back what is written to it, so that csv.writer produces one line at a time
+class _Echo:
+
+    def write(self, value):
+        return value
+
+def _csv_value(value):
+    return '' if value is None else value
+
+def _encode_lines(items, export_format):
+    if export_format == EXPORT_FORMAT_CSV:
+        writer = csv.writer(_Echo())
+        yield writer.writerow(EXPORT_FIELDS)
+        for item in items:
+            yield writer.writerow([_csv_value(item.get(field)) for field in EXPORT_FIELDS])
+    else:
+        for item in items:
+            yield json.dumps(item, cls=DjangoJSONEncoder) + "\n"
+
+# Encodes the items as CSV or JSON Lines, one line per item, sent in blocks of EXPORT_LINES_PER_BLOCK lines.
+# Errors after the first block can't change the status code anymore: JSON Lines exports end with an error
+# line, both can be resumed from the last cursor received
+def export_lines(items, export_format):
+    block = []
+    try:
+        for line in _encode_lines(items, export_format):
+            block.append(line)
+            if len(block) >= EXPORT_LINES_PER_BLOCK:
+                yield ''.join(block)
+                block = []
+
+    except Exception as e:
+        logger.exception("Unexpected error while exporting an inventory: %s", e)
+        if export_format == EXPORT_FORMAT_JSONL:
+            block.append(json.dumps({'error': "Server internal error during export"}) + "\n")
+
+    if block:
+        yield ''.join(block)
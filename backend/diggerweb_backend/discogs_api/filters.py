@@ -0,0 +1,192 @@
+# Copyright 2025 Giorgio Gamba
+
+import base64
+import binascii
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import F, Q
+
+from .listings import condition_rank, parse_condition, price_ratio
+
+# Sort keys of the snapshot searches -> listing field. A leading '-' on the sort parameter reverses the
+# order; listings without a value always come last. Every key has an index starting with (seller, status)
+SORT_FIELDS = {
+    'num_for_sale': 'num_for_sale',
+    'price': 'price',
+    'price_ratio': 'price_ratio',
+    'listed': 'listing_id',
+}
+
+DEFAULT_SORT = 'num_for_sale'
+
+# Query parameters -> parser of the value. Parsers raise ValueError on invalid values
+def _parse_positive_int(value):
+    value = int(value)
+    if value < 0:
+        raise ValueError
+    return value
+
+def _parse_price(value):
+    try:
+        value = Decimal(value)
+    except InvalidOperation:
+        raise ValueError
+    if not value.is_finite() or value < 0:
+        raise ValueError
+    return value
+
+def _parse_ratio(value):
+    value = float(value)
+    if not value > 0:
+        raise ValueError
+    return value
+
+def _parse_currency(value):
+    value = value.strip().upper()
+    if len(value) != 3 or not value.isalpha():
+        raise ValueError
+    return value
+
+def _parse_text(value):
+    value = value.strip()
+    if not value:
+        raise ValueError
+    return value
+
+FILTER_PARAMS = {
+    'max_num_for_sale': _parse_positive_int,
+    'min_price': _parse_price,
+    'max_price': _parse_price,
+    'currency': _parse_currency,
+    'min_condition': parse_condition,
+    'min_sleeve_condition': parse_condition,
+    'artist': _parse_text,
+    'max_price_ratio': _parse_ratio,
+}
+
+# Query parameters that only make sense on the local listings
+LOCAL_ONLY_PARAMS = list(FILTER_PARAMS) + ['sort', 'cursor']
+
+# Reads the filters from the query parameters. Returns a dict param -> parsed value of the given ones.
+# Raises ValueError with a message for the client
+def parse_listing_filters(query_params):
+    filters = {}
+    for name, parse in FILTER_PARAMS.items():
+        value = query_params.get(name)
+        if value is None or value == '':
+            continue
+        try:
+            filters[name] = parse(value)
+        except (ValueError, TypeError):
+            raise ValueError(f"Invalid value '{value}' for the '{name}' parameter.")
+    return filters
+
+def parse_sort(value):
+    sort = value or DEFAULT_SORT
+    if sort.lstrip('-') not in SORT_FIELDS:
+        raise ValueError(f"'sort' parameter must be one of: {', '.join(SORT_FIELDS)} (with a leading '-' for descending order).")
+    return sort
+
+def apply_listing_filters(listings, filters):
+    if 'max_num_for_sale' in filters:
+        listings = listings.filter(num_for_sale__lte=filters['max_num_for_sale'])
+    if 'min_price' in filters:
+        listings = listings.filter(price__gte=filters['min_price'])
+    if 'max_price' in filters:
+        listings = listings.filter(price__lte=filters['max_price'])
+    if 'currency' in filters:
+        listings = listings.filter(currency=filters['currency'])
+    if 'min_condition' in filters:
+        listings = listings.filter(condition_rank__gte=filters['min_condition'])
+    if 'min_sleeve_condition' in filters:
+        listings = listings.filter(sleeve_condition_rank__gte=filters['min_sleeve_condition'])
+    if 'max_price_ratio' in filters:
+        listings = listings.filter(price_ratio__lte=filters['max_price_ratio'])
+    # Substring match: no index helps it, but it only scans the rows of one seller left by the other filters
+    if 'artist' in filters:
+        listings = listings.filter(artist__icontains=filters['artist'])
+    return listings
+
+def _decimal_or_none(value):
+    try:
+        return Decimal(str(value)) if value is not None else None
+    except InvalidOperation:
+        return None
+
+# Same filters as apply_listing_filters, on an item built from a live Discogs page
+def item_matches(item, filters):
+    num_for_sale = item.get('num_for_sale')
+    price = _decimal_or_none(item.get('price'))
+
+    if 'max_num_for_sale' in filters and (num_for_sale is None or num_for_sale > filters['max_num_for_sale']):
+        return False
+    if 'min_price' in filters and (price is None or price < filters['min_price']):
+        return False
+    if 'max_price' in filters and (price is None or price > filters['max_price']):
+        return False
+    if 'currency' in filters and item.get('currency') != filters['currency']:
+        return False
+    if 'min_condition' in filters and (condition_rank(item.get('condition')) or 0) < filters['min_condition']:
+        return False
+    if 'min_sleeve_condition' in filters and (condition_rank(item.get('sleeve_condition')) or 0) < filters['min_sleeve_condition']:
+        return False
+    if 'max_price_ratio' in filters:
+        ratio = price_ratio(price, item.get('currency'), _decimal_or_none(item.get('lowest_price')), item.get('lowest_price_currency'))
+        if ratio is None or ratio > filters['max_price_ratio']:
+            return False
+    if 'artist' in filters and filters['artist'].lower() not in (item.get('artist') or '').lower():
+        return False
+    return True
+
+def _sort_field(sort):
+    return SORT_FIELDS[sort.lstrip('-')], sort.startswith('-')
+
+def order_listings(listings, sort):
+    field, descending = _sort_field(sort)
+    if field == 'listing_id':
+        return listings.order_by('-listing_id' if descending else 'listing_id')
+    if descending:
+        return listings.order_by(F(field).desc(nulls_last=True), '-listing_id')
+    return listings.order_by(F(field).asc(nulls_last=True), 'listing_id')
+
+# Opaque cursor pointing right after the given listing, in the given sort order
+def encode_cursor(sort, listing):
+    field, _ = _sort_field(sort)
+    value = getattr(listing, field)
+    if isinstance(value, Decimal):
+        value = str(value)
+    payload = json.dumps([sort, value, listing.listing_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf8')).decode('ascii').rstrip('=')
+
+# Returns the (value, listing id) of the last listing of the previous page. Raises ValueError if the cursor
+# is malformed or belongs to another sort order
+def decode_cursor(cursor, sort):
+    try:
+        payload = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        cursor_sort, value, listing_id = json.loads(payload.decode('utf8'))
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+        raise ValueError("Invalid 'cursor' parameter.")
+
+    if cursor_sort != sort or not isinstance(listing_id, int):
+        raise ValueError("The 'cursor' parameter belongs to a different sort order.")
+    return value, listing_id
+
+# Keyset condition selecting the listings after the cursor: with the matching index, every page costs
+# the same whatever its depth, unlike OFFSET
+def after_cursor(listings, sort, cursor_value, cursor_id):
+    field, descending = _sort_field(sort)
+    beyond = 'lt' if descending else 'gt'
+
+    if field == 'listing_id':
+        return listings.filter(**{f"listing_id__{beyond}": cursor_id})
+
+    if cursor_value is None:
+        # Already among the listings without a value, sorted by id alone
+        return listings.filter(**{f"{field}__isnull": True, f"listing_id__{beyond}": cursor_id})
+
+    return listings.filter(
+        Q(**{f"{field}__{beyond}": cursor_value})
+        | Q(**{field: cursor_value, f"listing_id__{beyond}": cursor_id})
+        | Q(**{f"{field}__isnull": True})
+    )
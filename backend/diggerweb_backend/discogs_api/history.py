@@ -0,0 +1,174 @@
+# Copyright 2025 Giorgio Gamba
+
+import logging
+import time
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db.models import Count, ExpressionWrapper, F, FloatField, IntegerField, Max, Min, Q, Sum
+from django.db.models.functions import Cast
+
+from .models import ListingPriceHistory, ReleaseStatsHistory
+
+logger = logging.getLogger(__name__)
+
+SECONDS_PER_HOUR = 3600
+HOURS_PER_DAY = 24
+
+def current_hour(timestamp=None):
+    return int((timestamp if timestamp is not None else time.time()) // SECONDS_PER_HOUR)
+
+def hour_to_datetime(hour):
+    return datetime.fromtimestamp(hour * SECONDS_PER_HOUR, tz=dt_timezone.utc)
+
+def _price(value):
+    try:
+        return Decimal(str(value)).quantize(Decimal('0.01')) if value is not None else None
+    except InvalidOperation:
+        return None
+
+# Appends the stats just fetched from Discogs to the history of the release. The first observation of
+# every hour is kept
+def record_release_stats(release_id, stats, fetched_at=None):
+    lowest_price = stats.get('lowest_price') or {}
+    point = ReleaseStatsHistory(release_id=release_id, hour=current_hour(fetched_at), num_for_sale=stats.get('num_for_sale'),
+                                lowest_price=_price(lowest_price.get('value')), currency=lowest_price.get('currency') or '')
+    try:
+        ReleaseStatsHistory.objects.bulk_create([point], ignore_conflicts=True)
+    except Exception as e:
+        logger.error("Error while saving the stats history of release %s: %s", release_id, e)
+
+# Appends the prices of the listings of the items (see listings.build_item) sold by the seller, when they
+# differ from the last ones recorded
+def record_listing_prices(seller, items):
+    prices = {}
+    for item in items:
+        if item.get('id') and item.get('release_id'):
+            prices[item['id']] = (_price(item.get('price')), item.get('currency') or '', item['release_id'])
+    if not prices:
+        return
+
+    try:
+        last_prices = {}
+        rows = ListingPriceHistory.objects.filter(listing_id__in=list(prices)).order_by('listing_id', '-hour')
+        for listing_id, price, currency in rows.values_list('listing_id', 'price', 'currency'):
+            last_prices.setdefault(listing_id, (price, currency))
+
+        hour = current_hour()
+        points = [ListingPriceHistory(listing_id=listing_id, seller=seller, release_id=release_id, hour=hour, price=price, currency=currency)
+                  for listing_id, (price, currency, release_id) in prices.items()
+                  if last_prices.get(listing_id) != (price, currency)]
+        ListingPriceHistory.objects.bulk_create(points, ignore_conflicts=True)
+
+    except Exception as e:
+        logger.error("Error while saving the price history of the listings of %s: %s", seller, e)
+
+def _as_float(expression):
+    return ExpressionWrapper(expression, output_field=FloatField())
+
+# Sums of the least squares fit of y over x, restricted to the rows where y is known
+def _regression_sums(name, x, y):
+    known = Q(**{f"{name}__isnull": False})
+    return {
+        f"{name}_n": Count('pk', filter=known),
+        f"{name}_sx": Sum(x, filter=known),
+        f"{name}_sy": Sum(y, filter=known),
+        f"{name}_sxy": Sum(_as_float(x * y), filter=known),
+        f"{name}_sxx": Sum(_as_float(x * x), filter=known),
+    }
+
+def _slope(row, name):
+    n = row[f"{name}_n"]
+    if n < 2:
+        return None
+    sx, sy, sxy, sxx = (row[f"{name}_{suffix}"] for suffix in ('sx', 'sy', 'sxy', 'sxx'))
+    denominator = n * sxx - sx * sx
+    if not denominator:
+        return None
+    return (n * sxy - sx * sy) / denominator
+
+# Trends of the releases over the last days: per release, the least squares slopes of num_for_sale and of
+# the lowest price per day, and their ranges. The database computes the sums of all the releases in one
+# grouped query, Python only derives the slopes. release_ids can be a list or a values() queryset
+def release_trends(release_ids, days):
+    start_hour = current_hour() - days * HOURS_PER_DAY
+
+    # Days since the start of the window: small values keep the sums of squares precise
+    x = _as_float(Cast(F('hour') - start_hour, FloatField()) / HOURS_PER_DAY)
+    num_for_sale = Cast('num_for_sale', FloatField())
+    lowest_price = Cast('lowest_price', FloatField())
+
+    rows = (ReleaseStatsHistory.objects
+            .filter(release_id__in=release_ids, hour__gte=start_hour)
+            .values('release_id')
+            .annotate(points=Count('pk'), first_hour=Min('hour'), last_hour=Max('hour'),
+                      num_for_sale_min=Min('num_for_sale'), num_for_sale_max=Max('num_for_sale'),
+                      lowest_price_min=Min('lowest_price'), lowest_price_max=Max('lowest_price'),
+                      **_regression_sums('num_for_sale', x, num_for_sale),
+                      **_regression_sums('lowest_price', x, lowest_price))
+            .order_by('release_id'))
+
+    trends = {}
+    for row in rows:
+        trends[row['release_id']] = {
+            'points': row['points'],
+            'first_at': hour_to_datetime(row['first_hour']),
+            'last_at': hour_to_datetime(row['last_hour']),
+            'num_for_sale_min': row['num_for_sale_min'],
+            'num_for_sale_max': row['num_for_sale_max'],
+            'num_for_sale_per_day': _slope(row, 'num_for_sale'),
+            'lowest_price_min': row['lowest_price_min'],
+            'lowest_price_max': row['lowest_price_max'],
+            'lowest_price_per_day': _slope(row, 'lowest_price'),
+        }
+    return trends
+
+def release_points(release_id, days):
+    start_hour = current_hour() - days * HOURS_PER_DAY
+    rows = ReleaseStatsHistory.objects.filter(release_id=release_id, hour__gte=start_hour).order_by('hour')
+    return [{
+        'observed_at': hour_to_datetime(hour),
+        'num_for_sale': num_for_sale,
+        'lowest_price': lowest_price,
+        'currency': currency,
+    } for hour, num_for_sale, lowest_price, currency in rows.values_list('hour', 'num_for_sale', 'lowest_price', 'currency')]
+
+# Listings of the seller whose price changed in the last days, with their price range
+def listing_price_changes(seller, days):
+    start_hour = current_hour() - days * HOURS_PER_DAY
+    rows = (ListingPriceHistory.objects
+            .filter(seller=seller, hour__gte=start_hour)
+            .values('listing_id', 'release_id', 'currency')
+            .annotate(points=Count('pk'), first_hour=Min('hour'), last_hour=Max('hour'), price_min=Min('price'), price_max=Max('price'))
+            .filter(points__gt=1)
+            .order_by('listing_id'))
+
+    return [{
+        'id': row['listing_id'],
+        'release_id': row['release_id'],
+        'currency': row['currency'],
+        'changes': row['points'] - 1,
+        'price_min': row['price_min'],
+        'price_max': row['price_max'],
+        'first_at': hour_to_datetime(row['first_hour']),
+        'last_at': hour_to_datetime(row['last_hour']),
+    } for row in rows]
+
+# Drops the points older than DISCOGS_HISTORY_RETENTION_DAYS, and downsamples the stats older than
+# DISCOGS_HISTORY_RAW_DAYS to the first point of every day. Returns the number of deleted points
+def prune_history():
+    now_hour = current_hour()
+    retention_cutoff = now_hour - settings.DISCOGS_HISTORY_RETENTION_DAYS * HOURS_PER_DAY
+    raw_cutoff = now_hour - settings.DISCOGS_HISTORY_RAW_DAYS * HOURS_PER_DAY
+
+    deleted, _ = ReleaseStatsHistory.objects.filter(hour__lt=retention_cutoff).delete()
+    deleted += ListingPriceHistory.objects.filter(hour__lt=retention_cutoff).delete()[0]
+
+    old_points = ReleaseStatsHistory.objects.filter(hour__lt=raw_cutoff)
+    day = ExpressionWrapper(F('hour') / HOURS_PER_DAY, output_field=IntegerField())
+    first_of_day = old_points.annotate(day=day).values('release_id', 'day').annotate(first=Min('pk')).values('first')
+    deleted += old_points.exclude(pk__in=first_of_day).delete()[0]
+
+    logger.info("Pruned %d history points", deleted)
+    return deleted
@@ -0,0 +1,58 @@
+# Copyright 2025 Giorgio Gamba
+
+import hashlib
+
+from django.conf import settings
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags, quote_etag
+
+from .streaming import STREAM_CONTENT_TYPES
+
+# Query parameters that don't change the content of a search page
+ETAG_IGNORED_PARAMS = ['refresh', 'deadline_ms']
+
+# Version of a snapshot search page: the local listings only change while a crawl saves its pages or when
+# their stats are refreshed, and both touch the updated_at of the snapshot. The ETag is weak, as the age of the snapshot
+# in the response changes on every request
+def snapshot_etag(query_params, snapshot, running):
+    parts = [f"{name}={value}" for name, value in sorted(query_params.lists()) if name not in ETAG_IGNORED_PARAMS]
+    for current in (snapshot, running):
+        parts.append(f"{current.pk}:{current.updated_at.timestamp()}" if current else '-')
+
+    digest = hashlib.sha1('&'.join(map(str, parts)).encode('utf8')).hexdigest()
+    return 'W/' + quote_etag(digest)
+
+def _opaque_tag(etag):
+    return etag[2:] if etag.startswith('W/') else etag
+
+# Weak comparison, as required for If-None-Match
+def etag_matches(request, etag):
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if not if_none_match:
+        return False
+
+    etags = parse_etags(if_none_match)
+    return '*' in etags or _opaque_tag(etag) in map(_opaque_tag, etags)
+
+# Search pages can be reused by the browser for a short time, never longer than the stats they contain
+# would be considered fresh here. Pages still changing (pending stats, running crawls) are revalidated
+# every time, which is cheap with their ETag
+def search_max_age():
+    return min(settings.DISCOGS_SEARCH_MAX_AGE, settings.DISCOGS_STATS_TTL)
+
+def set_search_cache_control(response, max_age=None):
+    if max_age:
+        patch_cache_control(response, private=True, max_age=max_age)
+    else:
+        patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+# Gzip for the API responses, except the event streams: the gzip buffer would hold events back until it
+# fills a whole block
+class APIGZipMiddleware(GZipMiddleware):
+
+    def process_response(self, request, response):
+        if response.streaming and response.get('Content-Type', '').split(';')[0] in STREAM_CONTENT_TYPES.values():
+            return response
+        return super().process_response(request, response)
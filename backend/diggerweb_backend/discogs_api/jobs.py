@@ -0,0 +1,175 @@
+# Copyright 2025 Giorgio Gamba
+
+import logging
+import os
+import socket
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+def new_worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+# Queues a job, unless a job with the same key is already queued or running: then that one is returned,
+# moved earlier if it was due later than run_after. Returns the job and whether it was created
+def enqueue_job(kind, key, payload=None, run_after=None, max_attempts=None):
+    run_after = run_after or timezone.now()
+    try:
+        with transaction.atomic():
+            job = Job.objects.create(kind=kind, key=key, payload=payload or {}, run_after=run_after,
+                                     max_attempts=max_attempts or settings.DISCOGS_JOBS_MAX_ATTEMPTS)
+        return job, True
+
+    except IntegrityError:
+        job = Job.objects.filter(key=key, status__in=Job.ACTIVE_STATUSES).first()
+        if job is None:
+            # Finished in the meantime
+            return enqueue_job(kind, key, payload, run_after, max_attempts)
+
+        Job.objects.filter(pk=job.pk, status=Job.STATUS_QUEUED, run_after__gt=run_after).update(run_after=run_after)
+        return job, False
+
+def _claimable(now):
+    due = Q(status=Job.STATUS_QUEUED, run_after__lte=now)
+    # The worker holding them died: they get their remaining attempts
+    abandoned = Q(status=Job.STATUS_RUNNING, lease_expires_at__lt=now, attempts__lt=F('max_attempts'))
+    return due | abandoned
+
+# Claims up to limit due jobs for the worker, oldest first. Every claim is a conditional UPDATE, so
+# concurrent workers (threads, processes or machines) never get the same job, on any database
+def claim_jobs(worker_id, limit, lease_seconds=None):
+    now = timezone.now()
+    lease_expires_at = now + timedelta(seconds=lease_seconds or settings.DISCOGS_JOBS_LEASE)
+
+    # Abandoned jobs without attempts left won't be claimed anymore
+    Job.objects.filter(status=Job.STATUS_RUNNING, lease_expires_at__lt=now, attempts__gte=F('max_attempts')).update(
+        status=Job.STATUS_FAILED, last_error="Lease expired", finished_at=now)
+
+    claimed = []
+    candidates = Job.objects.filter(_claimable(now)).order_by('run_after', 'pk').values_list('pk', flat=True)[:limit * 2]
+    for job_id in candidates:
+        updated = Job.objects.filter(_claimable(now), pk=job_id).update(status=Job.STATUS_RUNNING, locked_by=worker_id, lease_expires_at=lease_expires_at,
+                                                                     attempts=F('attempts') + 1, updated_at=now)
+        if updated:
+            claimed.append(Job.objects.get(pk=job_id))
+            if len(claimed) >= limit:
+                break
+    return claimed
+
+# Keeps the leases of the running jobs of the worker
+def extend_leases(worker_id, job_ids, lease_seconds=None):
+    if not job_ids:
+        return 0
+    lease_expires_at = timezone.now() + timedelta(seconds=lease_seconds or settings.DISCOGS_JOBS_LEASE)
+    return Job.objects.filter(pk__in=job_ids, locked_by=worker_id, status=Job.STATUS_RUNNING).update(lease_expires_at=lease_expires_at)
+
+def complete_job(job, worker_id):
+    return Job.objects.filter(pk=job.pk, locked_by=worker_id, status=Job.STATUS_RUNNING).update(
+        status=Job.STATUS_DONE, lease_expires_at=None, last_error='', finished_at=timezone.now())
+
+# Queues the job again after an exponential delay, or fails it when it has no attempts left
+def fail_job(job, worker_id, error):
+    jobs = Job.objects.filter(pk=job.pk, locked_by=worker_id, status=Job.STATUS_RUNNING)
+    if job.attempts >= job.max_attempts:
+        return jobs.update(status=Job.STATUS_FAILED, lease_expires_at=None, last_error=error, finished_at=timezone.now())
+
+    delay = settings.DISCOGS_JOBS_RETRY_DELAY * 2 ** (job.attempts - 1)
+    return jobs.update(status=Job.STATUS_QUEUED, lease_expires_at=None, last_error=error, run_after=timezone.now() + timedelta(seconds=delay))
+
+def prune_jobs():
+    cutoff = timezone.now() - timedelta(seconds=settings.DISCOGS_JOBS_RETENTION)
+    return Job.objects.filter(status__in=[Job.STATUS_DONE, Job.STATUS_FAILED], finished_at__lt=cutoff).delete()[0]
+
+def run_job(job, handlers):
+    handler = handlers.get(job.kind)
+    if handler is None:
+        raise ValueError(f"Unknown job kind '{job.kind}'")
+    return handler(job.payload)
+
+# Runs the jobs of the queue with a pool of threads. The main thread claims jobs while threads are free,
+# keeps the leases of the running ones and calls schedule(), if given, at every poll (e.g. to queue the
+# periodic jobs). handlers maps the job kinds to functions taking the job payload
+class JobWorker:
+
+    def __init__(self, handlers, threads=None, schedule=None, worker_id=None, poll_interval=None, lease_seconds=None):
+        self.handlers = handlers
+        self.threads = threads or settings.DISCOGS_JOBS_THREADS
+        self.schedule = schedule
+        self.worker_id = worker_id or new_worker_id()
+        self.poll_interval = poll_interval if poll_interval is not None else settings.DISCOGS_JOBS_POLL_INTERVAL
+        self.lease_seconds = lease_seconds or settings.DISCOGS_JOBS_LEASE
+        self.stop_event = threading.Event()
+        self.lock = threading.Lock()
+        # job id -> job, of the jobs running in the pool
+        self.running = {}
+
+    def stop(self):
+        self.stop_event.set()
+
+    def _execute(self, job):
+        close_old_connections()
+        try:
+            logger.info("Job %d (%s %s) started by %s, attempt %d", job.pk, job.kind, job.key, self.worker_id, job.attempts)
+            run_job(job, self.handlers)
+            complete_job(job, self.worker_id)
+            logger.info("Job %d (%s %s) done", job.pk, job.kind, job.key)
+
+        except Exception as e:
+            logger.exception("Job %d (%s %s) failed: %s", job.pk, job.kind, job.key, e)
+            fail_job(job, self.worker_id, str(e)[:1000])
+
+        finally:
+            with self.lock:
+                self.running.pop(job.pk, None)
+            close_old_connections()
+
+    # Claims and runs jobs until stop() is called. With until_idle it returns as soon as the queue has
+    # no due jobs and nothing is running, which is handy for cron and for tests
+    def run(self, until_idle=False):
+        logger.info("Job worker %s started with %d threads", self.worker_id, self.threads)
+
+        with ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix='discogs-job') as executor:
+            while not self.stop_event.is_set():
+                try:
+                    if self.schedule is not None:
+                        self.schedule()
+
+                    with self.lock:
+                        running_ids = list(self.running)
+                    extend_leases(self.worker_id, running_ids, self.lease_seconds)
+
+                    claimed = []
+                    free = self.threads - len(running_ids)
+                    if free > 0:
+                        claimed = claim_jobs(self.worker_id, free, self.lease_seconds)
+                        for job in claimed:
+                            with self.lock:
+                                self.running[job.pk] = job
+                            executor.submit(self._execute, job)
+
+                except Exception as e:
+                    # Database gone for a while: try again at the next poll
+                    logger.exception("Job worker %s poll failed: %s", self.worker_id, e)
+                    close_old_connections()
+                    claimed = []
+
+                with self.lock:
+                    idle = not self.running
+                if until_idle and idle and not claimed:
+                    break
+
+                # Polls again right away while there is work and free threads
+                if not claimed or len(self.running) >= self.threads:
+                    self.stop_event.wait(self.poll_interval)
+
+        logger.info("Job worker %s stopped", self.worker_id)
@@ -0,0 +1,148 @@
+# Copyright 2025 Giorgio Gamba
+
+import logging
+from urllib.parse import urlencode
+
+from .constants import BASE_API_URL
+from .metrics import PHASE_INVENTORY, timed
+
+logger = logging.getLogger(__name__)
+
+INVENTORY_STATUS_FOR_SALE = 'For Sale'
+
+# Local status of listings no longer in the inventory: Discogs doesn't tell apart sold and removed ones
+LISTING_STATUS_REMOVED = 'Removed'
+
+# Maximum page size accepted by Discogs
+MAX_ITEMS_PER_PAGE = 100
+
+# Discogs grading scale, from the best grade to the worst, with the usual abbreviations
+CONDITION_GRADES = [
+    ('Mint (M)', 'M'),
+    ('Near Mint (NM or M-)', 'NM'),
+    ('Very Good Plus (VG+)', 'VG+'),
+    ('Very Good (VG)', 'VG'),
+    ('Good Plus (G+)', 'G+'),
+    ('Good (G)', 'G'),
+    ('Fair (F)', 'F'),
+    ('Poor (P)', 'P'),
+]
+
+# Grade -> rank, higher is better. Sleeve values outside the scale (Generic, Not Graded, No Cover) have no rank
+CONDITION_RANKS = {grade: len(CONDITION_GRADES) - index for index, (grade, _) in enumerate(CONDITION_GRADES)}
+
+_CONDITION_ALIASES = {alias.lower(): CONDITION_RANKS[grade] for grade, abbreviation in CONDITION_GRADES for alias in (grade, abbreviation)}
+_CONDITION_ALIASES['m-'] = CONDITION_RANKS['Near Mint (NM or M-)']
+
+def inventory_page_url(username, page_num, items_per_page, **extra_params):
+
+    # Build the complete research path
+    endpoint = f'/users/{username}/inventory'
+
+    params = {
+        'status': INVENTORY_STATUS_FOR_SALE,
+        'page': page_num,
+        'per_page': items_per_page,
+    }
+    params.update(extra_params)
+
+    query_string = urlencode(params)
+    return f"{BASE_API_URL}{endpoint}?{query_string}"
+
+# Checks an inventory response and returns the raw listings and the pagination info
+def parse_inventory_response(response_data, page_num, items_per_page):
+    if not isinstance(response_data, dict) or 'pagination' not in response_data or 'listings' not in response_data:
+        logger.error("Struttura risposta API inattesa: %s", response_data)
+        raise ValueError("Struttura risposta invalida ricevuta dall'API Discogs")
+
+    pagination_api = response_data.get('pagination', {})
+    listings_data = response_data.get('listings', [])
+
+    pagination_info = {
+        'page': pagination_api.get('page', page_num),
+        'pages': pagination_api.get('pages', 0),
+        'per_page': pagination_api.get('per_page', items_per_page),
+        'items': pagination_api.get('count', pagination_api.get('items', 0)),
+        'urls': pagination_api.get('urls', {})
+    }
+
+    return listings_data, pagination_info
+
+# Downloads one page of the "For Sale" inventory of a user. Returns the raw listings and the pagination info
+def fetch_inventory_page(client, username, page_num, items_per_page, **extra_params):
+    with timed(PHASE_INVENTORY):
+        response_data = client._get(inventory_page_url(username, page_num, items_per_page, **extra_params))
+    return parse_inventory_response(response_data, page_num, items_per_page)
+
+# Reads the 'page' and 'per_page' query parameters, clamped to the values accepted by Discogs.
+# Raises ValueError if they are not integers
+def parse_pagination_params(query_params):
+    page_num = int(query_params.get('page', 1))
+    items_per_page = int(query_params.get('per_page', 50))
+
+    # Handle edge cases
+    if items_per_page < 1:
+        items_per_page = 1
+    if items_per_page > MAX_ITEMS_PER_PAGE:
+        items_per_page = MAX_ITEMS_PER_PAGE # Respect Discogs limits (usually 100 max)
+    if page_num < 1:
+        page_num = 1
+
+    return page_num, items_per_page
+
+def condition_rank(condition):
+    return CONDITION_RANKS.get(condition)
+
+# Rank of a grade given by its name or its abbreviation (case insensitive). Raises ValueError if unknown
+def parse_condition(value):
+    try:
+        return _CONDITION_ALIASES[value.strip().lower()]
+    except KeyError:
+        raise ValueError(f"Unknown condition '{value}'")
+
+# How the price of a listing compares with the cheapest copy on the marketplace. None when unknown or
+# when the two prices are in different currencies
+def price_ratio(price, currency, lowest_price, lowest_price_currency):
+    if price is None or not lowest_price or currency != lowest_price_currency:
+        return None
+    return float(price) / float(lowest_price)
+
+def get_release_id(listing_dict):
+    return (listing_dict.get('release') or {}).get('id')
+
+# Converts a raw Discogs listing and its marketplace stats into the item returned to the frontend
+def build_item(listing_dict, stats_response, stats_error_msg=None):
+    release_info = listing_dict.get('release', {})
+    price_info = listing_dict.get('price', {})
+
+    num_for_sale = stats_response.get('num_for_sale') if stats_response else None
+    lowest_price = (stats_response.get('lowest_price') if stats_response else None) or {}
+
+    artists_list = release_info.get('artists', [])
+    artists_str = ", ".join(a.get('name', 'N/A') for a in artists_list) if artists_list else 'N/A'
+
+    item_data = {
+        'url': listing_dict.get('uri', listing_dict.get('resource_url')),
+        'release_id': release_info.get('id'),
+        'title': release_info.get('description', 'N/A'),
+        'artist': artists_str,
+        'num_for_sale': num_for_sale,
+        'lowest_price': lowest_price.get('value'),
+        'lowest_price_currency': lowest_price.get('currency'),
+        'price': price_info.get('value'),
+        'currency': price_info.get('currency'),
+        'condition': listing_dict.get('condition', 'N/A'),
+        'sleeve_condition': listing_dict.get('sleeve_condition', 'N/A'),
+        'id': listing_dict.get('id'),
+        'status': listing_dict.get('status')
+    }
+
+    if stats_error_msg:
+        item_data['stats_error'] = stats_error_msg
+
+    return item_data
+
+# Items without stats go first, as the missing value can't be compared with the others
+def num_for_sale_sort_key(item):
+    num_for_sale = item.get('num_for_sale')
+    return num_for_sale if num_for_sale is not None else -1
@@ -0,0 +1,31 @@
+# Copyright 2025 Giorgio Gamba
+
+import logging
+
+# Attributes every LogRecord has, anything else comes from the extra argument of the logging call
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+def _logfmt_value(value):
+    value = str(value)
+    if value and not any(char in value for char in ' "=\\\n'):
+        return value
+    escaped = value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return f'"{escaped}"'
+
+# logfmt lines (key=value pairs): the fields passed with extra= stay separate, so that Loki, Datadog and
+# similar tools can filter and aggregate on them
+class LogfmtFormatter(logging.Formatter):
+
+    def format(self, record):
+        fields = [
+            ('time', self.formatTime(record)),
+            ('level', record.levelname.lower()),
+            ('logger', record.name),
+            ('msg', record.getMessage()),
+        ]
+        fields.extend((name, value) for name, value in vars(record).items() if name not in _RECORD_ATTRIBUTES)
+
+        if record.exc_info:
+            fields.append(('exc', self.formatException(record.exc_info)))
+
+        return ' '.join(f"{name}={_logfmt_value(value)}" for name, value in fields)
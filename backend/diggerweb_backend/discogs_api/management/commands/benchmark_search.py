@@ -0,0 +1,92 @@
+# Copyright 2025 Giorgio Gamba
+
+import json
+import os
+import tempfile
+import uuid
+from urllib.parse import urlparse
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+
+from diggerweb_backend.discogs_api.benchmark.scenarios import BenchmarkRunner, SCENARIOS, run_scenarios
+from diggerweb_backend.discogs_api.constants import BASE_API_URL, DISCOGS_CONSUMER_KEY, DISCOGS_CONSUMER_SECRET
+from diggerweb_backend.discogs_api.utils import save_access_token
+from .discogs_mock_server import add_mock_server_arguments, build_fixture, build_server
+
+LOCAL_HOSTS = ('127.0.0.1', 'localhost')
+
+COLUMNS = ['scenario', 'requests', 'errors', 'p50_ms', 'p95_ms', 'rps', 'upstream_per_request']
+
+# Runs the search scenarios against the mock server, on a throwaway database, and reports latency
+# percentiles, throughput and upstream calls per request
+class Command(BaseCommand):
+    help = "Benchmarks DiscogsSearchView offline, against a local mock of the Discogs API"
+
+    def add_arguments(self, parser):
+        add_mock_server_arguments(parser)
+        parser.add_argument('--username', help="Seller to search, the first one of the fixture by default")
+        parser.add_argument('--scenario', action='append', choices=SCENARIOS, help="Scenario to run, can be repeated. All of them by default")
+        parser.add_argument('--pages', type=int, default=10, help="Requests per scenario")
+        parser.add_argument('--per-page', type=int, default=50)
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--accounts', type=int, default=1, help="Authorized accounts in the credentials pool, each with its own rate limit")
+        parser.add_argument('--json', dest='json_path', help="Also write the results to this file")
+
+    def handle(self, *args, **options):
+        # The API base URL is read at import time, so it must already point to the port the mock will use
+        base_url = urlparse(BASE_API_URL)
+        if base_url.hostname not in LOCAL_HOSTS or not base_url.port:
+            raise CommandError(f"DISCOGS_API_BASE_URL is {BASE_API_URL}: set it to http://127.0.0.1:<port> to benchmark against the mock server")
+        if not DISCOGS_CONSUMER_KEY or not DISCOGS_CONSUMER_SECRET:
+            raise CommandError("DISCOGS_CONSUMER_KEY and DISCOGS_CONSUMER_SECRET must be set, any value works with the mock server")
+
+        fixture = build_fixture(options)
+        username = options['username'] or next(iter(fixture['inventories']), None)
+        if username not in fixture['inventories']:
+            raise CommandError(f"Seller '{username}' is not in the fixture")
+
+        server = build_server(fixture, options, host=base_url.hostname, port=base_url.port).start()
+
+        with tempfile.TemporaryDirectory(prefix='diggerweb-benchmark-') as work_dir:
+            # Shared state of the real workers (rate budget, single-flight results, metrics) stays untouched
+            with override_settings(DISCOGS_RATE_LIMIT_DIR=os.path.join(work_dir, 'ratelimit'),
+                                   DISCOGS_SINGLEFLIGHT_DIR=os.path.join(work_dir, 'singleflight'),
+                                   DISCOGS_METRICS_DIR=os.path.join(work_dir, 'metrics')):
+                # SQLite test databases are in memory by default, which doesn't work with the pool threads
+                if connection.vendor == 'sqlite':
+                    connection.settings_dict.setdefault('TEST', {})['NAME'] = os.path.join(work_dir, 'benchmark.sqlite3')
+
+                old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+                try:
+                    # New tokens every run, so that the rate budgets start full
+                    for account in range(max(1, options['accounts'])):
+                        save_access_token(f"benchmark-{uuid.uuid4().hex}", 'benchmark-secret', f"benchmark{account}")
+
+                    runner = BenchmarkRunner(server, username, per_page=options['per_page'], pages=options['pages'], concurrency=options['concurrency'])
+                    results = [result.as_dict() for result in run_scenarios(runner, options['scenario'] or SCENARIOS)]
+                finally:
+                    connection.creation.destroy_test_db(old_name, verbosity=0)
+                    server.stop()
+
+        self.write_table(results)
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as json_file:
+                json.dump({'options': {name: options[name] for name in ('sellers', 'fixture', 'latency', 'rate_limit', 'throttle', 'pages', 'per_page', 'concurrency', 'accounts')},
+                           'results': results}, json_file, indent=2)
+
+    def write_table(self, results):
+        rows = [[str(result[column]) for column in COLUMNS] for result in results]
+        widths = [max(len(column), *(len(row[index]) for row in rows)) for index, column in enumerate(COLUMNS)]
+
+        self.stdout.write('  '.join(column.ljust(width) for column, width in zip(COLUMNS, widths)))
+        for row, result in zip(rows, results):
+            line = '  '.join(value.ljust(width) for value, width in zip(row, widths))
+            details = ', '.join(f"{endpoint}={count}" for endpoint, count in sorted(result['upstream_calls'].items()))
+            if result['throttled']:
+                details += f"; 429: {sum(result['throttled'].values())}"
+            if result['notes']:
+                details += f"; {result['notes']}"
+            self.stdout.write(f"{line}  {details}")
@@ -0,0 +1,37 @@
+# Copyright 2025 Giorgio Gamba
+
+from django.core.management.base import BaseCommand, CommandError
+
+from diggerweb_backend.discogs_api.client import get_authenticated_client
+from diggerweb_backend.discogs_api.crawler import get_seller, next_snapshot_kind, run_snapshot
+from diggerweb_backend.discogs_api.models import InventorySnapshot
+from diggerweb_backend.discogs_api.utils import load_access_token
+
+# Crawls or syncs the inventory of the given sellers into local snapshots, in the foreground
+class Command(BaseCommand):
+    help = "Crawls the whole inventory of the given Discogs sellers into local snapshots"
+
+    def add_arguments(self, parser):
+        parser.add_argument('usernames', nargs='+')
+        parser.add_argument('--full', action='store_true', help="Always re-crawl the whole inventory instead of syncing the changes")
+
+    def handle(self, *args, **options):
+        access_token, access_secret = load_access_token()
+        if not access_token or not access_secret:
+            raise CommandError("Discogs authorization required, complete the OAuth flow first")
+
+        client = get_authenticated_client(access_token, access_secret)
+
+        for username in options['usernames']:
+            seller = get_seller(username)
+            kind = InventorySnapshot.KIND_FULL if options['full'] else next_snapshot_kind(seller)
+            snapshot = InventorySnapshot.objects.create(seller=seller, kind=kind)
+            try:
+                run_snapshot(client, snapshot)
+            except Exception as e:
+                snapshot.status = InventorySnapshot.STATUS_FAILED
+                snapshot.error = str(e)
+                snapshot.save(update_fields=['status', 'error', 'updated_at'])
+                raise CommandError(f"Crawl of {username} failed: {e}")
+
+            self.stdout.write(self.style.SUCCESS(f"{username}: {snapshot.items_done} listings saved"))
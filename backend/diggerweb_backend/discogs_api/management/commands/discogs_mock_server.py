@@ -0,0 +1,59 @@
+# Copyright 2025 Giorgio Gamba
+
+from django.core.management.base import BaseCommand, CommandError
+
+from diggerweb_backend.discogs_api.benchmark.fixtures import generate_fixture, load_fixture, parse_sellers, save_fixture
+from diggerweb_backend.discogs_api.benchmark.mock_server import MockDiscogsServer
+
+# Mock server options shared with benchmark_search
+def add_mock_server_arguments(parser):
+    parser.add_argument('--fixture', help="Replay this fixture (recorded or generated) instead of generating one")
+    parser.add_argument('--sellers', nargs='+', default=['benchmark:2000'], help="Synthetic inventories to generate, as username:listings")
+    parser.add_argument('--overlap', type=float, default=0.0, help="Fraction of releases each generated seller shares with the previous one")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--latency', type=float, default=50.0, help="Latency of every response, in milliseconds")
+    parser.add_argument('--jitter', type=float, default=0.0, help="Random variation of the latency, in milliseconds")
+    parser.add_argument('--rate-limit', type=int, default=6000, help="Requests per minute before answering 429")
+    parser.add_argument('--throttle', type=float, default=0.0, help="Probability of a random 429 on any request")
+
+def build_fixture(options):
+    try:
+        if options['fixture']:
+            return load_fixture(options['fixture'])
+        return generate_fixture(parse_sellers(options['sellers']), seed=options['seed'], overlap=options['overlap'])
+    except (OSError, ValueError) as e:
+        raise CommandError(str(e))
+
+def build_server(fixture, options, host='127.0.0.1', port=0):
+    return MockDiscogsServer(fixture, host=host, port=port,
+                             latency=options['latency'] / 1000, jitter=options['jitter'] / 1000,
+                             rate_limit=options['rate_limit'], throttle_probability=options['throttle'], seed=options['seed'])
+
+# Serves a fixture as a local stand-in of the Discogs API, so that the backend can run against it
+# (DISCOGS_API_BASE_URL=http://127.0.0.1:<port>) without spending the real rate budget
+class Command(BaseCommand):
+    help = "Runs a local stand-in of the Discogs API replaying a recorded or synthetic fixture"
+
+    def add_arguments(self, parser):
+        add_mock_server_arguments(parser)
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--save-fixture', help="Write the fixture to this file and exit")
+
+    def handle(self, *args, **options):
+        fixture = build_fixture(options)
+
+        if options['save_fixture']:
+            save_fixture(fixture, options['save_fixture'])
+            self.stdout.write(self.style.SUCCESS(f"Fixture saved to {options['save_fixture']}"))
+            return
+
+        server = build_server(fixture, options, host=options['host'], port=options['port'])
+        sellers = ', '.join(f"{username} ({len(listings)})" for username, listings in fixture['inventories'].items())
+        self.stdout.write(f"Mock Discogs API listening on {server.base_url}, sellers: {sellers}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.httpd.server_close()
@@ -0,0 +1,43 @@
+# Copyright 2025 Giorgio Gamba
+
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from diggerweb_backend.discogs_api.dumps import DEFAULT_BATCH_SIZE, import_dump
+
+# Imports Discogs monthly data dumps (https://data.discogs.com) into the local release, artist and label
+# tables. Interrupted imports resume from the last committed batch when run again on the same file
+class Command(BaseCommand):
+    help = "Imports Discogs releases, artists or labels XML dumps (optionally gzipped) into the local tables"
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help="Dump files, e.g. discogs_20250101_releases.xml.gz")
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help="Records saved per transaction")
+        parser.add_argument('--restart', action='store_true', help="Import the files from the beginning, ignoring the saved progress")
+        parser.add_argument('--progress-every', type=int, default=100000, help="Records between two progress lines")
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size must be positive")
+
+        for path in options['paths']:
+            if not os.path.isfile(path):
+                raise CommandError(f"{path} does not exist")
+
+            start = time.monotonic()
+            reported = [0]
+
+            def progress(dump_import):
+                if dump_import.records_done - reported[0] >= options['progress_every']:
+                    reported[0] = dump_import.records_done
+                    rate = dump_import.records_done / max(time.monotonic() - start, 0.001)
+                    self.stdout.write(f"{dump_import.file_name}: {dump_import.records_done} records ({rate:.0f}/s)")
+
+            try:
+                dump_import = import_dump(path, batch_size=options['batch_size'], restart=options['restart'], progress=progress)
+            except Exception as e:
+                raise CommandError(f"Import of {path} failed: {e}")
+
+            self.stdout.write(self.style.SUCCESS(f"{dump_import.file_name}: {dump_import.records_done} {dump_import.kind} imported in {time.monotonic() - start:.1f}s"))
@@ -0,0 +1,27 @@
+# Copyright 2025 Giorgio Gamba
+
+from django.core.management.base import BaseCommand
+
+from diggerweb_backend.discogs_api.history import prune_history
+from diggerweb_backend.discogs_api.jobs import prune_jobs
+from diggerweb_backend.discogs_api.offers import prune_offers
+from diggerweb_backend.discogs_api.singleflight import prune_shared_files
+
+# Applies the retention and downsampling policies of the price history, drops the offers not seen
+# for too long, the old finished jobs and the expired coalescing files of this machine, meant to run
+# daily (e.g. from cron)
+class Command(BaseCommand):
+    help = "Downsamples and expires the price and availability history, the known offers, the finished jobs and the coalescing files"
+
+    def handle(self, *args, **options):
+        deleted = prune_history()
+        self.stdout.write(self.style.SUCCESS(f"{deleted} history points deleted"))
+
+        deleted = prune_offers()
+        self.stdout.write(self.style.SUCCESS(f"{deleted} expired offers deleted"))
+
+        deleted = prune_jobs()
+        self.stdout.write(self.style.SUCCESS(f"{deleted} finished jobs deleted"))
+
+        deleted = prune_shared_files()
+        self.stdout.write(self.style.SUCCESS(f"{deleted} expired coalescing files deleted"))
@@ -0,0 +1,70 @@
+# Copyright 2025 Giorgio Gamba
+
+import os
+import signal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from diggerweb_backend.discogs_api.jobs import JobWorker
+from diggerweb_backend.discogs_api.watchlist import JOB_HANDLERS, schedule_due_refreshes
+
+# Runs the background jobs: the periodic refreshes of the watched sellers and whatever else is queued.
+# Any number of these can run, on one or more machines sharing the database: every job is run once.
+# SIGTERM or SIGINT stop claiming jobs and exit once the running ones are done
+class Command(BaseCommand):
+    help = "Runs the worker of the background jobs queue (watched sellers refreshes)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=None, help="Jobs run in parallel by every process")
+        parser.add_argument('--processes', type=int, default=1, help="Worker processes to fork (not on Windows)")
+        parser.add_argument('--poll-interval', type=float, default=None, help="Seconds between two polls of an idle queue")
+        parser.add_argument('--once', action='store_true', help="Schedule and run the due jobs, then exit")
+
+    def handle(self, *args, **options):
+        if options['threads'] is not None and options['threads'] < 1:
+            raise CommandError("--threads must be positive")
+        if options['processes'] < 1:
+            raise CommandError("--processes must be positive")
+        if options['processes'] > 1 and (options['once'] or not hasattr(os, 'fork')):
+            raise CommandError("--processes needs fork() and can't be used with --once")
+
+        if options['processes'] == 1:
+            self.run_worker(options)
+            return
+
+        # Children must open their own DB connections
+        connections.close_all()
+        children = []
+        for _ in range(options['processes']):
+            pid = os.fork()
+            if pid == 0:
+                try:
+                    self.run_worker(options)
+                finally:
+                    os._exit(0)
+            children.append(pid)
+
+        def forward(signum, frame):
+            for pid in children:
+                try:
+                    os.kill(pid, signum)
+                except ProcessLookupError:
+                    pass
+
+        signal.signal(signal.SIGTERM, forward)
+        signal.signal(signal.SIGINT, forward)
+        for pid in children:
+            os.waitpid(pid, 0)
+
+    def run_worker(self, options):
+        worker = JobWorker(JOB_HANDLERS, threads=options['threads'], schedule=schedule_due_refreshes, poll_interval=options['poll_interval'])
+
+        def stop(signum, frame):
+            worker.stop()
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        worker.run(until_idle=options['once'])
+        self.stdout.write(self.style.SUCCESS(f"Job worker {worker.worker_id} stopped"))
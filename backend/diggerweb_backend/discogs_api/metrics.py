@@ -0,0 +1,294 @@
+# Copyright 2025 Giorgio Gamba
+
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+from django.conf import settings
+
+from .constants import HTTP_TOO_MANY_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the duration histogram buckets, in seconds
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Phases of a request
+PHASE_CREDENTIALS = 'credentials'
+PHASE_IDENTITY = 'identity'
+PHASE_INVENTORY = 'inventory'
+PHASE_STATS = 'stats'
+PHASE_WANTLIST = 'wantlist'
+PHASE_THROTTLE = 'throttle'
+
+# Name -> (type, help) of every metric, in exposition order
+METRICS_HELP = {
+    'discogs_requests_total': ('counter', "Requests served, by view and status code"),
+    'discogs_request_seconds': ('histogram', "Duration of the requests, by view"),
+    'discogs_phase_seconds': ('histogram', "Time spent in each phase of the requests"),
+    'discogs_upstream_calls_total': ('counter', "Calls made to the Discogs API, by endpoint and status code"),
+    'discogs_upstream_call_seconds': ('histogram', "Duration of the calls made to the Discogs API, by endpoint"),
+    'discogs_upstream_throttled_total': ('counter', "429 responses received from the Discogs API, by endpoint"),
+    'discogs_throttle_wait_seconds': ('histogram', "Time spent waiting for the rate limiter before a call, by priority"),
+    'discogs_stats_cache_total': ('counter', "Marketplace stats lookups, by result (memory_hit, db_hit, miss)"),
+    'discogs_stats_stale_total': ('counter', "Stale marketplace stats served while being refreshed in background"),
+    'discogs_ratelimit_remaining': ('gauge', "Calls left in the shared rate limit budget, by token"),
+    'discogs_ratelimit_capacity': ('gauge', "Size of the shared rate limit budget, by token"),
+    'discogs_credentials': ('gauge', "Authorized Discogs accounts in the credentials pool, by state (active, revoked)"),
+}
+
+def _labels_key(labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+# Process wide counters and histograms. Every process saves its values to DISCOGS_METRICS_DIR at most every
+# DISCOGS_METRICS_FLUSH_INTERVAL seconds, and the metrics endpoint adds up the files of the live processes,
+# so whichever worker gets the scrape reports the whole server
+class Metrics:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # (name, labels key) -> value
+        self.counters = {}
+        # (name, labels key) -> [count per bucket, sum, count]
+        self.histograms = {}
+        self.flushed_at = 0.0
+
+    def inc(self, name, value=1, **labels):
+        key = (name, _labels_key(labels))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+        self.flush()
+
+    def observe(self, name, value, **labels):
+        key = (name, _labels_key(labels))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = [[0] * len(DURATION_BUCKETS), 0.0, 0]
+                self.histograms[key] = histogram
+            for index, bound in enumerate(DURATION_BUCKETS):
+                if value <= bound:
+                    histogram[0][index] += 1
+                    break
+            histogram[1] += value
+            histogram[2] += 1
+        self.flush()
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'counters': [[name, list(labels), value] for (name, labels), value in self.counters.items()],
+                'histograms': [[name, list(labels), list(buckets), total, count] for (name, labels), (buckets, total, count) in self.histograms.items()],
+            }
+
+    def flush(self, force=False):
+        now = time.monotonic()
+        with self.lock:
+            if not force and now - self.flushed_at < settings.DISCOGS_METRICS_FLUSH_INTERVAL:
+                return
+            self.flushed_at = now
+
+        path = os.path.join(_metrics_dir(), f"{os.getpid()}.json")
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'w') as metrics_file:
+                json.dump(self.snapshot(), metrics_file)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning("Error while saving metrics: %s", e)
+
+    def clear(self):
+        with self.lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+METRICS = Metrics()
+
+def _metrics_dir():
+    os.makedirs(settings.DISCOGS_METRICS_DIR, exist_ok=True)
+    return settings.DISCOGS_METRICS_DIR
+
+def _process_alive(pid):
+    # On Windows signal 0 is CTRL_C_EVENT, only the own file can be trusted there
+    if os.name != 'posix':
+        return pid == os.getpid()
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        # Exists, but belongs to someone else
+        return True
+    return True
+
+# Sums the values saved by all the live processes. The files of the dead ones are removed: their counters
+# disappear as it happens on a restart, which Prometheus handles as a reset
+def collect():
+    METRICS.flush(force=True)
+
+    counters = {}
+    histograms = {}
+    metrics_dir = _metrics_dir()
+
+    for file_name in os.listdir(metrics_dir):
+        pid, extension = os.path.splitext(file_name)
+        if extension != '.json' or not pid.isdigit():
+            continue
+
+        path = os.path.join(metrics_dir, file_name)
+        if not _process_alive(int(pid)):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            continue
+
+        try:
+            with open(path) as metrics_file:
+                data = json.load(metrics_file)
+        except (OSError, ValueError):
+            continue
+
+        for name, labels, value in data['counters']:
+            key = (name, tuple(tuple(label) for label in labels))
+            counters[key] = counters.get(key, 0) + value
+
+        for name, labels, buckets, total, count in data['histograms']:
+            key = (name, tuple(tuple(label) for label in labels))
+            merged = histograms.setdefault(key, [[0] * len(DURATION_BUCKETS), 0.0, 0])
+            merged[0] = [a + b for a, b in zip(merged[0], buckets)]
+            merged[1] += total
+            merged[2] += count
+
+    return counters, histograms
+
+def _format_labels(labels, extra=()):
+    labels = list(labels) + list(extra)
+    if not labels:
+        return ''
+    escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + '}'
+
+# Prometheus text exposition format (version 0.0.4). gauges is a list of (name, labels dict, value)
+def render_prometheus(counters, histograms, gauges=()):
+    samples = {name: [] for name in METRICS_HELP}
+
+    for (name, labels), value in sorted(counters.items()):
+        samples.setdefault(name, []).append(f"{name}{_format_labels(labels)} {value}")
+
+    for (name, labels), (buckets, total, count) in sorted(histograms.items()):
+        lines = samples.setdefault(name, [])
+        cumulative = 0
+        for bound, bucket_count in zip(DURATION_BUCKETS, buckets):
+            cumulative += bucket_count
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', str(bound))])} {cumulative}")
+        lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {count}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+        lines.append(f"{name}_count{_format_labels(labels)} {count}")
+
+    for name, labels, value in gauges:
+        samples.setdefault(name, []).append(f"{name}{_format_labels(_labels_key(labels))} {value}")
+
+    output = []
+    for name, lines in samples.items():
+        if not lines:
+            continue
+        metric_type, help_text = METRICS_HELP.get(name, ('untyped', ''))
+        output.append(f"# HELP {name} {help_text}")
+        output.append(f"# TYPE {name} {metric_type}")
+        output.extend(lines)
+
+    return '\n'.join(output) + '\n'
+
+# Timing of the current request, phase -> seconds. Phases running in parallel (stats lookups, throttling
+# of the pool threads) are added up, so their total can exceed the duration of the request
+class RequestTiming:
+
+    def __init__(self, view):
+        self.view = view
+        self.lock = threading.Lock()
+        self.phases = {}
+        self.status = None
+        self.duration = None
+
+    def add(self, phase, seconds):
+        with self.lock:
+            self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    # Value of the Server-Timing header, shown by the browser developer tools
+    def server_timing(self):
+        with self.lock:
+            phases = list(self.phases.items())
+        if self.duration is not None:
+            phases.append(('total', self.duration))
+        return ', '.join(f"{phase};dur={seconds * 1000:.1f}" for phase, seconds in phases)
+
+_request_timing = contextvars.ContextVar('discogs_request_timing', default=None)
+
+# Times the block as a request of the given view: its phases are collected in the yielded RequestTiming,
+# whose status must be set by the caller
+@contextmanager
+def request_timing(view):
+    timing = RequestTiming(view)
+    reset_token = _request_timing.set(timing)
+    start = time.perf_counter()
+    try:
+        yield timing
+    finally:
+        timing.duration = time.perf_counter() - start
+        _request_timing.reset(reset_token)
+
+        status_code = timing.status or 500
+        METRICS.inc('discogs_requests_total', view=view, status=status_code)
+        METRICS.observe('discogs_request_seconds', timing.duration, view=view)
+
+        fields = {f"{phase}_ms": round(seconds * 1000, 1) for phase, seconds in timing.phases.items()}
+        logger.info("Request completed", extra={'view': view, 'status': status_code,
+                                                'duration_ms': round(timing.duration * 1000, 1), **fields})
+
+def record_phase(phase, seconds):
+    METRICS.observe('discogs_phase_seconds', seconds, phase=phase)
+    timing = _request_timing.get()
+    if timing is not None:
+        timing.add(phase, seconds)
+
+@contextmanager
+def timed(phase):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_phase(phase, time.perf_counter() - start)
+
+def _endpoint(url):
+    path = urlparse(url).path
+    if '/marketplace/stats/' in path:
+        return 'stats'
+    if '/inventory' in path:
+        return 'inventory'
+    if path.endswith('/wants'):
+        return 'wants'
+    if path.endswith('/oauth/identity'):
+        return 'identity'
+    if '/oauth/' in path:
+        return 'oauth'
+    return 'other'
+
+def record_upstream_call(url, status_code, seconds):
+    endpoint = _endpoint(url)
+    METRICS.inc('discogs_upstream_calls_total', endpoint=endpoint, status=status_code)
+    METRICS.observe('discogs_upstream_call_seconds', seconds, endpoint=endpoint)
+    if status_code == HTTP_TOO_MANY_REQUESTS:
+        METRICS.inc('discogs_upstream_throttled_total', endpoint=endpoint)
+
+def record_throttle_wait(seconds, priority):
+    METRICS.observe('discogs_throttle_wait_seconds', seconds, priority=priority)
+    if seconds > 0:
+        timing = _request_timing.get()
+        if timing is not None:
+            timing.add(PHASE_THROTTLE, seconds)
@@ -0,0 +1,26 @@
+# Generated by Django 3.2.25 on 2026-10-17 00:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('discogs_api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MarketplaceStats',
+            fields=[
+                ('release_id', models.PositiveIntegerField(primary_key=True, serialize=False)),
+                ('num_for_sale', models.PositiveIntegerField(null=True)),
+                ('lowest_price', models.DecimalField(decimal_places=2, max_digits=12, null=True)),
+                ('currency', models.CharField(blank=True, max_length=3)),
+                ('fetched_at', models.DateTimeField(db_index=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Marketplace Stats',
+            },
+        ),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 3.2.25 on 2026-10-17 00:25
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('discogs_api', '0002_marketplacestats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InventorySnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('running', 'Running'), ('complete', 'Complete'), ('failed', 'Failed')], default='running', max_length=16)),
+                ('pages_total', models.PositiveIntegerField(default=0)),
+                ('pages_done', models.PositiveIntegerField(default=0)),
+                ('items_total', models.PositiveIntegerField(default=0)),
+                ('items_done', models.PositiveIntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('finished_at', models.DateTimeField(null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Seller',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('username', models.CharField(max_length=255, unique=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Listing',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('listing_id', models.BigIntegerField(unique=True)),
+                ('release_id', models.PositiveIntegerField(db_index=True)),
+                ('title', models.CharField(blank=True, max_length=512)),
+                ('artist', models.CharField(blank=True, max_length=512)),
+                ('url', models.CharField(blank=True, max_length=512)),
+                ('price', models.DecimalField(decimal_places=2, max_digits=12, null=True)),
+                ('currency', models.CharField(blank=True, max_length=3)),
+                ('condition', models.CharField(blank=True, max_length=64)),
+                ('sleeve_condition', models.CharField(blank=True, max_length=64)),
+                ('status', models.CharField(blank=True, max_length=32)),
+                ('num_for_sale', models.PositiveIntegerField(null=True)),
+                ('stats_error', models.CharField(blank=True, max_length=255)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('seller', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='listings', to='discogs_api.seller')),
+                ('snapshot', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='listings', to='discogs_api.inventorysnapshot')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='inventorysnapshot',
+            name='seller',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='discogs_api.seller'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['seller', 'status', 'num_for_sale', 'listing_id'], name='discogs_api_seller__46157c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='inventorysnapshot',
+            index=models.Index(fields=['seller', 'status', 'finished_at'], name='discogs_api_seller__37bc77_idx'),
+        ),
+    ]
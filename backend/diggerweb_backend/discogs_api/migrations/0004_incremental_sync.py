@@ -0,0 +1,23 @@
+# Generated by Django 3.2.25 on 2026-10-17 00:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('discogs_api', '0003_inventory_snapshots'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inventorysnapshot',
+            name='kind',
+            field=models.CharField(choices=[('full', 'Full crawl'), ('incremental', 'Incremental sync')], default='full', max_length=16),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='removed_at',
+            field=models.DateTimeField(null=True),
+        ),
+    ]
@@ -0,0 +1,82 @@
+# Generated by Django 3.2.25 on 2026-10-17 00:43
+
+from django.db import migrations, models
+from django.db.models import F, FloatField, OuterRef, Subquery, Value
+from django.db.models.functions import Cast, Coalesce
+
+# Copy of listings.CONDITION_RANKS at the time of the migration
+CONDITION_RANKS = {
+    'Mint (M)': 8,
+    'Near Mint (NM or M-)': 7,
+    'Very Good Plus (VG+)': 6,
+    'Very Good (VG)': 5,
+    'Good Plus (G+)': 4,
+    'Good (G)': 3,
+    'Fair (F)': 2,
+    'Poor (P)': 1,
+}
+
+# Fills the new columns of the listings already in the snapshots
+def backfill_listing_filters(apps, schema_editor):
+    Listing = apps.get_model('discogs_api', 'Listing')
+    MarketplaceStats = apps.get_model('discogs_api', 'MarketplaceStats')
+
+    for grade, rank in CONDITION_RANKS.items():
+        Listing.objects.filter(condition=grade).update(condition_rank=rank)
+        Listing.objects.filter(sleeve_condition=grade).update(sleeve_condition_rank=rank)
+
+    stats = MarketplaceStats.objects.filter(release_id=OuterRef('release_id'))
+    Listing.objects.update(
+        lowest_price=Subquery(stats.values('lowest_price')[:1]),
+        lowest_price_currency=Coalesce(Subquery(stats.values('currency')[:1]), Value('')),
+    )
+    Listing.objects.filter(price__isnull=False, lowest_price__gt=0, currency=F('lowest_price_currency')).update(
+        price_ratio=Cast('price', FloatField()) / Cast('lowest_price', FloatField()))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('discogs_api', '0004_incremental_sync'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listing',
+            name='condition_rank',
+            field=models.PositiveSmallIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='lowest_price',
+            field=models.DecimalField(decimal_places=2, max_digits=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='lowest_price_currency',
+            field=models.CharField(blank=True, max_length=3),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='price_ratio',
+            field=models.FloatField(null=True),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='sleeve_condition_rank',
+            field=models.PositiveSmallIntegerField(null=True),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['seller', 'status', 'price', 'listing_id'], name='discogs_api_seller__57e4a5_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['seller', 'status', 'price_ratio', 'listing_id'], name='discogs_api_seller__75739c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['seller', 'status', 'listing_id'], name='discogs_api_seller__cc58f9_idx'),
+        ),
+        migrations.RunPython(backfill_listing_filters, migrations.RunPython.noop),
+    ]
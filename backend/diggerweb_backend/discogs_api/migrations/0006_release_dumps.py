@@ -0,0 +1,64 @@
+# Generated by Django 3.2.25 on 2026-10-17 00:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('discogs_api', '0005_listing_filters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Artist',
+            fields=[
+                ('artist_id', models.PositiveIntegerField(primary_key=True, serialize=False)),
+                ('name', models.CharField(db_index=True, max_length=255)),
+                ('realname', models.CharField(blank=True, max_length=255)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DumpImport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file_name', models.CharField(max_length=255)),
+                ('file_size', models.BigIntegerField()),
+                ('kind', models.CharField(max_length=16)),
+                ('status', models.CharField(choices=[('running', 'Running'), ('complete', 'Complete'), ('failed', 'Failed')], default='running', max_length=16)),
+                ('records_done', models.PositiveIntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('finished_at', models.DateTimeField(null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Label',
+            fields=[
+                ('label_id', models.PositiveIntegerField(primary_key=True, serialize=False)),
+                ('name', models.CharField(db_index=True, max_length=255)),
+                ('parent_id', models.PositiveIntegerField(null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Release',
+            fields=[
+                ('release_id', models.PositiveIntegerField(primary_key=True, serialize=False)),
+                ('title', models.CharField(blank=True, max_length=512)),
+                ('artist', models.CharField(blank=True, max_length=512)),
+                ('master_id', models.PositiveIntegerField(db_index=True, null=True)),
+                ('year', models.PositiveSmallIntegerField(null=True)),
+                ('country', models.CharField(blank=True, max_length=64)),
+                ('formats', models.CharField(blank=True, max_length=512)),
+                ('labels', models.CharField(blank=True, max_length=512)),
+                ('catno', models.CharField(blank=True, max_length=255)),
+                ('genres', models.CharField(blank=True, max_length=255)),
+                ('styles', models.CharField(blank=True, max_length=512)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='dumpimport',
+            constraint=models.UniqueConstraint(fields=('file_name', 'file_size'), name='unique_dump_file'),
+        ),
+    ]
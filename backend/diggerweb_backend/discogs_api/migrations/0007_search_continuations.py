@@ -0,0 +1,26 @@
+# Generated by Django 3.2.25 on 2026-10-17 00:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('discogs_api', '0006_release_dumps'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchContinuation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=32, unique=True)),
+                ('username', models.CharField(max_length=255)),
+                ('page_num', models.PositiveIntegerField()),
+                ('items_per_page', models.PositiveIntegerField()),
+                ('listings', models.JSONField()),
+                ('pagination', models.JSONField()),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 3.2.25 on 2026-10-17 00:54
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('discogs_api', '0007_search_continuations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ListingPriceHistory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('listing_id', models.BigIntegerField()),
+                ('release_id', models.PositiveIntegerField()),
+                ('hour', models.PositiveIntegerField()),
+                ('price', models.DecimalField(decimal_places=2, max_digits=12, null=True)),
+                ('currency', models.CharField(blank=True, max_length=3)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ReleaseStatsHistory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('release_id', models.PositiveIntegerField()),
+                ('hour', models.PositiveIntegerField()),
+                ('num_for_sale', models.PositiveIntegerField(null=True)),
+                ('lowest_price', models.DecimalField(decimal_places=2, max_digits=12, null=True)),
+                ('currency', models.CharField(blank=True, max_length=3)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='releasestatshistory',
+            index=models.Index(fields=['hour'], name='discogs_api_hour_80603c_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='releasestatshistory',
+            constraint=models.UniqueConstraint(fields=('release_id', 'hour'), name='unique_release_stats_hour'),
+        ),
+        migrations.AddField(
+            model_name='listingpricehistory',
+            name='seller',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='price_history', to='discogs_api.seller'),
+        ),
+        migrations.AddIndex(
+            model_name='listingpricehistory',
+            index=models.Index(fields=['seller', 'hour'], name='discogs_api_seller__1fdd23_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listingpricehistory',
+            index=models.Index(fields=['hour'], name='discogs_api_hour_c4460e_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='listingpricehistory',
+            constraint=models.UniqueConstraint(fields=('listing_id', 'hour'), name='unique_listing_price_hour'),
+        ),
+    ]
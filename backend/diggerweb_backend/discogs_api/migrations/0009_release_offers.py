@@ -0,0 +1,37 @@
+# Generated by Django 3.2.25 on 2026-10-17 00:55
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('discogs_api', '0008_price_history'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReleaseOffer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('listing_id', models.BigIntegerField(unique=True)),
+                ('release_id', models.PositiveIntegerField()),
+                ('price', models.DecimalField(decimal_places=2, max_digits=12, null=True)),
+                ('currency', models.CharField(blank=True, max_length=3)),
+                ('condition', models.CharField(blank=True, max_length=64)),
+                ('condition_rank', models.PositiveSmallIntegerField(null=True)),
+                ('url', models.CharField(blank=True, max_length=512)),
+                ('seen_at', models.DateTimeField()),
+                ('seller', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='offers', to='discogs_api.seller')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='releaseoffer',
+            index=models.Index(fields=['release_id', 'currency', 'price'], name='discogs_api_release_e1bf12_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='releaseoffer',
+            index=models.Index(fields=['seen_at'], name='discogs_api_seen_at_60d106_idx'),
+        ),
+    ]
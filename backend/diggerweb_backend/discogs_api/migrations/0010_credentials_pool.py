@@ -0,0 +1,23 @@
+# Generated by Django 3.2.25 on 2026-10-17 01:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('discogs_api', '0009_release_offers'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='discogscredentials',
+            name='revoked_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='discogscredentials',
+            name='username',
+            field=models.CharField(blank=True, db_index=True, max_length=255),
+        ),
+    ]
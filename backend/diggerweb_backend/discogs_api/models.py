@@ -1,19 +1,386 @@
 # Copyright 2025 Giorgio Gamba
 
 from django.db import models
+from django.utils import timezone
 
-# Database model for authenticazione keys storage
+# Database model for authenticazione keys storage. Every authorized Discogs account adds a row to the pool
+# of credentials: upstream calls are spread over the accounts, each with its own rate limit budget
 
 class DiscogsCredentials(models.Model):
     # Assumes 8 byte unique tokens
     access_token = models.CharField(max_length=255, unique=True)
     access_secret = models.CharField(max_length=255)
 
+    # Discogs account of the token: authorizing the same account again replaces its token
+    username = models.CharField(max_length=255, blank=True, db_index=True)
+
     # When the class is instantied, then this is the time the keys are saved
     last_updated = models.DateTimeField(auto_now=True)
 
+    # Set when Discogs rejects the token (401, confirmed by the identity call): revoked tokens leave the pool until authorized again
+    revoked_at = models.DateTimeField(null=True, blank=True)
+
     def __str__(self):
-        return f"Discog Credentials (Updated: {self.last_updated})"
+        return f"Discog Credentials {self.username or self.pk} (Updated: {self.last_updated})"
     
     class Meta:
         verbose_name_plural = "Discogs Credentials"
+
+
+# Cached result of /marketplace/stats/{release_id}, shared by every worker process
+class MarketplaceStats(models.Model):
+    release_id = models.PositiveIntegerField(primary_key=True)
+    num_for_sale = models.PositiveIntegerField(null=True)
+    lowest_price = models.DecimalField(max_digits=12, decimal_places=2, null=True)
+    currency = models.CharField(max_length=3, blank=True)
+
+    # Time of the upstream call, used to compute the entry age against the configured TTL
+    fetched_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"Marketplace stats for release {self.release_id} (Fetched: {self.fetched_at})"
+
+    class Meta:
+        verbose_name_plural = "Marketplace Stats"
+
+
+# Discogs seller whose inventory is crawled into local snapshots
+class Seller(models.Model):
+    username = models.CharField(max_length=255, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.username
+
+# One crawl run over the whole inventory of a seller
+class InventorySnapshot(models.Model):
+    STATUS_RUNNING = 'running'
+    STATUS_COMPLETE = 'complete'
+    STATUS_FAILED = 'failed'
+
+    STATUS_CHOICES = [
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_COMPLETE, 'Complete'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    KIND_FULL = 'full'
+    KIND_INCREMENTAL = 'incremental'
+
+    KIND_CHOICES = [
+        (KIND_FULL, 'Full crawl'),
+        (KIND_INCREMENTAL, 'Incremental sync'),
+    ]
+
+    seller = models.ForeignKey(Seller, on_delete=models.CASCADE, related_name='snapshots')
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_RUNNING)
+    kind = models.CharField(max_length=16, choices=KIND_CHOICES, default=KIND_FULL)
+
+    # Crawl progress
+    pages_total = models.PositiveIntegerField(default=0)
+    pages_done = models.PositiveIntegerField(default=0)
+    items_total = models.PositiveIntegerField(default=0)
+    items_done = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+
+    started_at = models.DateTimeField(auto_now_add=True)
+    # Touched on every crawled page, used to detect crawls interrupted by a worker restart
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True)
+
+    def __str__(self):
+        return f"Snapshot of {self.seller} ({self.kind}, {self.status}, {self.pages_done}/{self.pages_total} pages)"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['seller', 'status', 'finished_at']),
+        ]
+
+# Local copy of a marketplace listing, enriched with the marketplace stats of its release
+class Listing(models.Model):
+    # Discogs listing IDs are already beyond the 32 bit range
+    listing_id = models.BigIntegerField(unique=True)
+    seller = models.ForeignKey(Seller, on_delete=models.CASCADE, related_name='listings')
+    # Last snapshot in which the listing has been seen
+    snapshot = models.ForeignKey(InventorySnapshot, on_delete=models.SET_NULL, null=True, related_name='listings')
+
+    release_id = models.PositiveIntegerField(db_index=True)
+    title = models.CharField(max_length=512, blank=True)
+    artist = models.CharField(max_length=512, blank=True)
+    url = models.CharField(max_length=512, blank=True)
+
+    price = models.DecimalField(max_digits=12, decimal_places=2, null=True)
+    currency = models.CharField(max_length=3, blank=True)
+    condition = models.CharField(max_length=64, blank=True)
+    sleeve_condition = models.CharField(max_length=64, blank=True)
+    status = models.CharField(max_length=32, blank=True)
+
+    # Ranks of the grades (see listings.CONDITION_RANKS), for the condition floor filters
+    condition_rank = models.PositiveSmallIntegerField(null=True)
+    sleeve_condition_rank = models.PositiveSmallIntegerField(null=True)
+
+    num_for_sale = models.PositiveIntegerField(null=True)
+    lowest_price = models.DecimalField(max_digits=12, decimal_places=2, null=True)
+    lowest_price_currency = models.CharField(max_length=3, blank=True)
+    # price / lowest_price, only when both are in the same currency
+    price_ratio = models.FloatField(null=True)
+    stats_error = models.CharField(max_length=255, blank=True)
+
+    updated_at = models.DateTimeField(auto_now=True)
+    # Set when the listing disappears from the seller inventory (sold or removed, Discogs doesn't tell)
+    removed_at = models.DateTimeField(null=True)
+
+    def __str__(self):
+        return f"Listing {self.listing_id} of {self.seller} (release {self.release_id})"
+
+    # Same shape as the items built from the live Discogs responses
+    def to_item(self):
+        item_data = {
+            'url': self.url,
+            'release_id': self.release_id,
+            'title': self.title,
+            'artist': self.artist,
+            'num_for_sale': self.num_for_sale,
+            'lowest_price': float(self.lowest_price) if self.lowest_price is not None else None,
+            'lowest_price_currency': self.lowest_price_currency or None,
+            'price': float(self.price) if self.price is not None else None,
+            'currency': self.currency,
+            'condition': self.condition,
+            'sleeve_condition': self.sleeve_condition,
+            'id': self.listing_id,
+            'status': self.status
+        }
+
+        if self.stats_error:
+            item_data['stats_error'] = self.stats_error
+
+        return item_data
+
+    class Meta:
+        indexes = [
+            # Globally sorted pages of a seller ("rarest items first")
+            models.Index(fields=['seller', 'status', 'num_for_sale', 'listing_id']),
+            # Keyset pages of the other sort keys (see filters.SORT_FIELDS)
+            models.Index(fields=['seller', 'status', 'price', 'listing_id']),
+            models.Index(fields=['seller', 'status', 'price_ratio', 'listing_id']),
+            models.Index(fields=['seller', 'status', 'listing_id']),
+        ]
+
+# Release metadata imported from the Discogs monthly data dumps (see dumps.py). Multi-valued fields are
+# stored as comma separated strings, in the same format of the items returned to the frontend
+class Release(models.Model):
+    release_id = models.PositiveIntegerField(primary_key=True)
+    title = models.CharField(max_length=512, blank=True)
+    artist = models.CharField(max_length=512, blank=True)
+    master_id = models.PositiveIntegerField(null=True, db_index=True)
+    year = models.PositiveSmallIntegerField(null=True)
+    country = models.CharField(max_length=64, blank=True)
+    formats = models.CharField(max_length=512, blank=True)
+    labels = models.CharField(max_length=512, blank=True)
+    catno = models.CharField(max_length=255, blank=True)
+    genres = models.CharField(max_length=255, blank=True)
+    styles = models.CharField(max_length=512, blank=True)
+
+    def __str__(self):
+        return f"{self.artist} - {self.title} ({self.release_id})"
+
+    # Fields added to the items of the release
+    def details(self):
+        return {
+            'year': self.year,
+            'country': self.country,
+            'formats': self.formats,
+            'labels': self.labels,
+            'catno': self.catno,
+            'genres': self.genres,
+            'styles': self.styles,
+        }
+
+class Artist(models.Model):
+    artist_id = models.PositiveIntegerField(primary_key=True)
+    name = models.CharField(max_length=255, db_index=True)
+    realname = models.CharField(max_length=255, blank=True)
+
+    def __str__(self):
+        return self.name
+
+class Label(models.Model):
+    label_id = models.PositiveIntegerField(primary_key=True)
+    name = models.CharField(max_length=255, db_index=True)
+    parent_id = models.PositiveIntegerField(null=True)
+
+    def __str__(self):
+        return self.name
+
+# Progress of the import of a data dump file, committed with every batch so that an interrupted import
+# resumes where it stopped
+class DumpImport(models.Model):
+    STATUS_RUNNING = 'running'
+    STATUS_COMPLETE = 'complete'
+    STATUS_FAILED = 'failed'
+
+    STATUS_CHOICES = [
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_COMPLETE, 'Complete'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    # A dump file is recognized by its name and size
+    file_name = models.CharField(max_length=255)
+    file_size = models.BigIntegerField()
+    kind = models.CharField(max_length=16)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_RUNNING)
+
+    records_done = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+
+    started_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True)
+
+    def __str__(self):
+        return f"Import of {self.file_name} ({self.kind}, {self.status}, {self.records_done} records)"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['file_name', 'file_size'], name='unique_dump_file'),
+        ]
+
+# Live search page answered before all its stats were known. The raw listings are kept, so that the page
+# can be completed from the stats stored meanwhile by the background lookups, without calling Discogs again
+class SearchContinuation(models.Model):
+    token = models.CharField(max_length=32, unique=True)
+    username = models.CharField(max_length=255)
+    page_num = models.PositiveIntegerField()
+    items_per_page = models.PositiveIntegerField()
+    listings = models.JSONField()
+    pagination = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"Continuation of page {self.page_num} of {self.username} ({self.created_at})"
+
+# Marketplace stats observed for a release, append only (see history.py). Times are whole hours since the
+# epoch: one point per release and hour, then one per day once older than DISCOGS_HISTORY_RAW_DAYS
+class ReleaseStatsHistory(models.Model):
+    release_id = models.PositiveIntegerField()
+    hour = models.PositiveIntegerField()
+    num_for_sale = models.PositiveIntegerField(null=True)
+    lowest_price = models.DecimalField(max_digits=12, decimal_places=2, null=True)
+    currency = models.CharField(max_length=3, blank=True)
+
+    def __str__(self):
+        return f"Stats of release {self.release_id} at hour {self.hour}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['release_id', 'hour'], name='unique_release_stats_hour'),
+        ]
+        indexes = [
+            models.Index(fields=['hour']),
+        ]
+
+# Prices of the listings, append only: a point is only added when the price of the listing changes
+class ListingPriceHistory(models.Model):
+    listing_id = models.BigIntegerField()
+    seller = models.ForeignKey(Seller, on_delete=models.CASCADE, related_name='price_history')
+    release_id = models.PositiveIntegerField()
+    hour = models.PositiveIntegerField()
+    price = models.DecimalField(max_digits=12, decimal_places=2, null=True)
+    currency = models.CharField(max_length=3, blank=True)
+
+    def __str__(self):
+        return f"Price of listing {self.listing_id} at hour {self.hour}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['listing_id', 'hour'], name='unique_listing_price_hour'),
+        ]
+        indexes = [
+            models.Index(fields=['seller', 'hour']),
+            models.Index(fields=['hour']),
+        ]
+
+# Inverted index release -> listings known on the marketplace, of every seller crawled or searched (see
+# offers.py). Listings not seen again for DISCOGS_OFFERS_MAX_AGE are considered gone
+class ReleaseOffer(models.Model):
+    listing_id = models.BigIntegerField(unique=True)
+    release_id = models.PositiveIntegerField()
+    seller = models.ForeignKey(Seller, on_delete=models.CASCADE, related_name='offers')
+    price = models.DecimalField(max_digits=12, decimal_places=2, null=True)
+    currency = models.CharField(max_length=3, blank=True)
+    condition = models.CharField(max_length=64, blank=True)
+    condition_rank = models.PositiveSmallIntegerField(null=True)
+    url = models.CharField(max_length=512, blank=True)
+    seen_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"Listing {self.listing_id} of {self.seller} (release {self.release_id}, {self.price} {self.currency})"
+
+    class Meta:
+        indexes = [
+            # Cheapest offers of a release first
+            models.Index(fields=['release_id', 'currency', 'price']),
+            models.Index(fields=['seen_at']),
+        ]
+
+# Background job run by the run_jobs workers (see jobs.py). Workers claim due jobs with a lease: the job of a
+# worker that died is claimed again once its lease expires. At most one queued or running job per key
+class Job(models.Model):
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    ACTIVE_STATUSES = [STATUS_QUEUED, STATUS_RUNNING]
+
+    kind = models.CharField(max_length=64)
+    key = models.CharField(max_length=255)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+
+    run_after = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+
+    # Worker holding the job and end of its lease, extended while the job runs
+    locked_by = models.CharField(max_length=128, blank=True)
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Job {self.kind} {self.key} ({self.status}, attempt {self.attempts}/{self.max_attempts})"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['key'], condition=models.Q(status__in=['queued', 'running']), name='unique_active_job_key'),
+        ]
+        indexes = [
+            # Due jobs, and expired leases
+            models.Index(fields=['status', 'run_after']),
+            models.Index(fields=['status', 'lease_expires_at']),
+        ]
+
+# Seller dug regularly: the workers refresh its inventory snapshot and the marketplace stats of its listings
+# in background (see watchlist.py), so that searches find warm local data. Intervals default to the settings
+class WatchedSeller(models.Model):
+    seller = models.OneToOneField(Seller, on_delete=models.CASCADE, related_name='watch')
+    inventory_interval = models.PositiveIntegerField(null=True, blank=True)
+    stats_interval = models.PositiveIntegerField(null=True, blank=True)
+    next_inventory_at = models.DateTimeField(default=timezone.now, db_index=True)
+    next_stats_at = models.DateTimeField(default=timezone.now, db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Watched seller {self.seller}"
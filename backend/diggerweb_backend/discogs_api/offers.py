@@ -0,0 +1,102 @@
+# Copyright 2025 Giorgio Gamba
+
+import logging
+from datetime import timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .listings import INVENTORY_STATUS_FOR_SALE, condition_rank
+from .models import ReleaseOffer
+
+logger = logging.getLogger(__name__)
+
+OFFER_FIELDS = ['listing_id', 'release_id', 'seller__username', 'price', 'currency', 'condition', 'url', 'seen_at']
+
+def _truncate(value, max_length):
+    return (value or '')[:max_length]
+
+def _price(value):
+    try:
+        return Decimal(str(value)) if value is not None else None
+    except InvalidOperation:
+        return None
+
+# Adds the listings of the items (see listings.build_item) sold by the seller to the index, or refreshes them
+def record_offers(seller, items):
+    now = timezone.now()
+    offers = [ReleaseOffer(listing_id=item['id'], release_id=item['release_id'], seller=seller, price=_price(item.get('price')),
+                           currency=_truncate(item.get('currency'), 3), condition=_truncate(item.get('condition'), 64),
+                           condition_rank=condition_rank(item.get('condition')), url=_truncate(item.get('url'), 512), seen_at=now)
+              for item in items
+              if item.get('id') and item.get('release_id') and item.get('status', INVENTORY_STATUS_FOR_SALE) == INVENTORY_STATUS_FOR_SALE]
+    if not offers:
+        return
+
+    try:
+        with transaction.atomic():
+            ReleaseOffer.objects.filter(listing_id__in=[offer.listing_id for offer in offers]).delete()
+            # A concurrent search of the same page may have inserted them meanwhile
+            ReleaseOffer.objects.bulk_create(offers, ignore_conflicts=True)
+    except Exception as e:
+        logger.error("Error while indexing the listings of %s: %s", seller, e)
+
+# listing_ids can be a list or a values('listing_id') queryset
+def remove_offers(listing_ids):
+    return ReleaseOffer.objects.filter(listing_id__in=listing_ids).delete()[0]
+
+def fresh_offers():
+    return ReleaseOffer.objects.filter(seen_at__gte=timezone.now() - timedelta(seconds=settings.DISCOGS_OFFERS_MAX_AGE))
+
+def prune_offers():
+    return ReleaseOffer.objects.filter(seen_at__lt=timezone.now() - timedelta(seconds=settings.DISCOGS_OFFERS_MAX_AGE)).delete()[0]
+
+def _offer(row):
+    return {
+        'id': row['listing_id'],
+        'seller': row['seller__username'],
+        'price': float(row['price']) if row['price'] is not None else None,
+        'currency': row['currency'],
+        'condition': row['condition'],
+        'url': row['url'],
+        # Items are shared between workers as JSON
+        'seen_at': row['seen_at'].isoformat(),
+    }
+
+# Cheapest offer and number of offers of the given releases, per currency (prices in different currencies
+# can't be compared), leaving out the listings of exclude_seller. One query walking the
+# (release_id, currency, price) index. Returns release_id -> currency -> (offer, count)
+def cheapest_offers(release_ids, exclude_seller=None):
+    rows = fresh_offers().filter(release_id__in=release_ids, price__isnull=False)
+    if exclude_seller is not None:
+        rows = rows.exclude(seller=exclude_seller)
+
+    index = {}
+    for row in rows.order_by('release_id', 'currency', 'price', 'listing_id').values(*OFFER_FIELDS):
+        by_currency = index.setdefault(row['release_id'], {})
+        cheapest, count = by_currency.get(row['currency'], (None, 0))
+        by_currency[row['currency']] = (cheapest or _offer(row), count + 1)
+    return index
+
+# Adds to every item the cheapest offer of another seller for the same release in the same currency, the
+# number of those offers and whether it is cheaper than the item. Dictionary lookups only, per item
+def annotate_cheaper_elsewhere(items, seller):
+    index = cheapest_offers({item['release_id'] for item in items if item.get('release_id')}, exclude_seller=seller)
+
+    for item in items:
+        cheapest, count = index.get(item.get('release_id'), {}).get(item.get('currency'), (None, 0))
+        item['cheapest_elsewhere'] = cheapest
+        item['offers_elsewhere'] = count
+        item['cheaper_elsewhere'] = bool(cheapest and item.get('price') is not None and cheapest['price'] < item['price'])
+    return items
+
+# Known offers of a release, cheapest first in every currency
+def release_offers(release_id, currency=None, min_condition=None):
+    rows = fresh_offers().filter(release_id=release_id)
+    if currency:
+        rows = rows.filter(currency=currency)
+    if min_condition:
+        rows = rows.filter(condition_rank__gte=min_condition)
+    return [_offer(row) for row in rows.order_by('currency', 'price', 'listing_id').values(*OFFER_FIELDS)]
@@ -0,0 +1,10 @@
+# Copyright 2025 Giorgio Gamba
+
+from rest_framework.permissions import SAFE_METHODS, IsAdminUser
+
+# Staff users, the ones of the Django admin (session or basic authentication), for the requests changing
+# something, anyone for the others
+class IsAdminUserOrReadOnly(IsAdminUser):
+
+    def has_permission(self, request, view):
+        return request.method in SAFE_METHODS or super().has_permission(request, view)
@@ -0,0 +1,244 @@
+# Copyright 2025 Giorgio Gamba
+
+import contextvars
+import hashlib
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from .constants import RATELIMIT_HEADER, RATELIMIT_REMAINING_HEADER, RETRY_AFTER_HEADER
+from .metrics import record_throttle_wait
+
+try:
+    import fcntl
+except ImportError:
+    # No file locks (Windows): every process keeps its own budget
+    fcntl = None
+
+# Discogs counts requests over a moving window of one minute
+RATE_LIMIT_WINDOW = 60.0
+
+# Upper bound of a single sleep while waiting for a token, so that a waiting caller notices soon when the
+# budget it was waiting for has been taken by a caller with higher priority
+MAX_POLL_INTERVAL = 1.0
+
+# Priority classes of the upstream calls, lower values go first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_REFRESH = 1
+PRIORITY_CRAWL = 2
+
+PRIORITY_NAMES = {PRIORITY_INTERACTIVE: 'interactive', PRIORITY_REFRESH: 'refresh', PRIORITY_CRAWL: 'crawl'}
+
+_priority = contextvars.ContextVar('discogs_upstream_priority', default=PRIORITY_INTERACTIVE)
+
+def current_priority():
+    return _priority.get()
+
+# Every upstream call made inside the block (by this thread or coroutine) gets the given priority.
+# Thread pools don't inherit it: tasks submitted to them must set it again
+@contextmanager
+def upstream_priority(priority):
+    reset_token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(reset_token)
+
+# Fraction of the budget that a class can't consume, kept for the classes with higher priority. It only caps
+# the bursts: as soon as nobody else is waiting, background calls get the whole refill rate
+def _reserved_tokens(priority, capacity):
+    if priority >= PRIORITY_CRAWL:
+        return capacity * settings.DISCOGS_RATE_LIMIT_RESERVE_CRAWL
+    if priority >= PRIORITY_REFRESH:
+        return capacity * settings.DISCOGS_RATE_LIMIT_RESERVE_REFRESH
+    return 0.0
+
+# Token bucket that follows the budget Discogs reports in its response headers. The bucket of a token is kept
+# in a file under DISCOGS_RATE_LIMIT_DIR, locked on every access, so all the worker processes of the machine
+# share one budget instead of each spending the whole of it. try_acquire() never sleeps, but it may wait
+# for the file lock: asyncio callers run it in a thread (see async_client.off_loop)
+class RateLimiter:
+
+    def __init__(self, key, rate_limit=None, window=RATE_LIMIT_WINDOW):
+        self.rate_limit = float(rate_limit or settings.DISCOGS_RATE_LIMIT_DEFAULT)
+        self.window = window
+        self.lock = threading.Lock()
+        self.path = os.path.join(_state_dir(), f"{hashlib.sha1(str(key).encode('utf8')).hexdigest()}.json")
+        self.local_state = None
+
+    # Prefix of the hash naming the state file: tells the tokens apart in the metrics without showing them
+    @property
+    def token_hash(self):
+        return os.path.basename(self.path)[:12]
+
+    def _initial_state(self, now):
+        return {'capacity': self.rate_limit, 'tokens': self.rate_limit, 'updated_at': now, 'backoff': 0.0, 'blocked_until': 0.0}
+
+    # Yields the shared state of the bucket, refilled up to now, and saves it back on exit.
+    # Wall clock times, since monotonic clocks are not comparable among processes
+    @contextmanager
+    def _state(self):
+        with self.lock:
+            now = time.time()
+
+            if fcntl is None:
+                if self.local_state is None:
+                    self.local_state = self._initial_state(now)
+                _refill(self.local_state, now, self.window)
+                yield self.local_state, now
+                return
+
+            with open(self.path, 'a+') as state_file:
+                fcntl.flock(state_file.fileno(), fcntl.LOCK_EX)
+                try:
+                    state_file.seek(0)
+                    try:
+                        state = json.loads(state_file.read())
+                    except ValueError:
+                        state = self._initial_state(now)
+
+                    _refill(state, now, self.window)
+                    yield state, now
+
+                    state_file.seek(0)
+                    state_file.truncate()
+                    state_file.write(json.dumps(state))
+                    state_file.flush()
+                finally:
+                    fcntl.flock(state_file.fileno(), fcntl.LOCK_UN)
+
+    # Takes one token if the caller's class can have it. Returns 0 on success, otherwise how many seconds
+    # the caller should wait before trying again
+    def try_acquire(self, priority=None):
+        if priority is None:
+            priority = current_priority()
+
+        with self._state() as (state, now):
+            refill_rate = state['capacity'] / self.window
+            if state['blocked_until'] > now:
+                return min(state['blocked_until'] - now, MAX_POLL_INTERVAL)
+
+            missing = _reserved_tokens(priority, state['capacity']) + 1 - state['tokens']
+            if missing > 0:
+                return min(missing / refill_rate, MAX_POLL_INTERVAL)
+
+            state['tokens'] -= 1
+            return 0.0
+
+    # Blocks until a token is available. Returns the time spent waiting
+    def acquire(self, priority=None):
+        if priority is None:
+            priority = current_priority()
+
+        waited = 0.0
+        while True:
+            wait = self.try_acquire(priority)
+            if wait <= 0:
+                record_throttle_wait(waited, PRIORITY_NAMES.get(priority, priority))
+                return waited
+            time.sleep(wait)
+            waited += wait
+
+    # Aligns the bucket with the budget reported by Discogs
+    def update_from_headers(self, headers):
+        limit = _parse_header_int(headers, RATELIMIT_HEADER)
+        remaining = _parse_header_int(headers, RATELIMIT_REMAINING_HEADER)
+
+        with self._state() as (state, now):
+            if limit:
+                state['capacity'] = float(limit)
+
+            # The server counter is the authoritative one, but it lags behind the calls still in flight,
+            # so it can only make the local estimate more conservative
+            if remaining is not None:
+                state['tokens'] = min(state['tokens'], float(remaining))
+
+            state['backoff'] = 0.0
+
+    # Registers a 429 response and returns the delay before the next attempt. Every worker using the token
+    # stops until the delay is over
+    def register_throttled(self, retry_after=None):
+        with self._state() as (state, now):
+            state['backoff'] = min(max(state['backoff'] * 2, settings.DISCOGS_RATE_LIMIT_BACKOFF_BASE), settings.DISCOGS_RATE_LIMIT_BACKOFF_MAX)
+            delay = retry_after if retry_after else state['backoff']
+
+            state['blocked_until'] = max(state['blocked_until'], now + delay)
+            state['tokens'] = min(state['tokens'], 0.0)
+
+            return delay
+
+    # Keeps every worker off the token for the given seconds, without touching the 429 backoff
+    def cool_down(self, seconds):
+        with self._state() as (state, now):
+            state['blocked_until'] = max(state['blocked_until'], now + seconds)
+
+    def remaining(self):
+        with self._state() as (state, now):
+            return max(0, int(state['tokens']))
+
+    # Budget left, budget per window and seconds left of the 429 cooldown, read at once
+    def status(self):
+        with self._state() as (state, now):
+            return max(0.0, state['tokens']), state['capacity'], max(0.0, state['blocked_until'] - now)
+
+def _refill(state, now, window):
+    elapsed = now - state['updated_at']
+    if elapsed > 0:
+        state['tokens'] = min(state['capacity'], state['tokens'] + elapsed * state['capacity'] / window)
+        state['updated_at'] = now
+
+# (token hash, remaining, capacity) of every budget shared on this machine, for the metrics endpoint.
+# Only a prefix of the hash is reported, enough to tell the tokens apart
+def budget_snapshot():
+    if fcntl is None:
+        with _limiters_lock:
+            limiters = list(_limiters.values())
+        return [(limiter.token_hash, limiter.remaining(), limiter.rate_limit) for limiter in limiters]
+
+    now = time.time()
+    budgets = []
+    for file_name in sorted(os.listdir(_state_dir())):
+        if not file_name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(_state_dir(), file_name)) as state_file:
+                state = json.loads(state_file.read())
+        except (OSError, ValueError):
+            continue
+        _refill(state, now, RATE_LIMIT_WINDOW)
+        budgets.append((file_name[:12], max(0, int(state['tokens'])), state['capacity']))
+    return budgets
+
+def _state_dir():
+    os.makedirs(settings.DISCOGS_RATE_LIMIT_DIR, exist_ok=True)
+    return settings.DISCOGS_RATE_LIMIT_DIR
+
+def _parse_header_int(headers, name):
+    value = headers.get(name) if headers else None
+    try:
+        return int(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+def parse_retry_after(headers):
+    try:
+        return float(headers.get(RETRY_AFTER_HEADER))
+    except (TypeError, ValueError):
+        return None
+
+# Discogs applies the limit per authenticated token, so every token gets its own bucket.
+# The limiter objects are per process, the budget behind them is shared
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+def get_rate_limiter(key):
+    with _limiters_lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            limiter = RateLimiter(key)
+            _limiters[key] = limiter
+        return limiter
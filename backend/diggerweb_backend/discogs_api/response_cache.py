@@ -0,0 +1,89 @@
+# Copyright 2025 Giorgio Gamba
+
+import hashlib
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .http_cache import ETAG_IGNORED_PARAMS, search_max_age
+
+logger = logging.getLogger(__name__)
+
+# Shared cache of the search pages, on the Django cache configured by DISCOGS_SEARCH_CACHE. Keys carry a
+# version of the seller, bumped whenever its local data is refreshed (snapshot completed, listings stats
+# updated): the pages of the seller cached before are never read again and simply expire. Pages built on
+# marketplace stats refreshed in background are at most DISCOGS_SEARCH_CACHE_TTL old. The cache must be
+# shared by the workers (file, memcached or db backend) for a bump made by one of them, or by run_jobs, to
+# reach the others: with a locmem cache the other workers serve their pages until they expire
+
+# Parameters resolved by the view and passed apart, normalized
+NORMALIZED_PARAMS = ['q', 'page', 'per_page', 'mode']
+
+def _cache():
+    return caches[settings.DISCOGS_SEARCH_CACHE]
+
+def _version_key(username):
+    return f"discogs:search-version:{username.lower()}"
+
+# Versions start from the clock, so that a version evicted and created again never matches the old one
+def _new_version():
+    return int(time.time() * 1000)
+
+def seller_version(username):
+    cache = _cache()
+    version = cache.get(_version_key(username))
+    if version is None:
+        version = _new_version()
+        if not cache.add(_version_key(username), version, timeout=None):
+            version = cache.get(_version_key(username), version)
+    return version
+
+# Invalidates every cached search page of the seller
+def bump_seller_version(username):
+    try:
+        cache = _cache()
+        try:
+            cache.incr(_version_key(username))
+        except ValueError:
+            cache.set(_version_key(username), _new_version(), timeout=None)
+    except Exception as e:
+        logger.error("Error while invalidating the cached searches of %s: %s", username, e)
+
+def search_cache_ttl():
+    return min(settings.DISCOGS_SEARCH_CACHE_TTL, settings.DISCOGS_STATS_TTL)
+
+# Key of a search page: the same page asked with the parameters in another order, with default values
+# spelled out or with another case of the username gets the same key. None if the cache can't be used
+def search_cache_key(username, mode, page_num, items_per_page, query_params):
+    parts = [username.lower(), mode, str(page_num), str(items_per_page)]
+    for name, values in sorted(query_params.lists()):
+        if name not in NORMALIZED_PARAMS and name not in ETAG_IGNORED_PARAMS:
+            parts.append(f"{name}={','.join(value.strip() for value in values)}")
+
+    try:
+        parts.append(str(seller_version(username)))
+    except Exception as e:
+        logger.error("Error while reading the cached searches version of %s: %s", username, e)
+        return None
+
+    digest = hashlib.sha1('&'.join(parts).encode('utf8')).hexdigest()
+    return f"discogs:search:{digest}"
+
+# Returns the cached page: a dict with its data, status, ETag and max age. None on a miss or a broken cache
+def load_search_page(key):
+    try:
+        return _cache().get(key)
+    except Exception as e:
+        logger.error("Error while reading a cached search page: %s", e)
+        return None
+
+def store_search_page(key, data, status_code, etag=None, max_age=None):
+    if not search_cache_ttl():
+        return
+    page = {'data': data, 'status': status_code, 'etag': etag, 'max_age': max_age or search_max_age()}
+    try:
+        _cache().set(key, page, timeout=search_cache_ttl())
+    except Exception as e:
+        logger.error("Error while caching a search page: %s", e)
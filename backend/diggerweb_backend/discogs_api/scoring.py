@@ -0,0 +1,153 @@
+# Copyright 2025 Giorgio Gamba
+
+import numpy as np
+from django.db.models import FloatField
+from django.db.models.functions import Cast
+
+from .listings import CONDITION_GRADES
+
+# Components of the composite score, each in [0, 1], higher meaning a better pick:
+#   deal       price close to (or below) the marketplace lowest price of the release
+#   rarity     few copies for sale on the marketplace
+#   condition  media grade
+#   price      cheap among the listings of the inventory in the same currency
+SCORE_COMPONENTS = ['deal', 'rarity', 'condition', 'price']
+
+DEFAULT_SCORE_WEIGHTS = {'deal': 1.0, 'rarity': 1.0, 'condition': 0.5, 'price': 0.5}
+
+DEFAULT_TOP = 50
+MAX_TOP = 1000
+
+# Listing columns the scores are computed on. Prices are read as floats: Decimal objects would cost more
+# than the whole scoring
+SCORE_FIELDS = ['listing_id', 'score_price', 'currency', 'price_ratio', 'num_for_sale', 'condition_rank']
+
+# Price ratio (price over marketplace lowest) at which the deal component reaches 0
+WORST_DEAL_RATIO = 2.0
+
+# Reads the weights of the request from the 'w_<component>' query parameters, the defaults for the missing
+# ones. Raises ValueError if a weight is negative or not a number, or if they are all zero
+def parse_score_weights(query_params):
+    weights = {}
+    for name in SCORE_COMPONENTS:
+        value = query_params.get(f"w_{name}")
+        if value is None or value == '':
+            weights[name] = DEFAULT_SCORE_WEIGHTS[name]
+            continue
+        try:
+            weights[name] = float(value)
+        except ValueError:
+            raise ValueError(f"Invalid value '{value}' for the 'w_{name}' parameter.")
+        if not np.isfinite(weights[name]) or weights[name] < 0:
+            raise ValueError(f"'w_{name}' parameter must be a non negative number.")
+
+    if not any(weights.values()):
+        raise ValueError("At least one of the score weights must be positive.")
+    return weights
+
+def parse_top(value):
+    top = int(value) if value not in (None, '') else DEFAULT_TOP
+    if not 1 <= top <= MAX_TOP:
+        raise ValueError
+    return top
+
+# Columns of an inventory as flat arrays: a few bytes per listing instead of a model instance or a dict each.
+# Missing values are NaN, currencies are codes into the currencies list
+class InventoryArrays:
+
+    def __init__(self, rows):
+        columns = list(zip(*rows)) if rows else [()] * len(SCORE_FIELDS)
+        listing_ids, prices, currencies, ratios, num_for_sale, condition_ranks = columns
+
+        self.listing_id = np.array(listing_ids, dtype=np.int64)
+        self.price = np.array(prices, dtype=np.float32)
+        self.price_ratio = np.array(ratios, dtype=np.float32)
+        self.num_for_sale = np.array(num_for_sale, dtype=np.float32)
+        self.condition_rank = np.array(condition_ranks, dtype=np.float32)
+
+        currencies, codes = np.unique(np.array(currencies, dtype='U3'), return_inverse=True)
+        self.currencies = currencies.tolist()
+        self.currency = codes.astype(np.int16)
+
+    def __len__(self):
+        return len(self.listing_id)
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in (self.listing_id, self.price, self.price_ratio, self.num_for_sale, self.condition_rank, self.currency))
+
+def load_inventory_arrays(listings):
+    return InventoryArrays(list(listings.annotate(score_price=Cast('price', FloatField())).values_list(*SCORE_FIELDS)))
+
+def _deal(arrays):
+    deal = np.clip((WORST_DEAL_RATIO - arrays.price_ratio) / (WORST_DEAL_RATIO - 1), 0, 1)
+    return np.nan_to_num(deal, nan=0.0)
+
+# 1 for the only copy on sale, decreasing with the log of the copies
+def _rarity(arrays):
+    rarity = 1 / (1 + np.log(np.maximum(arrays.num_for_sale, 1)))
+    return np.nan_to_num(rarity, nan=0.0)
+
+def _condition(arrays):
+    return np.nan_to_num(arrays.condition_rank / len(CONDITION_GRADES), nan=0.0)
+
+# Rank of every price among the prices of the same currency, so that prices in different currencies are
+# comparable without exchange rates: 1 for the cheapest listing, 0 for the most expensive one
+def _price(arrays):
+    price = np.zeros(len(arrays), dtype=np.float32)
+    valid = np.flatnonzero(~np.isnan(arrays.price))
+    if not len(valid):
+        return price
+
+    codes = arrays.currency[valid]
+    order = np.lexsort((arrays.price[valid], codes))
+    sorted_codes = codes[order]
+
+    counts = np.bincount(sorted_codes, minlength=len(arrays.currencies))
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    ranks = np.arange(len(order)) - starts[sorted_codes]
+    spans = np.maximum(counts[sorted_codes] - 1, 1)
+
+    cheapness = np.where(counts[sorted_codes] > 1, 1 - ranks / spans, 0.5)
+    price[valid[order]] = cheapness
+    return price
+
+COMPONENT_FUNCTIONS = {'deal': _deal, 'rarity': _rarity, 'condition': _condition, 'price': _price}
+
+# Components of every listing as a (components, listings) matrix, in SCORE_COMPONENTS order
+def score_components(arrays):
+    components = np.empty((len(SCORE_COMPONENTS), len(arrays)), dtype=np.float32)
+    for index, name in enumerate(SCORE_COMPONENTS):
+        components[index] = COMPONENT_FUNCTIONS[name](arrays)
+    return components
+
+# Weighted mean of the components, in [0, 1]
+def composite_scores(components, weights):
+    vector = np.array([weights[name] for name in SCORE_COMPONENTS], dtype=np.float32)
+    return (vector / vector.sum()) @ components
+
+# Positions of the k best scores, best first (ties by listing id), without sorting the whole inventory.
+# The partition picks any of the scores tied with the k-th one: all of them are kept, and the listing ids
+# decide which ones make the cut
+def top_k(scores, listing_ids, k):
+    k = min(k, len(scores))
+    if k == 0:
+        return np.empty(0, dtype=np.int64)
+
+    if k < len(scores):
+        kth_score = scores[np.argpartition(-scores, k - 1)[k - 1]]
+        best = np.flatnonzero(scores >= kth_score)
+    else:
+        best = np.arange(len(scores))
+    return best[np.lexsort((listing_ids[best], -scores[best]))][:k]
+
+# Scores the whole inventory and returns [(listing id, score, components dict)] of the top k listings
+def rank_inventory(arrays, weights, k):
+    components = score_components(arrays)
+    scores = composite_scores(components, weights)
+
+    ranked = []
+    for position in top_k(scores, arrays.listing_id, k):
+        ranked.append((int(arrays.listing_id[position]), round(float(scores[position]), 4),
+                       {name: round(float(components[index, position]), 4) for index, name in enumerate(SCORE_COMPONENTS)}))
+    return ranked
@@ -0,0 +1,206 @@
+# Copyright 2025 Giorgio Gamba
+
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+try:
+    import fcntl
+except ImportError:
+    # No file locks (Windows): coalescing stays within the process
+    fcntl = None
+
+# Seconds between two attempts to take a file lock held by another worker
+LOCK_POLL_INTERVAL = 0.05
+
+# Lock files named after a single key, as created before the keys were spread over buckets
+LEGACY_LOCK_NAME = re.compile(r'^[0-9a-f]{40}\.lock$')
+
+class _Call:
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+# Runs a function once per key among the threads of the process: the first caller (the leader) runs it,
+# the callers arriving while it runs wait and get the same result, or the same exception
+class SingleFlight:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def do(self, key, fn):
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self.calls[key] = call
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.event.set()
+
+SINGLE_FLIGHT = SingleFlight()
+
+def _key_name(key):
+    return hashlib.sha1(repr(key).encode('utf8')).hexdigest()
+
+def _lock_dir():
+    os.makedirs(settings.DISCOGS_SINGLEFLIGHT_DIR, exist_ok=True)
+    return settings.DISCOGS_SINGLEFLIGHT_DIR
+
+# Keys of the same kind share DISCOGS_SINGLEFLIGHT_LOCK_BUCKETS lock files, so their number stays bounded
+# whatever the number of keys; two keys in the same bucket just wait for each other. Kinds never share a
+# file, as a search holds its lock while the stats lookups of its page take theirs
+def _lock_name(key):
+    kind = re.sub(r'\W', '', str(key[0])) if isinstance(key, tuple) and key else 'key'
+    bucket = int(_key_name(key), 16) % settings.DISCOGS_SINGLEFLIGHT_LOCK_BUCKETS
+    return f"{kind}-{bucket}.lock"
+
+# Exclusive lock on a key shared by all the worker processes of the machine. Gives up waiting after
+# DISCOGS_SINGLEFLIGHT_LOCK_TIMEOUT seconds, so a stuck worker can slow the others down but not block them
+@contextmanager
+def file_lock(key):
+    if fcntl is None:
+        yield
+        return
+
+    path = os.path.join(_lock_dir(), _lock_name(key))
+    deadline = time.monotonic() + settings.DISCOGS_SINGLEFLIGHT_LOCK_TIMEOUT
+
+    with open(path, 'a') as lock_file:
+        locked = False
+        while True:
+            try:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                locked = True
+                break
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    logger.warning("Timeout while waiting for lock %s, going on without it", key)
+                    break
+                time.sleep(LOCK_POLL_INTERVAL)
+
+        try:
+            yield
+        finally:
+            if locked:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+# Runs compute() once for all the concurrent callers with the same key, in this process and in the other
+# workers. load_shared() returns the result published by another worker (or None), store_shared(result)
+# publishes it: when a worker gets the lock after another one, it reuses that result instead of computing it again
+def coalesce(key, compute, load_shared=None, store_shared=None):
+
+    def lead():
+        if load_shared is not None:
+            result = load_shared()
+            if result is not None:
+                return result
+
+        with file_lock(key):
+            if load_shared is not None:
+                result = load_shared()
+                if result is not None:
+                    return result
+
+            result = compute()
+            if store_shared is not None:
+                store_shared(result)
+            return result
+
+    return SINGLE_FLIGHT.do(key, lead)
+
+# Short lived results shared between workers as JSON files next to the locks
+def load_shared_result(key):
+    path = os.path.join(_lock_dir(), f"{_key_name(key)}.json")
+    try:
+        if time.time() - os.path.getmtime(path) > settings.DISCOGS_SINGLEFLIGHT_RESULT_TTL:
+            return None
+        with open(path) as result_file:
+            return json.load(result_file)
+    except (OSError, ValueError):
+        return None
+
+def store_shared_result(key, result):
+    path = os.path.join(_lock_dir(), f"{_key_name(key)}.json")
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, 'w') as result_file:
+            json.dump(result, result_file)
+        # Atomic, readers never see a half written file
+        os.replace(tmp_path, path)
+    except (OSError, TypeError, ValueError) as e:
+        logger.warning("Error while sharing result of %s: %s", key, e)
+
+    _prune_periodically()
+
+# Deletes the shared results past their TTL, the temporary files left by interrupted writers and the
+# legacy lock files. Returns the number of deleted files
+def prune_shared_files():
+    now = time.time()
+    deleted = 0
+
+    for entry in os.scandir(_lock_dir()):
+        try:
+            age = now - entry.stat().st_mtime
+            if entry.name.endswith('.json'):
+                expired = age > settings.DISCOGS_SINGLEFLIGHT_RESULT_TTL
+            elif entry.name.endswith('.tmp'):
+                expired = age > settings.DISCOGS_SINGLEFLIGHT_LOCK_TIMEOUT
+            else:
+                expired = LEGACY_LOCK_NAME.match(entry.name) is not None
+
+            if expired:
+                os.unlink(entry.path)
+                deleted += 1
+        except FileNotFoundError:
+            # Deleted meanwhile by another worker
+            continue
+        except OSError as e:
+            logger.warning("Error while pruning %s: %s", entry.path, e)
+
+    return deleted
+
+_prune_lock = threading.Lock()
+_pruned_at = 0.0
+
+# Every worker prunes the directory at most every DISCOGS_SINGLEFLIGHT_PRUNE_INTERVAL seconds, so that
+# results of pages never asked again don't pile up between two runs of prune_history
+def _prune_periodically():
+    global _pruned_at
+    with _prune_lock:
+        now = time.monotonic()
+        if now - _pruned_at < settings.DISCOGS_SINGLEFLIGHT_PRUNE_INTERVAL:
+            return
+        _pruned_at = now
+
+    try:
+        prune_shared_files()
+    except OSError as e:
+        logger.warning("Error while pruning the shared results: %s", e)
@@ -0,0 +1,252 @@
+# Copyright 2025 Giorgio Gamba
+
+import contextvars
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal, InvalidOperation
+
+import discogs_client
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections
+
+from .constants import DISCOGS_MARKETPLACE_STATS_URL
+from .history import record_release_stats
+from .models import MarketplaceStats
+from .metrics import METRICS
+from .ratelimit import PRIORITY_REFRESH, upstream_priority
+from .singleflight import coalesce
+
+logger = logging.getLogger(__name__)
+
+# Process wide pool, so the number of parallel stats calls stays bounded whatever the number of searches
+STATS_EXECUTOR = ThreadPoolExecutor(max_workers=settings.DISCOGS_STATS_MAX_WORKERS, thread_name_prefix='discogs-stats')
+
+# Stale entries are refreshed on a separate small pool, so they never delay interactive lookups
+REFRESH_EXECUTOR = ThreadPoolExecutor(max_workers=settings.DISCOGS_STATS_REFRESH_WORKERS, thread_name_prefix='discogs-stats-refresh')
+
+# In-process LRU in front of the MarketplaceStats table. Entries are (stats dict, fetched_at epoch seconds)
+class StatsCache:
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.refreshing = set()
+
+    def get(self, release_id):
+        with self.lock:
+            entry = self.entries.get(release_id)
+            if entry is not None:
+                self.entries.move_to_end(release_id)
+            return entry
+
+    def put(self, release_id, stats, fetched_at):
+        with self.lock:
+            self.entries[release_id] = (stats, fetched_at)
+            self.entries.move_to_end(release_id)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    # Returns True if the caller has to start the refresh, False if someone is already doing it
+    def start_refresh(self, release_id):
+        with self.lock:
+            if release_id in self.refreshing:
+                return False
+            self.refreshing.add(release_id)
+            return True
+
+    def end_refresh(self, release_id):
+        with self.lock:
+            self.refreshing.discard(release_id)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+STATS_CACHE = StatsCache(settings.DISCOGS_STATS_CACHE_SIZE)
+
+# max_age defaults to DISCOGS_STATS_TTL
+def _is_stale(fetched_at, max_age=None):
+    return time.time() - fetched_at > (settings.DISCOGS_STATS_TTL if max_age is None else max_age)
+
+def _is_expired(fetched_at):
+    return time.time() - fetched_at > settings.DISCOGS_STATS_MAX_STALE
+
+# Rebuilds the API shaped stats dict from a DB row
+def _stats_from_row(row):
+    lowest_price = None
+    if row.lowest_price is not None:
+        lowest_price = {'value': float(row.lowest_price), 'currency': row.currency}
+    return {'num_for_sale': row.num_for_sale, 'lowest_price': lowest_price}
+
+def store_stats(release_id, stats):
+    fetched_at = time.time()
+    STATS_CACHE.put(release_id, stats, fetched_at)
+
+    lowest_price = stats.get('lowest_price') or {}
+    try:
+        price = Decimal(str(lowest_price['value'])) if lowest_price.get('value') is not None else None
+    except InvalidOperation:
+        price = None
+
+    values = {
+        'num_for_sale': stats.get('num_for_sale'),
+        'lowest_price': price,
+        'currency': lowest_price.get('currency') or '',
+        'fetched_at': datetime.fromtimestamp(fetched_at, tz=dt_timezone.utc),
+    }
+
+    # Plain UPDATE then INSERT instead of update_or_create: single statements don't hold a
+    # transaction open, so parallel writers simply wait for each other (SQLite included)
+    try:
+        if not MarketplaceStats.objects.filter(release_id=release_id).update(**values):
+            try:
+                MarketplaceStats.objects.create(release_id=release_id, **values)
+            except IntegrityError:
+                MarketplaceStats.objects.filter(release_id=release_id).update(**values)
+    except Exception as e:
+        logger.error("Error while saving marketplace stats for release %s: %s", release_id, e)
+
+    record_release_stats(release_id, stats, fetched_at)
+
+# Retrieves the marketplace stats of a release from Discogs. Returns the stats dict and an error message, one of them is None
+def fetch_marketplace_stats(client, release_id):
+    stats_path = f"{DISCOGS_MARKETPLACE_STATS_URL}{release_id}"
+
+    try:
+        stats = client._get(stats_path)
+
+    except discogs_client.exceptions.HTTPError as stats_http_err:
+        logger.warning("HTTPError %s while retrieving stats for release %s: %s", stats_http_err.status_code, release_id, stats_http_err.msg)
+        return None, f"Stats not available ({stats_http_err.status_code})"
+
+    except Exception as stats_e:
+        logger.warning("Unexpected error while retrieving stats for release %s: %s", release_id, stats_e)
+        return None, f"Error - Stats not availble"
+
+    if stats:
+        store_stats(release_id, stats)
+    return stats, None
+
+# Stats saved by another worker while this one was waiting for the same release, if at most max_age old
+def _load_fresh_stats(release_id, max_age=None):
+    row = MarketplaceStats.objects.filter(release_id=release_id).first()
+    if row is None or _is_stale(row.fetched_at.timestamp(), max_age):
+        return None
+
+    stats = _stats_from_row(row)
+    STATS_CACHE.put(release_id, stats, row.fetched_at.timestamp())
+    return stats, None
+
+# Concurrent lookups of the same release, from any thread or worker, result in a single upstream call.
+# Stats stored meanwhile are reused when at most max_age old (DISCOGS_STATS_TTL by default)
+def fetch_marketplace_stats_coalesced(client, release_id, max_age=None):
+    return coalesce(('stats', release_id), lambda: fetch_marketplace_stats(client, release_id), load_shared=lambda: _load_fresh_stats(release_id, max_age))
+
+# Pool task wrapper: pool threads are long lived, so their DB connections must follow CONN_MAX_AGE
+def _fetch_marketplace_stats_task(client, release_id, max_age=None):
+    close_old_connections()
+    try:
+        return fetch_marketplace_stats_coalesced(client, release_id, max_age)
+    finally:
+        close_old_connections()
+
+# Runs outside of the context of the request that found the stale entry
+def _refresh_marketplace_stats_task(client, release_id):
+    try:
+        with upstream_priority(PRIORITY_REFRESH):
+            _fetch_marketplace_stats_task(client, release_id)
+    except Exception:
+        logger.exception("Error while refreshing marketplace stats for release %s", release_id)
+    finally:
+        STATS_CACHE.end_refresh(release_id)
+
+def _schedule_refresh(client, release_id):
+    if STATS_CACHE.start_refresh(release_id):
+        REFRESH_EXECUTOR.submit(_refresh_marketplace_stats_task, client, release_id)
+
+def _resolved(result):
+    future = Future()
+    future.set_result(result)
+    return future
+
+# Looks up the stats of the given releases in the LRU, then in the DB. Stale entries are served as they are
+# and refreshed in the background through the given client. Returns the dict release_id -> stats of the
+# entries found and the list of the releases that have to be fetched from Discogs
+def lookup_cached_stats(client, release_ids):
+    cached = {}
+    missing = []
+    seen = set()
+
+    for release_id in release_ids:
+        if release_id in seen:
+            continue
+        seen.add(release_id)
+
+        entry = STATS_CACHE.get(release_id)
+        if entry is None or _is_expired(entry[1]):
+            missing.append(release_id)
+            continue
+
+        stats, fetched_at = entry
+        if _is_stale(fetched_at):
+            METRICS.inc('discogs_stats_stale_total')
+            _schedule_refresh(client, release_id)
+        cached[release_id] = stats
+
+    memory_hits = len(cached)
+
+    if missing:
+        try:
+            rows = MarketplaceStats.objects.filter(release_id__in=missing)
+            for row in rows:
+                fetched_at = row.fetched_at.timestamp()
+                if _is_expired(fetched_at):
+                    continue
+
+                stats = _stats_from_row(row)
+                STATS_CACHE.put(row.release_id, stats, fetched_at)
+                if _is_stale(fetched_at):
+                    METRICS.inc('discogs_stats_stale_total')
+                    _schedule_refresh(client, row.release_id)
+                cached[row.release_id] = stats
+
+        except Exception as e:
+            logger.error("Error while loading marketplace stats from DB: %s", e)
+
+    missing = [release_id for release_id in missing if release_id not in cached]
+
+    METRICS.inc('discogs_stats_cache_total', memory_hits, result='memory_hit')
+    METRICS.inc('discogs_stats_cache_total', len(cached) - memory_hits, result='db_hit')
+    METRICS.inc('discogs_stats_cache_total', len(missing), result='miss')
+    return cached, missing
+
+# Looks up the stats of all the given releases: cached ones are served locally, missing ones are fetched
+# from Discogs in parallel. Returns a dict release_id -> future of (stats, error message)
+def submit_marketplace_stats(client, release_ids):
+    cached, missing = lookup_cached_stats(client, release_ids)
+
+    futures = {release_id: _resolved((stats, None)) for release_id, stats in cached.items()}
+    for release_id in missing:
+        # Each task runs in a copy of the submitter context, so it keeps its upstream priority and request timing
+        context = contextvars.copy_context()
+        futures[release_id] = STATS_EXECUTOR.submit(context.run, _fetch_marketplace_stats_task, client, release_id)
+
+    return futures
+
+# Blocking version of submit_marketplace_stats. Returns a dict release_id -> (stats, error message)
+def fetch_marketplace_stats_bulk(client, release_ids):
+    futures = submit_marketplace_stats(client, release_ids)
+    return {release_id: future.result() for release_id, future in futures.items()}
+
+# Fetches the stats of all the given releases from Discogs in parallel, ignoring the cached ones (e.g. to
+# refresh them in background). Only stats stored less than max_age seconds ago, by a lookup that ran
+# meanwhile, are reused. Returns a dict release_id -> (stats, error message)
+def refetch_marketplace_stats_bulk(client, release_ids, max_age=0):
+    futures = {release_id: STATS_EXECUTOR.submit(contextvars.copy_context().run, _fetch_marketplace_stats_task, client, release_id, max_age)
+               for release_id in release_ids}
+    return {release_id: future.result() for release_id, future in futures.items()}
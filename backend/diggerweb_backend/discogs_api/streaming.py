@@ -0,0 +1,79 @@
+# Copyright 2025 Giorgio Gamba
+
+import json
+import logging
+from concurrent.futures import as_completed
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .listings import get_release_id, build_item, num_for_sale_sort_key
+from .stats import submit_marketplace_stats
+
+logger = logging.getLogger(__name__)
+
+STREAM_FORMAT_NDJSON = 'ndjson'
+STREAM_FORMAT_SSE = 'sse'
+
+STREAM_CONTENT_TYPES = {
+    STREAM_FORMAT_NDJSON: 'application/x-ndjson',
+    STREAM_FORMAT_SSE: 'text/event-stream',
+}
+
+# Event names
+EVENT_PAGE = 'page'
+EVENT_ITEM = 'item'
+EVENT_DONE = 'done'
+EVENT_ERROR = 'error'
+
+# EventSource always asks for text/event-stream, anything else gets newline delimited JSON
+def get_stream_format(request):
+    if STREAM_CONTENT_TYPES[STREAM_FORMAT_SSE] in request.META.get('HTTP_ACCEPT', ''):
+        return STREAM_FORMAT_SSE
+    return STREAM_FORMAT_NDJSON
+
+def encode_event(stream_format, event, data):
+    if stream_format == STREAM_FORMAT_SSE:
+        return f"event: {event}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n"
+
+    data = {'event': event, **data}
+    return json.dumps(data, cls=DjangoJSONEncoder) + "\n"
+
+# Emits the events of a search page whose listings have already been downloaded:
+#   page - pagination info and every listing, with the stats still pending
+#   item - one per listing, as soon as the stats of its release are known
+#   done - the listing ids in the final order (sorted on num_for_sale)
+def search_events(client, listings_data, pagination_info, stream_format):
+    try:
+        listings_by_release = {}
+        for listing_dict in listings_data:
+            release_id = get_release_id(listing_dict)
+            if release_id:
+                listings_by_release.setdefault(release_id, []).append(listing_dict)
+
+        futures = submit_marketplace_stats(client, list(listings_by_release))
+
+        pending_items = []
+        for listings in listings_by_release.values():
+            for listing_dict in listings:
+                item_data = build_item(listing_dict, None)
+                item_data['stats_pending'] = True
+                pending_items.append(item_data)
+
+        yield encode_event(stream_format, EVENT_PAGE, {'pagination': pagination_info, 'results': pending_items})
+
+        output_results = []
+        release_by_future = {future: release_id for release_id, future in futures.items()}
+        for future in as_completed(release_by_future):
+            stats_response, stats_error_msg = future.result()
+            for listing_dict in listings_by_release[release_by_future[future]]:
+                item_data = build_item(listing_dict, stats_response, stats_error_msg)
+                output_results.append(item_data)
+                yield encode_event(stream_format, EVENT_ITEM, {'item': item_data})
+
+        output_results.sort(key=num_for_sale_sort_key, reverse=False)
+        yield encode_event(stream_format, EVENT_DONE, {'order': [item_data['id'] for item_data in output_results]})
+
+    except Exception as e:
+        # Headers are already gone, the error can only be reported as an event
+        logger.exception("Unexpected error while streaming search results: %s", e)
+        yield encode_event(stream_format, EVENT_ERROR, {'error': "Server internal error during research"})
@@ -1,3 +1,1423 @@
-from django.test import TestCase
+# Copyright 2025 Giorgio Gamba
 
-# Create your tests here.
+import asyncio
+import csv
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import xml.etree.ElementTree as ET
+from collections import defaultdict
+from datetime import timedelta
+from unittest import mock, skipIf
+from urllib.parse import parse_qs, urlparse
+
+import httpx
+import numpy as np
+import requests
+from discogs_client.exceptions import DiscogsAPIError, HTTPError
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import DatabaseError
+from django.http import QueryDict
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from .async_client import AsyncDiscogsClient
+from .client import CLIENT_POOL, create_client, get_identity
+from .credentials import CREDENTIAL_POOL, is_shared_url
+from .async_views import search_user_inventory_async
+from .batch import search_inventories
+from .continuations import save_continuation
+from .constants import DISCOGS_IDENTITY_URL, DISCOGS_MARKETPLACE_STATS_URL
+from .export import EXPORT_FIELDS, EXPORT_FORMAT_CSV, EXPORT_FORMAT_JSONL, EXPORT_LINES_PER_BLOCK, decode_export_cursor, encode_export_cursor, export_lines
+from .dumps import add_release_details, import_dump, iter_records, open_dump
+from .crawler import crawl_inventory, _locate_vanished, _InconsistentOrder, get_latest_snapshot, get_seller, for_sale_listings, sync_inventory, update_listing_stats
+from .filters import after_cursor, decode_cursor, encode_cursor, order_listings
+from .http_cache import snapshot_etag
+from .jobs import claim_jobs, complete_job, enqueue_job, fail_job
+from .scoring import DEFAULT_SCORE_WEIGHTS, InventoryArrays, composite_scores, load_inventory_arrays, parse_score_weights, parse_top, rank_inventory, score_components, top_k
+from .singleflight import _key_name, file_lock, load_shared_result, prune_shared_files, store_shared_result
+from .models import (Artist, DiscogsCredentials, DumpImport, InventorySnapshot, Job, Label, Listing, ListingPriceHistory, MarketplaceStats,
+                     Release, ReleaseOffer, SearchContinuation, Seller, WatchedSeller)
+from .ratelimit import PRIORITY_CRAWL, RateLimiter, get_rate_limiter
+from .response_cache import bump_seller_version, load_search_page, search_cache_key, store_search_page
+from .stats import REFRESH_EXECUTOR, STATS_CACHE, lookup_cached_stats
+from .views import DiscogsAuthenticatedView, DiscogsSearchView
+from .utils import invalidate_credentials_cache, load_credentials_pool, revoke_access_token, save_access_token
+from .wantlist import SCAN_ALL_FOUND, SCAN_END, SCAN_PAGE_LIMIT, WantlistCache, match_inventory
+from .watchlist import refresh_stats_job, stale_release_ids
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+DUMPS_DIR = os.path.join(os.path.dirname(__file__), 'fixtures', 'dumps')
+
+INVENTORY_PATH = re.compile(r'/users/([^/]+)/inventory$')
+WANTS_PATH = re.compile(r'/users/([^/]+)/wants$')
+
+# Raw listing as returned by the inventory endpoint
+def make_listing(listing_id, release_id, price=10.0):
+    return {
+        'id': listing_id,
+        'status': 'For Sale',
+        'uri': f"https://www.discogs.com/sell/item/{listing_id}",
+        'release': {'id': release_id, 'description': f"Artist - Title {release_id} (LP)", 'artists': [{'name': 'Artist'}]},
+        'price': {'value': price, 'currency': 'EUR'},
+        'condition': 'Near Mint (NM or M-)',
+        'sleeve_condition': 'Very Good Plus (VG+)',
+    }
+
+# Stand-in of the Discogs client: serves the inventories (newest listing first) and the marketplace stats
+# from memory and records the requested URLs. Users without an inventory are not found
+class FakeDiscogsClient:
+
+    def __init__(self, inventories=None, stats=None):
+        self.inventories = inventories or {}
+        self.stats = stats or {}
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def stats_calls(self):
+        with self.lock:
+            return [url for url in self.calls if url.startswith(DISCOGS_MARKETPLACE_STATS_URL)]
+
+    def _get(self, url):
+        with self.lock:
+            self.calls.append(url)
+
+        if url.startswith(DISCOGS_MARKETPLACE_STATS_URL):
+            release_id = int(url[len(DISCOGS_MARKETPLACE_STATS_URL):])
+            return self.stats.get(release_id, {'num_for_sale': 3, 'lowest_price': {'value': 5.0, 'currency': 'EUR'}})
+
+        parsed = urlparse(url)
+        username = INVENTORY_PATH.search(parsed.path).group(1)
+        if username not in self.inventories:
+            raise HTTPError("The requested resource was not found.", 404)
+        params = parse_qs(parsed.query)
+        page_num = int(params['page'][0])
+        per_page = int(params['per_page'][0])
+
+        listings = sorted(self.inventories.get(username, []), key=lambda listing: -listing['id'])
+        return {
+            'pagination': {'page': page_num, 'pages': max(1, (len(listings) + per_page - 1) // per_page), 'per_page': per_page, 'items': len(listings)},
+            'listings': listings[(page_num - 1) * per_page:page_num * per_page],
+        }
+
+# Coroutine interface of FakeDiscogsClient, as AsyncDiscogsClient
+class FakeAsyncDiscogsClient:
+
+    def __init__(self, client):
+        self.client = client
+
+    async def get(self, url):
+        return self.client._get(url)
+
+# Stats are fetched by pool threads with their own connections, so the tests commit their writes
+@override_settings(DISCOGS_SINGLEFLIGHT_DIR=tempfile.mkdtemp(), DISCOGS_SEARCH_CACHE_TTL=0)
+class DiscogsTestCase(TransactionTestCase):
+
+    def setUp(self):
+        STATS_CACHE.clear()
+
+    def crawl(self, client, username, kind=InventorySnapshot.KIND_FULL):
+        snapshot = InventorySnapshot.objects.create(seller=get_seller(username), kind=kind)
+        if kind == InventorySnapshot.KIND_INCREMENTAL:
+            return sync_inventory(client, snapshot)
+        return crawl_inventory(client, snapshot)
+
+class SyncInventoryTests(DiscogsTestCase):
+
+    def test_sync_keeps_the_stats_of_known_listings(self):
+        inventory = [make_listing(1000 + i, 100 + i) for i in range(150)]
+        client = FakeDiscogsClient({'bob': inventory})
+        self.crawl(client, 'bob')
+
+        inventory.extend([make_listing(2000, 500), make_listing(2001, 501)])
+        stats_calls = len(client.stats_calls())
+        snapshot = self.crawl(client, 'bob', InventorySnapshot.KIND_INCREMENTAL)
+
+        listings = for_sale_listings(snapshot.seller)
+        self.assertEqual(snapshot.status, InventorySnapshot.STATUS_COMPLETE)
+        self.assertEqual(listings.count(), 152)
+        self.assertEqual(len(client.stats_calls()) - stats_calls, 2)
+        self.assertFalse(listings.filter(lowest_price__isnull=True).exists())
+        self.assertFalse(listings.filter(price_ratio__isnull=True).exists())
+        self.assertFalse(listings.exclude(lowest_price_currency='EUR').exists())
+
+    def test_sync_marks_the_vanished_listings_as_removed(self):
+        inventory = [make_listing(1000 + i, 100 + i % 20) for i in range(500)]
+        client = FakeDiscogsClient({'bob': inventory})
+        self.crawl(client, 'bob')
+
+        vanished_ids = {1002, 1250, 1251, 1498}
+        inventory[:] = [listing for listing in inventory if listing['id'] not in vanished_ids] + [make_listing(2000, 500)]
+        snapshot = self.crawl(client, 'bob', InventorySnapshot.KIND_INCREMENTAL)
+
+        listings = for_sale_listings(snapshot.seller)
+        self.assertEqual(listings.count(), 497)
+        self.assertTrue(listings.filter(listing_id=2000).exists())
+        self.assertEqual(set(Listing.objects.filter(removed_at__isnull=False).values_list('listing_id', flat=True)), vanished_ids)
+        self.assertLess(snapshot.pages_done, snapshot.pages_total)
+
+    def test_sync_scans_everything_when_the_order_changed(self):
+        inventory = [make_listing(1000 + i, 100 + i % 20) for i in range(300) if i != 150]
+        client = FakeDiscogsClient({'bob': inventory})
+        self.crawl(client, 'bob')
+
+        # Relisted with an older id: it lands in the middle of the inventory
+        inventory.append(make_listing(1150, 120))
+        snapshot = self.crawl(client, 'bob', InventorySnapshot.KIND_INCREMENTAL)
+
+        self.assertEqual(snapshot.status, InventorySnapshot.STATUS_COMPLETE)
+        self.assertEqual(for_sale_listings(snapshot.seller).count(), 300)
+        self.assertTrue(for_sale_listings(snapshot.seller).filter(listing_id=1150).exists())
+
+class RefreshStatsJobTests(DiscogsTestCase):
+
+    @override_settings(DISCOGS_STATS_TTL=3600, DISCOGS_WATCH_STATS_INTERVAL=1800)
+    def test_refresh_fetches_stats_older_than_the_interval(self):
+        client = FakeDiscogsClient({'bob': [make_listing(1000, 4242)]})
+        snapshot = self.crawl(client, 'bob')
+        seller = snapshot.seller
+
+        # Older than the refresh interval, but still fresh for the searches
+        MarketplaceStats.objects.filter(release_id=4242).update(fetched_at=timezone.now() - timedelta(minutes=40))
+        client.stats[4242] = {'num_for_sale': 9, 'lowest_price': {'value': 4.0, 'currency': 'EUR'}}
+        self.assertEqual(stale_release_ids(seller, 1800, 10), [4242])
+
+        stats_calls = len(client.stats_calls())
+        with mock.patch('diggerweb_backend.discogs_api.watchlist._job_client', return_value=client):
+            refresh_stats_job({'seller_id': seller.pk})
+
+        self.assertEqual(len(client.stats_calls()) - stats_calls, 1)
+        self.assertEqual(for_sale_listings(seller).get().num_for_sale, 9)
+        self.assertEqual(stale_release_ids(seller, 1800, 10), [])
+
+    def test_stats_refresh_changes_the_etag_of_the_snapshot(self):
+        client = FakeDiscogsClient({'bob': [make_listing(1000, 4242)]})
+        seller = self.crawl(client, 'bob').seller
+        query_params = QueryDict('q=bob&mode=snapshot')
+        etag = snapshot_etag(query_params, get_latest_snapshot(seller), None)
+
+        update_listing_stats(seller, {4242: {'num_for_sale': 9, 'lowest_price': {'value': 4.0, 'currency': 'EUR'}}})
+        self.assertNotEqual(snapshot_etag(query_params, get_latest_snapshot(seller), None), etag)
+
+@override_settings(DISCOGS_RATE_LIMIT_DIR=tempfile.mkdtemp())
+class AsyncClientTests(SimpleTestCase):
+
+    # Another worker holds the state file of the bucket: the loop must keep serving the other coroutines
+    @skipIf(fcntl is None, "No file locks on this platform")
+    def test_rate_limiter_lock_does_not_block_the_loop(self):
+        client = AsyncDiscogsClient('async-token', 'secret', 'key', 'secret')
+        locked = threading.Event()
+
+        def hold_lock():
+            with open(client.limiter.path, 'a') as state_file:
+                fcntl.flock(state_file.fileno(), fcntl.LOCK_EX)
+                locked.set()
+                time.sleep(0.3)
+                fcntl.flock(state_file.fileno(), fcntl.LOCK_UN)
+
+        async def main():
+            ticks = 0
+
+            async def ticker():
+                nonlocal ticks
+                while True:
+                    await asyncio.sleep(0.01)
+                    ticks += 1
+
+            ticker_task = asyncio.ensure_future(ticker())
+            await client.schedule('https://api.discogs.com/users/bob/inventory')
+            ticker_task.cancel()
+            return ticks
+
+        holder = threading.Thread(target=hold_lock)
+        holder.start()
+        locked.wait()
+        ticks = asyncio.run(main())
+        holder.join()
+
+        self.assertGreater(ticks, 10)
+
+    def test_error_pages_that_are_not_json_raise_http_errors(self):
+        client = AsyncDiscogsClient('gateway-token', 'secret', 'key', 'secret')
+
+        def handle(request):
+            return httpx.Response(502, content=b'<html><body><h1>502 Bad Gateway</h1></body></html>', headers={'Content-Type': 'text/html'})
+
+        async def fetch():
+            async with httpx.AsyncClient(transport=httpx.MockTransport(handle)) as http_client:
+                with mock.patch('diggerweb_backend.discogs_api.async_client.get_http_client', return_value=http_client):
+                    return await client.get(INVENTORY_URL)
+
+        with self.assertRaises(HTTPError) as raised:
+            asyncio.run(fetch())
+        self.assertEqual(raised.exception.status_code, 502)
+        self.assertEqual(str(raised.exception), "502: Bad Gateway")
+
+class LiveSearchTests(DiscogsTestCase):
+
+    # History and offers are bookkeeping: their failures must not empty a search that succeeded
+    def test_bookkeeping_errors_keep_the_results(self):
+        client = FakeDiscogsClient({'bob': [make_listing(1000 + i, 100 + i) for i in range(5)]})
+
+        with mock.patch('diggerweb_backend.discogs_api.views.record_offers', side_effect=DatabaseError("disk full")), \
+             mock.patch('diggerweb_backend.discogs_api.views.add_release_details', side_effect=DatabaseError("disk full")):
+            output_results, pagination_info = DiscogsSearchView().searchUserInventory_API_Filtered(client, 'bob', 1, 50)
+
+        self.assertEqual(len(output_results), 5)
+        self.assertEqual(pagination_info['items'], 5)
+        self.assertTrue(all('error' not in item and item['num_for_sale'] == 3 for item in output_results))
+
+    def test_async_search_completes_the_page_like_the_sync_one(self):
+        client = FakeDiscogsClient({'bob': [make_listing(1000 + i, 100 + i) for i in range(3)]})
+        output_results, pagination_info = asyncio.run(search_user_inventory_async(FakeAsyncDiscogsClient(client), client, 'bob', 1, 50))
+
+        self.assertEqual(len(output_results), 3)
+        self.assertTrue(all('cheaper_elsewhere' in item for item in output_results))
+        self.assertEqual(ListingPriceHistory.objects.filter(seller__username='bob').count(), 3)
+        self.assertEqual(ReleaseOffer.objects.filter(seller__username='bob').count(), 3)
+
+class SingleFlightTests(SimpleTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        settings_override = override_settings(DISCOGS_SINGLEFLIGHT_DIR=self.directory, DISCOGS_SINGLEFLIGHT_LOCK_BUCKETS=8,
+                                              DISCOGS_SINGLEFLIGHT_LOCK_TIMEOUT=2, DISCOGS_SINGLEFLIGHT_RESULT_TTL=15)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_lock_files_are_bounded(self):
+        for release_id in range(200):
+            with file_lock(('stats', release_id)):
+                pass
+        self.assertLessEqual(len(os.listdir(self.directory)), 8)
+
+    # A search holds its lock while the stats of its page take theirs, even when they fall in the same bucket
+    @override_settings(DISCOGS_SINGLEFLIGHT_LOCK_BUCKETS=1)
+    def test_nested_locks_of_other_kinds_do_not_wait(self):
+        start = time.monotonic()
+        with file_lock(('search', 'bob', 1, 50)):
+            with file_lock(('stats', 4242)):
+                pass
+        self.assertLess(time.monotonic() - start, 1)
+
+    def test_prune_deletes_expired_files_only(self):
+        store_shared_result(('search', 'old'), {'results': []})
+        store_shared_result(('search', 'new'), {'results': []})
+        old_path = os.path.join(self.directory, f"{_key_name(('search', 'old'))}.json")
+        os.utime(old_path, (time.time() - 60, time.time() - 60))
+        open(os.path.join(self.directory, f"{'0' * 40}.lock"), 'w').close()
+        with file_lock(('stats', 4242)):
+            pass
+
+        self.assertEqual(prune_shared_files(), 2)
+        self.assertIsNone(load_shared_result(('search', 'old')))
+        self.assertEqual(load_shared_result(('search', 'new')), {'results': []})
+        self.assertEqual(len([name for name in os.listdir(self.directory) if name.endswith('.lock')]), 1)
+
+@override_settings(DISCOGS_RATE_LIMIT_DEFAULT=6, DISCOGS_RATE_LIMIT_BACKOFF_BASE=1.0, DISCOGS_RATE_LIMIT_BACKOFF_MAX=4.0,
+                   DISCOGS_RATE_LIMIT_RESERVE_CRAWL=0.5)
+class RateLimiterTests(SimpleTestCase):
+
+    def setUp(self):
+        settings_override = override_settings(DISCOGS_RATE_LIMIT_DIR=tempfile.mkdtemp())
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        # Wall clock of the limiters, moved by the tests
+        self.now = 1000.0
+        clock = mock.patch('diggerweb_backend.discogs_api.ratelimit.time')
+        clock.start().time.side_effect = lambda: self.now
+        self.addCleanup(clock.stop)
+
+    def test_bucket_empties_and_refills(self):
+        limiter = RateLimiter('bucket')
+        for _ in range(6):
+            self.assertEqual(limiter.try_acquire(), 0.0)
+
+        # 6 tokens per minute: the next one comes in 10 seconds, polled at most every second
+        self.assertEqual(limiter.try_acquire(), 1.0)
+        self.now += 10
+        self.assertEqual(limiter.try_acquire(), 0.0)
+        self.assertGreater(limiter.try_acquire(), 0.0)
+
+    def test_budget_is_shared_by_the_workers(self):
+        first, second = RateLimiter('shared'), RateLimiter('shared')
+        for _ in range(3):
+            self.assertEqual(first.try_acquire(), 0.0)
+            self.assertEqual(second.try_acquire(), 0.0)
+        self.assertGreater(first.try_acquire(), 0.0)
+
+    def test_crawls_leave_the_reserve_to_interactive_calls(self):
+        limiter = RateLimiter('reserve')
+        for _ in range(3):
+            self.assertEqual(limiter.try_acquire(PRIORITY_CRAWL), 0.0)
+        self.assertGreater(limiter.try_acquire(PRIORITY_CRAWL), 0.0)
+        self.assertEqual(limiter.try_acquire(), 0.0)
+
+    def test_headers_can_only_lower_the_budget(self):
+        limiter = RateLimiter('headers')
+        limiter.update_from_headers({'X-Discogs-Ratelimit': '6', 'X-Discogs-Ratelimit-Remaining': '1'})
+        self.assertEqual(limiter.remaining(), 1)
+        limiter.update_from_headers({'X-Discogs-Ratelimit': '6', 'X-Discogs-Ratelimit-Remaining': '5'})
+        self.assertEqual(limiter.remaining(), 1)
+
+    def test_throttled_responses_block_the_bucket_with_backoff(self):
+        limiter = RateLimiter('throttled')
+        self.assertEqual(limiter.register_throttled(), 1.0)
+        self.assertEqual(limiter.register_throttled(), 2.0)
+        self.assertEqual(limiter.register_throttled(), 4.0)
+        self.assertEqual(limiter.register_throttled(), 4.0)
+
+        # Blocked until the longest delay is over, whatever the tokens refilled meanwhile
+        self.assertGreater(RateLimiter('throttled').try_acquire(), 0.0)
+        self.now += 3.5
+        self.assertGreater(limiter.try_acquire(), 0.0)
+        self.now += 10
+        self.assertEqual(limiter.try_acquire(), 0.0)
+
+        # A successful response resets the backoff
+        limiter.update_from_headers({})
+        self.assertEqual(limiter.register_throttled(), 1.0)
+
+    def test_retry_after_overrides_the_backoff(self):
+        limiter = RateLimiter('retry-after')
+        self.assertEqual(limiter.register_throttled(7.0), 7.0)
+        self.now += 6
+        self.assertGreater(limiter.try_acquire(), 0.0)
+
+        # The bucket has been emptied too: the first token is back after 10 seconds
+        self.now += 4
+        self.assertEqual(limiter.try_acquire(), 0.0)
+
+class KeysetPaginationTests(TestCase):
+
+    def setUp(self):
+        seller = Seller.objects.create(username='bob')
+        # Ties and missing values, which the keyset has to tell apart with the listing id
+        num_for_sale = [None, 3, 1, 3, None, 2, 1, 3, 5, None, 2, 2, 1, 4, 3, None, 5, 1, 2, 3, 4, None, 1]
+        Listing.objects.bulk_create([Listing(listing_id=1000 + i, seller=seller, release_id=100 + i, num_for_sale=value,
+                                             price=None if i % 7 == 0 else 10 + i % 4, status='For Sale')
+                                     for i, value in enumerate(num_for_sale)])
+        self.listings = seller.listings.all()
+
+    def pages(self, sort, per_page):
+        listing_ids = []
+        cursor = None
+        while True:
+            listings = order_listings(self.listings, sort)
+            if cursor:
+                listings = after_cursor(listings, sort, *decode_cursor(cursor, sort))
+            page = list(listings[:per_page + 1])
+            listing_ids.extend(listing.listing_id for listing in page[:per_page])
+            if len(page) <= per_page:
+                return listing_ids
+            cursor = encode_cursor(sort, page[per_page - 1])
+
+    def test_pages_follow_the_order_without_gaps_or_repeats(self):
+        for sort in ('num_for_sale', '-num_for_sale', 'price', '-price', 'listed', '-listed'):
+            for per_page in (1, 4, 5):
+                with self.subTest(sort=sort, per_page=per_page):
+                    expected = list(order_listings(self.listings, sort).values_list('listing_id', flat=True))
+                    self.assertEqual(self.pages(sort, per_page), expected)
+
+    def test_missing_values_come_last(self):
+        listing_ids = self.pages('num_for_sale', 4)
+        missing = set(self.listings.filter(num_for_sale__isnull=True).values_list('listing_id', flat=True))
+        self.assertEqual(set(listing_ids[-len(missing):]), missing)
+
+    def test_cursor_of_another_sort_is_rejected(self):
+        cursor = encode_cursor('price', self.listings.first())
+        with self.assertRaises(ValueError):
+            decode_cursor(cursor, '-price')
+        with self.assertRaises(ValueError):
+            decode_cursor('not a cursor', 'price')
+
+# In-memory stand-in of crawler.InventoryPages, counting the downloaded pages
+class FakeInventoryPages:
+
+    def __init__(self, listing_ids, per_page):
+        self.listing_ids = listing_ids
+        self.per_page = per_page
+        self.pages_total = max(1, (len(listing_ids) + per_page - 1) // per_page)
+        self.items_total = len(listing_ids)
+        self.downloaded = set()
+
+    def get(self, page_num):
+        self.downloaded.add(page_num)
+        start = (page_num - 1) * self.per_page
+        return [{'id': listing_id} for listing_id in self.listing_ids[start:start + self.per_page]]
+
+    def first_position(self, page_num):
+        return (page_num - 1) * self.per_page
+
+class LocateVanishedTests(SimpleTestCase):
+
+    def locate(self, known, upstream, per_page=10):
+        pages = FakeInventoryPages(upstream, per_page)
+        index = {listing_id: i for i, listing_id in enumerate(known)}
+        new_count = sum(1 for listing_id in pages.get(1) if listing_id['id'] not in index)
+        return _locate_vanished(pages, known, index, new_count, 1), pages
+
+    def test_vanished_listings_are_found_by_bisection(self):
+        known = list(range(1000, 0, -1))
+        vanished_ids = {997, 640, 639, 12}
+        upstream = [1002, 1001] + [listing_id for listing_id in known if listing_id not in vanished_ids]
+
+        vanished, pages = self.locate(known, upstream)
+        self.assertEqual(vanished, vanished_ids)
+        self.assertLess(len(pages.downloaded), pages.pages_total)
+
+    def test_nothing_vanished_downloads_only_the_ends(self):
+        known = list(range(500, 0, -1))
+        vanished, pages = self.locate(known, [501] + known)
+        self.assertEqual(vanished, set())
+        self.assertEqual(pages.downloaded, {1})
+
+    def test_new_listings_below_the_top_are_inconsistent(self):
+        known = list(range(500, 0, -1))
+        upstream = list(known)
+        upstream.insert(250, 10000)
+        with self.assertRaises(_InconsistentOrder):
+            self.locate(known, upstream)
+
+class JobQueueTests(TestCase):
+
+    def test_active_jobs_are_not_queued_twice(self):
+        job, created = enqueue_job('refresh', 'refresh:bob', run_after=timezone.now() + timedelta(hours=1))
+        same_job, created_again = enqueue_job('refresh', 'refresh:bob')
+
+        self.assertTrue(created)
+        self.assertFalse(created_again)
+        self.assertEqual(same_job.pk, job.pk)
+        # Moved earlier, to the run_after of the second request
+        self.assertLessEqual(Job.objects.get(pk=job.pk).run_after, timezone.now())
+
+    def test_a_job_is_claimed_by_one_worker(self):
+        for i in range(3):
+            enqueue_job('refresh', f"refresh:{i}")
+
+        first = claim_jobs('worker-1', 2)
+        second = claim_jobs('worker-2', 2)
+        self.assertEqual(len(first), 2)
+        self.assertEqual(len(second), 1)
+        self.assertFalse({job.pk for job in first} & {job.pk for job in second})
+        self.assertEqual(claim_jobs('worker-3', 2), [])
+
+        # A new job with the key of a running one waits for it
+        self.assertFalse(enqueue_job('refresh', 'refresh:0')[1])
+
+    def test_expired_leases_are_claimed_again_until_the_attempts_run_out(self):
+        job, _ = enqueue_job('refresh', 'refresh:bob', max_attempts=2)
+        self.assertEqual(claim_jobs('worker-1', 1)[0].attempts, 1)
+        self.assertEqual(claim_jobs('worker-2', 1), [])
+
+        Job.objects.filter(pk=job.pk).update(lease_expires_at=timezone.now() - timedelta(seconds=1))
+        reclaimed = claim_jobs('worker-2', 1)
+        self.assertEqual(reclaimed[0].locked_by, 'worker-2')
+        self.assertEqual(reclaimed[0].attempts, 2)
+
+        # The first worker lost the job: its outcome is ignored
+        self.assertEqual(complete_job(job, 'worker-1'), 0)
+
+        Job.objects.filter(pk=job.pk).update(lease_expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(claim_jobs('worker-3', 1), [])
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.STATUS_FAILED)
+
+    @override_settings(DISCOGS_JOBS_RETRY_DELAY=60)
+    def test_failed_jobs_are_retried_with_exponential_delay(self):
+        job, _ = enqueue_job('refresh', 'refresh:bob', max_attempts=3)
+
+        for attempt, delay in ((1, 60), (2, 120)):
+            claimed = claim_jobs('worker-1', 1)[0]
+            self.assertEqual(claimed.attempts, attempt)
+            fail_job(claimed, 'worker-1', 'boom')
+
+            job.refresh_from_db()
+            self.assertEqual(job.status, Job.STATUS_QUEUED)
+            self.assertAlmostEqual((job.run_after - timezone.now()).total_seconds(), delay, delta=5)
+            Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+
+        claimed = claim_jobs('worker-1', 1)[0]
+        fail_job(claimed, 'worker-1', 'boom')
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.STATUS_FAILED)
+        self.assertEqual(job.last_error, 'boom')
+
+    def test_completed_jobs_free_their_key(self):
+        job, _ = enqueue_job('refresh', 'refresh:bob')
+        complete_job(claim_jobs('worker-1', 1)[0], 'worker-1')
+
+        self.assertEqual(Job.objects.get(pk=job.pk).status, Job.STATUS_DONE)
+        self.assertTrue(enqueue_job('refresh', 'refresh:bob')[1])
+
+STATS = {'num_for_sale': 4, 'lowest_price': {'value': 7.5, 'currency': 'EUR'}}
+
+@override_settings(DISCOGS_STATS_TTL=100, DISCOGS_STATS_MAX_STALE=1000)
+class StatsCacheTests(DiscogsTestCase):
+
+    def store_row(self, release_id, age):
+        MarketplaceStats.objects.create(release_id=release_id, num_for_sale=STATS['num_for_sale'], lowest_price=7.5, currency='EUR',
+                                        fetched_at=timezone.now() - timedelta(seconds=age))
+
+    def wait_for_refreshes(self):
+        deadline = time.monotonic() + 5
+        while STATS_CACHE.refreshing and time.monotonic() < deadline:
+            time.sleep(0.01)
+        REFRESH_EXECUTOR.submit(lambda: None).result()
+
+    def test_fresh_entries_are_served_from_memory(self):
+        client = FakeDiscogsClient()
+        STATS_CACHE.put(1, STATS, time.time() - 50)
+
+        cached, missing = lookup_cached_stats(client, [1, 1, 2])
+        self.assertEqual(cached, {1: STATS})
+        self.assertEqual(missing, [2])
+        self.wait_for_refreshes()
+        self.assertEqual(client.stats_calls(), [])
+
+    def test_fresh_rows_are_served_from_the_database(self):
+        self.store_row(1, 50)
+        cached, missing = lookup_cached_stats(FakeDiscogsClient(), [1])
+
+        self.assertEqual(cached, {1: STATS})
+        self.assertEqual(missing, [])
+        self.assertIsNotNone(STATS_CACHE.get(1))
+
+    def test_stale_entries_are_served_and_refreshed_in_background(self):
+        client = FakeDiscogsClient(stats={1: {'num_for_sale': 9, 'lowest_price': None}, 2: {'num_for_sale': 8, 'lowest_price': None}})
+        STATS_CACHE.put(1, STATS, time.time() - 500)
+        self.store_row(2, 500)
+
+        cached, missing = lookup_cached_stats(client, [1, 2])
+        self.assertEqual(cached, {1: STATS, 2: STATS})
+        self.assertEqual(missing, [])
+
+        self.wait_for_refreshes()
+        self.assertEqual(len(client.stats_calls()), 2)
+        self.assertEqual(STATS_CACHE.get(1)[0]['num_for_sale'], 9)
+        self.assertEqual(MarketplaceStats.objects.get(release_id=2).num_for_sale, 8)
+
+    def test_entries_beyond_the_max_stale_are_fetched_again(self):
+        STATS_CACHE.put(1, STATS, time.time() - 5000)
+        self.store_row(2, 5000)
+
+        cached, missing = lookup_cached_stats(FakeDiscogsClient(), [1, 2])
+        self.assertEqual(cached, {})
+        self.assertEqual(sorted(missing), [1, 2])
+
+# Small dumps in the format of https://data.discogs.com, the releases one with a record without id
+def dump_path(kind):
+    return os.path.join(DUMPS_DIR, f"discogs_20250101_{kind}.xml.gz")
+
+class DumpImportTests(DiscogsTestCase):
+
+    def test_releases_are_imported_and_malformed_records_skipped(self):
+        dump_import = import_dump(dump_path('releases'), batch_size=2)
+
+        self.assertEqual((dump_import.kind, dump_import.status, dump_import.records_done), ('releases', DumpImport.STATUS_COMPLETE, 6))
+        self.assertEqual(sorted(Release.objects.values_list('release_id', flat=True)), [101, 102, 103, 104, 105])
+        self.assertEqual(Release.objects.get(release_id=101).details(), {
+            'year': 1994,
+            'country': 'Germany',
+            'formats': 'Vinyl, 12", 33 \u2153 RPM',
+            'labels': 'Basic Channel',
+            'catno': 'BC-04',
+            'genres': 'Electronic',
+            'styles': 'Dub Techno, Minimal',
+        })
+        release = Release.objects.get(release_id=103)
+        self.assertEqual((release.artist, release.master_id, release.year), ('Rhythm & Sound, Tikiman', None, 1997))
+        self.assertIsNone(Release.objects.get(release_id=104).year)
+        self.assertEqual(Release.objects.get(release_id=105).catno, 'CR-01, CR 01')
+
+    def test_artists_and_labels_are_imported_by_the_command(self):
+        call_command('import_dump', dump_path('artists'), dump_path('labels'), batch_size=2, stdout=open(os.devnull, 'w'))
+
+        self.assertEqual(Artist.objects.count(), 5)
+        self.assertEqual(Artist.objects.get(artist_id=2).realname, 'Moritz von Oswald')
+        # The nested labels and members are not records of their own
+        self.assertEqual(sorted(Label.objects.values_list('label_id', 'parent_id')), [(11, None), (12, 11), (13, None), (14, 11)])
+        self.assertEqual(DumpImport.objects.filter(status=DumpImport.STATUS_COMPLETE).count(), 2)
+
+    def test_records_already_yielded_are_dropped_from_the_tree(self):
+        roots = []
+        iterparse = ET.iterparse
+
+        def spy_iterparse(*args, **kwargs):
+            for event, element in iterparse(*args, **kwargs):
+                if not roots:
+                    roots.append(element)
+                yield event, element
+
+        with mock.patch('diggerweb_backend.discogs_api.dumps.ET.iterparse', side_effect=spy_iterparse), open_dump(dump_path('releases')) as dump_file:
+            records = iter_records(dump_file)
+            self.assertEqual(next(records), 'releases')
+            yielded = []
+            for element in records:
+                self.assertFalse(any(previous in roots[0] for previous in yielded))
+                yielded.append(element)
+
+        self.assertEqual(len(yielded), 6)
+        self.assertEqual(len(roots[0]), 0)
+
+    # Stopped like a killed command, after its first batch
+    def test_interrupted_import_resumes_after_the_last_batch(self):
+        def interrupt(dump_import):
+            raise KeyboardInterrupt()
+
+        with self.assertRaises(KeyboardInterrupt):
+            import_dump(dump_path('releases'), batch_size=2, progress=interrupt)
+
+        self.assertEqual(DumpImport.objects.get().records_done, 2)
+        self.assertEqual(sorted(Release.objects.values_list('release_id', flat=True)), [101, 102])
+
+        # The committed batch is skipped, not written again
+        Release.objects.filter(release_id=101).update(title='Edited')
+        committed = []
+        dump_import = import_dump(dump_path('releases'), batch_size=2, progress=lambda dump_import: committed.append(dump_import.records_done))
+
+        self.assertEqual(committed, [4, 6])
+        self.assertEqual((dump_import.status, dump_import.records_done), (DumpImport.STATUS_COMPLETE, 6))
+        self.assertEqual(DumpImport.objects.count(), 1)
+        self.assertEqual(Release.objects.count(), 5)
+        self.assertEqual(Release.objects.get(release_id=101).title, 'Edited')
+
+        # A complete file is imported again from the beginning, replacing its rows
+        import_dump(dump_path('releases'), batch_size=4)
+        self.assertEqual(Release.objects.count(), 5)
+        self.assertEqual(Release.objects.get(release_id=101).title, 'Quadrant Dub')
+
+    def test_files_of_other_kinds_are_rejected(self):
+        path = os.path.join(tempfile.mkdtemp(), 'masters.xml')
+        with open(path, 'w') as dump_file:
+            dump_file.write('<masters><master id="1"/></masters>')
+        with self.assertRaises(ValueError):
+            import_dump(path)
+        self.assertFalse(DumpImport.objects.exists())
+
+    def test_live_pages_get_the_details_of_imported_releases(self):
+        import_dump(dump_path('releases'))
+        client = FakeDiscogsClient({'bob': [make_listing(1000, 101), make_listing(1001, 999)]})
+
+        output_results, _ = DiscogsSearchView().searchUserInventory_API_Filtered(client, 'bob', 1, 50)
+
+        items = {item['release_id']: item for item in output_results}
+        self.assertEqual((items[101]['year'], items[101]['catno'], items[101]['styles']), (1994, 'BC-04', 'Dub Techno, Minimal'))
+        self.assertNotIn('year', items[999])
+
+    def test_details_are_looked_up_in_chunks(self):
+        Release.objects.bulk_create([Release(release_id=release_id, year=2000) for release_id in range(1, 8)])
+        items = [{'release_id': release_id} for release_id in range(1, 10)] + [{'release_id': None}]
+
+        with mock.patch('diggerweb_backend.discogs_api.dumps.DETAILS_CHUNK', 3), self.assertNumQueries(3):
+            add_release_details(items)
+
+        self.assertEqual([item.get('year') for item in items], [2000] * 7 + [None] * 3)
+
+class WatchlistTests(DiscogsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.discogs = FakeDiscogsClient({'bob': [make_listing(1000, 4242)]})
+        authenticate = mock.patch.object(DiscogsAuthenticatedView, 'authenticate_discogs', return_value=(self.discogs, None, None))
+        authenticate.start()
+        self.addCleanup(authenticate.stop)
+
+    def login_staff(self):
+        self.client.force_login(User.objects.create_user('admin', password='secret', is_staff=True))
+
+    def test_changes_need_a_staff_user(self):
+        self.assertEqual(self.client.post('/api/discogs/watch/', {'username': 'bob'}).status_code, 403)
+        self.client.force_login(User.objects.create_user('visitor', password='secret'))
+        self.assertEqual(self.client.post('/api/discogs/watch/', {'username': 'bob'}).status_code, 403)
+        self.assertEqual(self.client.delete('/api/discogs/watch/bob/').status_code, 403)
+
+        self.assertFalse(Seller.objects.exists())
+        self.assertEqual(self.client.get('/api/discogs/watch/').status_code, 200)
+
+    def test_sellers_are_checked_on_discogs(self):
+        self.login_staff()
+
+        response = self.client.post('/api/discogs/watch/', {'username': 'nobody'})
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(Seller.objects.exists())
+
+        response = self.client.post('/api/discogs/watch/', {'username': 'bob', 'stats_interval': 600})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(WatchedSeller.objects.get().seller.username, 'bob')
+        self.assertEqual(len(self.discogs.calls), 2)
+
+        self.assertEqual(self.client.post('/api/discogs/watch/', {'username': 'bob'}).status_code, 200)
+        self.assertEqual(self.client.delete('/api/discogs/watch/bob/').status_code, 204)
+        self.assertFalse(WatchedSeller.objects.exists())
+
+    def test_bodies_that_are_not_objects_are_rejected(self):
+        self.login_staff()
+        for body in (['bob'], 'bob', 42):
+            with self.subTest(body=body):
+                response = self.client.post('/api/discogs/watch/', json.dumps(body), content_type='application/json')
+                self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.discogs.calls, [])
+
+OAUTH_TOKEN = re.compile(r'oauth_token="([^"]+)"')
+
+# Stand-in of the Discogs API for the HTTP sessions of the clients: answers with the statuses queued for a
+# (token, path) pair, 200 when none is left, and records the calls as (token, path)
+class FakeDiscogsApi:
+
+    def __init__(self, statuses):
+        self.statuses = {key: list(values) for key, values in statuses.items()}
+        self.calls = []
+
+    def answer(self, url, headers):
+        key = (OAUTH_TOKEN.search(headers['Authorization']).group(1), urlparse(url).path)
+        self.calls.append(key)
+        queued = self.statuses.get(key)
+        status_code = queued.pop(0) if queued else 200
+        body = {'message': 'You must authenticate to access this resource.'} if status_code == 401 else {'username': key[0], 'listings': []}
+        return status_code, json.dumps(body).encode('utf8')
+
+    # requests.Session.request
+    def request(self, method, url, headers=None, data=None):
+        status_code, content = self.answer(url, headers)
+        return mock.Mock(status_code=status_code, content=content, headers={})
+
+    # httpx.MockTransport handler
+    def handle(self, request):
+        status_code, content = self.answer(str(request.url), request.headers)
+        return httpx.Response(status_code, content=content)
+
+INVENTORY_URL = 'https://api.discogs.com/users/bob/inventory?status=For+Sale&page=1&per_page=50'
+
+# Rate limiters and signers are per process: the test gets full budgets in a directory of its own, and a
+# consumer key to sign with
+def isolate_credentials(test_case):
+    settings_override = override_settings(DISCOGS_RATE_LIMIT_DIR=tempfile.mkdtemp())
+    settings_override.enable()
+    test_case.addCleanup(settings_override.disable)
+
+    patches = [
+        mock.patch.dict('diggerweb_backend.discogs_api.ratelimit._limiters', clear=True),
+        mock.patch.dict(CREDENTIAL_POOL.signers, clear=True),
+        mock.patch('diggerweb_backend.discogs_api.client.DISCOGS_CONSUMER_KEY', 'key'),
+        mock.patch('diggerweb_backend.discogs_api.client.DISCOGS_CONSUMER_SECRET', 'secret'),
+        mock.patch('diggerweb_backend.discogs_api.credentials.DISCOGS_CONSUMER_KEY', 'key'),
+        mock.patch('diggerweb_backend.discogs_api.credentials.DISCOGS_CONSUMER_SECRET', 'secret'),
+    ]
+    for patch in patches:
+        patch.start()
+        test_case.addCleanup(patch.stop)
+
+    invalidate_credentials_cache()
+    test_case.addCleanup(invalidate_credentials_cache)
+
+# The async client revokes tokens from a thread, with its own connection
+@override_settings(DISCOGS_UNAUTHORIZED_COOLDOWN=30)
+class UnauthorizedTests(TransactionTestCase):
+
+    def setUp(self):
+        isolate_credentials(self)
+
+        # 'primary' is the most recently authorized account
+        save_access_token('other', 'other-secret', 'other')
+        DiscogsCredentials.objects.filter(access_token='other').update(last_updated=timezone.now() - timedelta(hours=1))
+        save_access_token('primary', 'primary-secret', 'primary')
+        invalidate_credentials_cache()
+
+    def client_for(self, api, access_token='primary'):
+        client = create_client(access_token, f"{access_token}-secret")
+        client._fetcher.session = api
+        return client
+
+    def revoked(self):
+        return set(DiscogsCredentials.objects.filter(revoked_at__isnull=False).values_list('access_token', flat=True))
+
+    def test_one_off_rejection_cools_the_token_down(self):
+        api = FakeDiscogsApi({('primary', '/users/bob/inventory'): [401]})
+        CLIENT_POOL.store_identity_data('primary', {'username': 'primary'})
+
+        self.assertEqual(self.client_for(api)._get(INVENTORY_URL)['listings'], [])
+
+        self.assertEqual(api.calls, [('primary', '/users/bob/inventory'), ('primary', '/oauth/identity'), ('other', '/users/bob/inventory')])
+        self.assertEqual(self.revoked(), set())
+        self.assertIsNone(CLIENT_POOL.get_identity_data('primary'))
+        self.assertGreater(get_rate_limiter('primary').status()[2], 25)
+
+    def test_token_rejected_by_the_identity_check_leaves_the_pool(self):
+        api = FakeDiscogsApi({('primary', '/users/bob/inventory'): [401], ('primary', '/oauth/identity'): [401]})
+
+        self.assertEqual(self.client_for(api)._get(INVENTORY_URL)['listings'], [])
+
+        self.assertEqual(api.calls[-1], ('other', '/users/bob/inventory'))
+        self.assertEqual(self.revoked(), {'primary'})
+
+    def test_rejected_identity_call_revokes_without_another_check(self):
+        api = FakeDiscogsApi({('primary', '/oauth/identity'): [401]})
+
+        with self.assertRaises(HTTPError):
+            get_identity(self.client_for(api))
+
+        self.assertEqual(api.calls, [('primary', '/oauth/identity')])
+        self.assertEqual(self.revoked(), {'primary'})
+
+    def test_async_client_checks_the_identity_too(self):
+        api = FakeDiscogsApi({('primary', '/users/bob/inventory'): [401, 401], ('primary', '/oauth/identity'): [200, 401]})
+        credentials = [('primary', 'primary-secret'), ('other', 'other-secret')]
+
+        async def search(client):
+            async with httpx.AsyncClient(transport=httpx.MockTransport(api.handle)) as http_client:
+                with mock.patch('diggerweb_backend.discogs_api.async_client.get_http_client', return_value=http_client):
+                    return await client.get(INVENTORY_URL)
+
+        self.assertEqual(asyncio.run(search(AsyncDiscogsClient('primary', 'primary-secret', 'key', 'secret', credentials)))['listings'], [])
+        self.assertEqual(api.calls, [('primary', '/users/bob/inventory'), ('primary', '/oauth/identity'), ('other', '/users/bob/inventory')])
+        self.assertEqual(self.revoked(), set())
+
+        # With fresh budgets, a second rejection confirmed by the identity check revokes the token
+        api.calls = []
+        with override_settings(DISCOGS_RATE_LIMIT_DIR=tempfile.mkdtemp()), mock.patch.dict('diggerweb_backend.discogs_api.ratelimit._limiters', clear=True):
+            asyncio.run(search(AsyncDiscogsClient('primary', 'primary-secret', 'key', 'secret', credentials)))
+        self.assertEqual(api.calls, [('primary', '/users/bob/inventory'), ('primary', '/oauth/identity'), ('other', '/users/bob/inventory')])
+        self.assertEqual(self.revoked(), {'primary'})
+
+class AccountsViewTests(TestCase):
+
+    def test_accounts_are_shown_to_staff_users_only(self):
+        DiscogsCredentials.objects.create(access_token='alice-token', access_secret='alice-secret', username='alice')
+        self.assertEqual(self.client.get('/api/discogs/accounts/').status_code, 403)
+
+        self.client.force_login(User.objects.create_user('admin', password='secret', is_staff=True))
+        response = self.client.get('/api/discogs/accounts/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([account['username'] for account in response.json()['results']], ['alice'])
+        self.assertNotIn('alice-token', response.content.decode('utf8'))
+        self.assertNotIn('alice-secret', response.content.decode('utf8'))
+
+# FakeDiscogsClient whose inventory calls fail for some users with the given exceptions
+class FailingDiscogsClient(FakeDiscogsClient):
+
+    def __init__(self, inventories, failures):
+        super().__init__(inventories)
+        self.failures = failures
+
+    def _get(self, url):
+        match = INVENTORY_PATH.search(urlparse(url).path)
+        if match and match.group(1) in self.failures:
+            raise self.failures[match.group(1)]
+        return super()._get(url)
+
+class BatchSearchTests(DiscogsTestCase):
+
+    def test_errors_of_a_seller_leave_the_others_results(self):
+        client = FailingDiscogsClient({'bob': [make_listing(1000, 4242)], 'carol': [make_listing(2000, 4242, 8.0)]}, {
+            'dave': requests.ConnectionError("Connection refused"),
+            'eve': requests.Timeout("Read timed out"),
+            'frank': DiscogsAPIError("Unexpected response"),
+        })
+
+        releases, sellers = search_inventories(client, ['bob', 'carol', 'dave', 'eve', 'frank', 'nobody'], 1, 50)
+
+        self.assertEqual([(release['release_id'], release['sellers']) for release in releases], [(4242, ['bob', 'carol'])])
+        self.assertEqual(sellers['dave'], {'error': 'Connection refused', 'status': None})
+        self.assertEqual(sellers['eve']['error'], 'Read timed out')
+        self.assertEqual(sellers['frank']['error'], 'Unexpected response')
+        self.assertEqual(sellers['nobody']['status'], 404)
+        self.assertEqual(sellers['bob']['matching'], 1)
+
+    def test_unauthorized_fails_the_whole_batch(self):
+        client = FailingDiscogsClient({'bob': [make_listing(1000, 4242)]}, {'carol': HTTPError("Unauthorized", 401)})
+        with self.assertRaises(HTTPError):
+            search_inventories(client, ['bob', 'carol'], 1, 50)
+
+class ExportTests(DiscogsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.discogs = FakeDiscogsClient({'bob': [make_listing(1000 + i, 100 + i) for i in range(5)]})
+        authenticate = mock.patch.object(DiscogsAuthenticatedView, 'authenticate_discogs', return_value=(self.discogs, None, None))
+        authenticate.start()
+        self.addCleanup(authenticate.stop)
+
+    def export(self, **params):
+        response = self.client.get('/api/discogs/export/', params)
+        content = b''.join(response.streaming_content).decode('utf8') if response.streaming else None
+        return response, content
+
+    def test_unknown_sellers_are_not_created(self):
+        response, _ = self.export(q='nobody', source='live')
+        self.assertEqual(response.status_code, 404)
+        response, _ = self.export(q='nobody')
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(Seller.objects.exists())
+
+        response, _ = self.export(q='bob', source='live')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(Seller.objects.values_list('username', flat=True)), ['bob'])
+
+    def test_cursors_round_trip(self):
+        cursor = encode_export_cursor('live', 3, 123456789)
+        self.assertNotIn('=', cursor)
+        self.assertEqual(decode_export_cursor(cursor), ('live', 3, 123456789))
+
+        for cursor in ('not a cursor', encode_export_cursor('other', 1, 1), encode_export_cursor('live', 1, '1'), ''):
+            with self.subTest(cursor=cursor), self.assertRaises(ValueError):
+                decode_export_cursor(cursor)
+
+    def test_snapshot_export_resumes_after_the_last_row(self):
+        self.crawl(self.discogs, 'bob')
+        response, content = self.export(q='bob', format='jsonl')
+        self.assertEqual(response['X-Export-Source'], 'snapshot')
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual([row['id'] for row in rows], [1000, 1001, 1002, 1003, 1004])
+
+        _, content = self.export(q='bob', format='jsonl', cursor=rows[1]['cursor'])
+        self.assertEqual([json.loads(line)['id'] for line in content.splitlines()], [1002, 1003, 1004])
+
+        response, _ = self.export(q='bob', source='live', cursor=rows[1]['cursor'])
+        self.assertEqual(response.status_code, 400)
+
+    def test_live_export_resumes_after_the_last_row_across_pages(self):
+        self.discogs.inventories['bob'] = [make_listing(1000 + i, 100 + i) for i in range(250)]
+        _, content = self.export(q='bob', format='jsonl', source='live', stats='0')
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual(len(rows), 250)
+        self.assertEqual(len({row['id'] for row in rows}), 250)
+
+        # Right after a row of the second page
+        _, content = self.export(q='bob', format='jsonl', cursor=rows[149]['cursor'], stats='0')
+        self.assertEqual([json.loads(line)['id'] for line in content.splitlines()], [row['id'] for row in rows[150:]])
+
+    def test_csv_columns_follow_the_export_fields(self):
+        self.crawl(self.discogs, 'bob')
+        response, content = self.export(q='bob', format='csv')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+
+        rows = list(csv.reader(content.splitlines()))
+        self.assertEqual(rows[0], EXPORT_FIELDS)
+        self.assertEqual(len(rows), 6)
+        for row in rows[1:]:
+            self.assertEqual(len(row), len(EXPORT_FIELDS))
+        first = dict(zip(EXPORT_FIELDS, rows[1]))
+        self.assertEqual((first['id'], first['release_id'], first['price'], first['currency']), ('1000', '100', '10.0', 'EUR'))
+        self.assertEqual(decode_export_cursor(first['cursor']), ('snapshot', 0, 1000))
+
+    # Once lines have been sent the status can't change: the JSON Lines export ends with an error line
+    def test_errors_mid_stream_end_with_an_error_line(self):
+        def failing_items():
+            for i in range(EXPORT_LINES_PER_BLOCK + 50):
+                yield {'id': i, 'cursor': encode_export_cursor('live', 1, i)}
+            raise DatabaseError("disk full")
+
+        blocks = list(export_lines(failing_items(), EXPORT_FORMAT_JSONL))
+        lines = ''.join(blocks).splitlines()
+        self.assertEqual(len(blocks), 2)
+        self.assertEqual(len(lines), EXPORT_LINES_PER_BLOCK + 51)
+        self.assertEqual(json.loads(lines[-2])['id'], EXPORT_LINES_PER_BLOCK + 49)
+        self.assertEqual(json.loads(lines[-1]), {'error': "Server internal error during export"})
+
+        lines = ''.join(export_lines(failing_items(), EXPORT_FORMAT_CSV)).splitlines()
+        self.assertEqual(len(lines), EXPORT_LINES_PER_BLOCK + 51)
+        self.assertEqual(lines[-1].split(',')[0], str(EXPORT_LINES_PER_BLOCK + 49))
+
+class ScoringTests(TestCase):
+
+    # Rows of SCORE_FIELDS: listing id, price, currency, price ratio, copies for sale, condition rank
+    def components(self, rows):
+        components = score_components(InventoryArrays(rows))
+        return {name: components[index].round(4).tolist() for index, name in enumerate(['deal', 'rarity', 'condition', 'price'])}
+
+    def test_weights(self):
+        self.assertEqual(parse_score_weights(QueryDict('')), DEFAULT_SCORE_WEIGHTS)
+        self.assertEqual(parse_score_weights(QueryDict('w_deal=2&w_rarity=0&w_price=')), {'deal': 2.0, 'rarity': 0.0, 'condition': 0.5, 'price': 0.5})
+        for query in ('w_deal=-1', 'w_deal=abc', 'w_rarity=inf', 'w_price=nan', 'w_deal=0&w_rarity=0&w_condition=0&w_price=0'):
+            with self.subTest(query=query), self.assertRaises(ValueError):
+                parse_score_weights(QueryDict(query))
+
+        self.assertEqual(parse_top(None), 50)
+        self.assertEqual(parse_top('1000'), 1000)
+        for value in ('0', '1001', 'ten'):
+            with self.subTest(value=value), self.assertRaises(ValueError):
+                parse_top(value)
+
+    def test_components(self):
+        components = self.components([
+            (1, 10.0, 'EUR', 1.0, 1, 8),
+            (2, 20.0, 'EUR', 1.5, np.e, 4),
+            (3, 30.0, 'EUR', 2.5, None, None),
+            (4, 15.0, 'GBP', 0.5, 3, 7),
+            (5, None, 'EUR', None, 1, 6),
+        ])
+        self.assertEqual(components['deal'], [1.0, 0.5, 0.0, 1.0, 0.0])
+        np.testing.assert_allclose(components['rarity'], [1.0, 0.5, 0.0, 1 / (1 + np.log(3)), 1.0], atol=1e-4)
+        self.assertEqual(components['condition'], [1.0, 0.5, 0.0, 0.875, 0.75])
+        # Ranked within the currency, 0.5 for a listing alone in its currency, 0 without price
+        self.assertEqual(components['price'], [1.0, 0.5, 0.0, 0.5, 0.0])
+
+    def test_composite_scores_are_weighted_means(self):
+        components = np.array([[1.0, 0.0], [0.0, 1.0], [1.0, 1.0], [0.5, 0.5]], dtype=np.float32)
+        self.assertEqual(composite_scores(components, {'deal': 1, 'rarity': 0, 'condition': 0, 'price': 0}).tolist(), [1.0, 0.0])
+        self.assertEqual(composite_scores(components, {'deal': 1, 'rarity': 1, 'condition': 1, 'price': 1}).round(4).tolist(), [0.625, 0.625])
+
+    # Many ties at the k-th score: the same listings make the cut as with a full sort by score, then listing id
+    def test_top_k_breaks_ties_by_listing_id(self):
+        generator = np.random.default_rng(7)
+        scores = (generator.integers(0, 5, 2000) / 4).astype(np.float32)
+        listing_ids = generator.permutation(2000).astype(np.int64) + 1000
+
+        expected = sorted(range(len(scores)), key=lambda position: (-scores[position], listing_ids[position]))
+        for k in (1, 7, 100, 399, 1999, 2000, 5000):
+            with self.subTest(k=k):
+                self.assertEqual(top_k(scores, listing_ids, k).tolist(), expected[:k])
+        self.assertEqual(top_k(scores[:0], listing_ids[:0], 10).tolist(), [])
+
+    def test_inventory_ranking(self):
+        seller = Seller.objects.create(username='bob')
+        Listing.objects.bulk_create([
+            Listing(listing_id=1, seller=seller, release_id=1, status='For Sale', price='10.00', currency='EUR', price_ratio=1.0, num_for_sale=1, condition_rank=8),
+            Listing(listing_id=2, seller=seller, release_id=2, status='For Sale', price='30.00', currency='EUR', price_ratio=2.0, num_for_sale=40, condition_rank=4),
+            Listing(listing_id=3, seller=seller, release_id=3, status='For Sale', price='20.00', currency='EUR', price_ratio=1.2, num_for_sale=2, condition_rank=7),
+        ])
+        arrays = load_inventory_arrays(seller.listings.all())
+        self.assertEqual(len(arrays), 3)
+
+        ranked = rank_inventory(arrays, DEFAULT_SCORE_WEIGHTS, 2)
+        self.assertEqual([listing_id for listing_id, _, _ in ranked], [1, 3])
+        self.assertEqual(ranked[0][1], 1.0)
+        self.assertEqual(ranked[0][2], {'deal': 1.0, 'rarity': 1.0, 'condition': 1.0, 'price': 1.0})
+        self.assertGreater(ranked[0][1], ranked[1][1])
+
+@override_settings(DISCOGS_RATE_LIMIT_DEFAULT=6)
+class CredentialPoolTests(TestCase):
+
+    def setUp(self):
+        isolate_credentials(self)
+        for index, username in enumerate(['alice', 'bob', 'carol']):
+            save_access_token(username, f"{username}-secret", username)
+            DiscogsCredentials.objects.filter(access_token=username).update(last_updated=timezone.now() - timedelta(minutes=index))
+        invalidate_credentials_cache()
+
+    def acquire_tokens(self, count):
+        tokens = []
+        for _ in range(count):
+            (signer, limiter), wait = CREDENTIAL_POOL.try_acquire()
+            self.assertEqual(wait, 0.0)
+            tokens.append(signer.resource_owner_key)
+        return tokens
+
+    def test_calls_go_to_the_account_with_the_most_budget_left(self):
+        get_rate_limiter('alice').update_from_headers({'X-Discogs-Ratelimit': '6', 'X-Discogs-Ratelimit-Remaining': '2'})
+
+        tokens = self.acquire_tokens(14)
+        self.assertEqual(tokens[:8].count('alice'), 0)
+        self.assertEqual({token: tokens.count(token) for token in set(tokens)}, {'alice': 2, 'bob': 6, 'carol': 6})
+
+        # Every budget is spent: the caller is told how long to wait
+        account, wait = CREDENTIAL_POOL.try_acquire()
+        self.assertIsNone(account)
+        self.assertGreater(wait, 0)
+
+    def test_accounts_in_cooldown_are_skipped(self):
+        get_rate_limiter('bob').register_throttled(30)
+        self.assertNotIn('bob', self.acquire_tokens(8))
+
+    def test_revoked_accounts_are_skipped(self):
+        revoke_access_token('carol')
+        self.assertEqual([token for token, _ in load_credentials_pool()], ['alice', 'bob'])
+        self.assertEqual(set(self.acquire_tokens(12)), {'alice', 'bob'})
+
+    def test_blocking_acquire_waits_for_the_first_budget_back(self):
+        self.now = 1000.0
+        clock = mock.patch('diggerweb_backend.discogs_api.ratelimit.time')
+        clock.start().time.side_effect = lambda: self.now
+        self.addCleanup(clock.stop)
+
+        for token in ('alice', 'bob'):
+            get_rate_limiter(token).register_throttled(30)
+        get_rate_limiter('carol').update_from_headers({'X-Discogs-Ratelimit': '30', 'X-Discogs-Ratelimit-Remaining': '0'})
+
+        def sleep(seconds):
+            self.now += seconds
+
+        with mock.patch('diggerweb_backend.discogs_api.credentials.time') as credentials_time:
+            credentials_time.sleep.side_effect = sleep
+            signer, limiter = CREDENTIAL_POOL.acquire()
+
+        # 30 calls a minute: carol gets a token back after 2 seconds, long before the others' cooldown ends
+        self.assertEqual(signer.resource_owner_key, 'carol')
+        self.assertEqual(self.now, 1002.0)
+
+    # Shared resources are spread over the pool, the calls for the account itself keep its token
+    def test_fetcher_signs_only_the_shared_calls_with_the_pool(self):
+        get_rate_limiter('alice').update_from_headers({'X-Discogs-Ratelimit': '6', 'X-Discogs-Ratelimit-Remaining': '0'})
+        fetcher = create_client('alice', 'alice-secret')._fetcher
+
+        self.assertTrue(is_shared_url(INVENTORY_URL))
+        self.assertTrue(is_shared_url(f"{DISCOGS_MARKETPLACE_STATS_URL}4242"))
+        self.assertFalse(is_shared_url(DISCOGS_IDENTITY_URL))
+        self.assertFalse(is_shared_url('https://api.discogs.com/users/alice/wants?page=1'))
+
+        signer, limiter = fetcher.schedule(f"{DISCOGS_MARKETPLACE_STATS_URL}4242")
+        self.assertEqual(signer.resource_owner_key, 'bob')
+
+        with mock.patch.object(get_rate_limiter('alice'), 'acquire') as acquire:
+            signer, limiter = fetcher.schedule('https://api.discogs.com/users/alice/wants?page=1')
+        self.assertIs(signer, fetcher.client)
+        self.assertIs(limiter, get_rate_limiter('alice'))
+        acquire.assert_called_once()
+
+# A cache of this process only, and no shared results of the single flight: only the cached pages spare the calls
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'search-cache-tests'}},
+                   DISCOGS_SEARCH_CACHE_TTL=120, DISCOGS_STATS_TTL=3600, DISCOGS_SINGLEFLIGHT_RESULT_TTL=0)
+class ResponseCacheTests(DiscogsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.discogs = FakeDiscogsClient({'bob': [make_listing(1000 + i, 100 + i) for i in range(3)]})
+        authenticate = mock.patch.object(DiscogsAuthenticatedView, 'authenticate_discogs', return_value=(self.discogs, None, None))
+        authenticate.start()
+        self.addCleanup(authenticate.stop)
+
+    def search(self, query, **headers):
+        return self.client.get(f"/api/discogs/search/?{query}", **headers)
+
+    def inventory_calls(self):
+        return len(self.discogs.calls) - len(self.discogs.stats_calls())
+
+    def test_keys_are_normalized(self):
+        key = search_cache_key('Bob', 'snapshot', 1, 50, QueryDict('q=Bob&sort=price&min_price=5&format=LP'))
+        self.assertEqual(search_cache_key('bob', 'snapshot', 1, 50, QueryDict('format=LP&min_price= 5&sort=price&q=bob&page=1')), key)
+        self.assertEqual(search_cache_key('BOB', 'snapshot', 1, 50, QueryDict('q=BOB&sort=price&min_price=5&format=LP&refresh=1&deadline_ms=200')), key)
+
+        self.assertNotEqual(search_cache_key('bob', 'snapshot', 1, 50, QueryDict('q=bob&sort=price&min_price=6&format=LP')), key)
+        self.assertNotEqual(search_cache_key('bob', 'snapshot', 2, 50, QueryDict('q=bob&sort=price&min_price=5&format=LP')), key)
+        self.assertNotEqual(search_cache_key('bob', 'live', 1, 50, QueryDict('q=bob&sort=price&min_price=5&format=LP')), key)
+
+    def test_version_bump_drops_the_cached_pages(self):
+        key = search_cache_key('bob', 'live', 1, 50, QueryDict('q=bob'))
+        store_search_page(key, {'results': []}, 200)
+        self.assertIsNotNone(load_search_page(key))
+
+        bump_seller_version('BOB')
+        new_key = search_cache_key('bob', 'live', 1, 50, QueryDict('q=bob'))
+        self.assertNotEqual(new_key, key)
+        self.assertIsNone(load_search_page(new_key))
+
+    def test_repeated_live_pages_come_from_the_cache(self):
+        response = self.search('q=bob&per_page=2')
+        self.assertEqual(response['X-Cache'], 'miss')
+        calls = self.inventory_calls()
+
+        response = self.search('per_page=2&q=BOB')
+        self.assertEqual(response['X-Cache'], 'hit')
+        self.assertEqual([item['id'] for item in response.json()['results']], [1002, 1001])
+        self.assertEqual(self.inventory_calls(), calls)
+
+        # A refresh of the seller invalidates its pages
+        bump_seller_version('bob')
+        self.assertEqual(self.search('q=bob&per_page=2')['X-Cache'], 'miss')
+        self.assertGreater(self.inventory_calls(), calls)
+
+    def test_refresh_and_deadline_bypass_the_cache(self):
+        self.search('q=bob')
+        calls = self.inventory_calls()
+
+        response = self.search('q=bob&refresh=1')
+        self.assertEqual(response['X-Cache'], 'miss')
+        self.assertEqual(self.inventory_calls(), calls + 1)
+
+        response = self.search('q=bob&deadline_ms=5000')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-Cache', response)
+        self.assertEqual(self.inventory_calls(), calls + 2)
+
+    def test_failed_and_partial_pages_are_not_cached(self):
+        self.assertEqual(self.search('q=nobody').status_code, 404)
+        self.assertEqual(self.search('q=nobody').status_code, 404)
+        self.assertEqual(self.inventory_calls(), 2)
+
+        # Pages served while a new crawl runs change with its progress
+        self.crawl(self.discogs, 'bob')
+        InventorySnapshot.objects.create(seller=get_seller('bob'))
+        for _ in range(2):
+            response = self.search('q=bob&mode=snapshot')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['X-Cache'], 'miss')
+
+    def test_cached_snapshot_pages_keep_their_etag(self):
+        self.crawl(self.discogs, 'bob')
+        response = self.search('q=bob&mode=snapshot')
+        self.assertEqual(response['X-Cache'], 'miss')
+        etag = response['ETag']
+
+        response = self.search('q=bob&mode=snapshot')
+        self.assertEqual((response['X-Cache'], response['ETag']), ('hit', etag))
+        self.assertEqual(len(response.json()['results']), 3)
+
+        response = self.search('q=bob&mode=snapshot', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((response.status_code, response['X-Cache']), (304, 'hit'))
+
+# Stats of the blocked releases are only served once released
+class SlowStatsDiscogsClient(FakeDiscogsClient):
+
+    def __init__(self, inventories, blocked):
+        super().__init__(inventories)
+        self.blocked = blocked
+        self.released = threading.Event()
+
+    def _get(self, url):
+        if url.startswith(DISCOGS_MARKETPLACE_STATS_URL) and int(url[len(DISCOGS_MARKETPLACE_STATS_URL):]) in self.blocked:
+            self.released.wait(10)
+        return super()._get(url)
+
+class ContinuationTests(DiscogsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.discogs = SlowStatsDiscogsClient({'bob': [make_listing(1000 + i, 100 + i) for i in range(4)]}, blocked={101})
+        self.addCleanup(self.discogs.released.set)
+        authenticate = mock.patch.object(DiscogsAuthenticatedView, 'authenticate_discogs', return_value=(self.discogs, None, None))
+        authenticate.start()
+        self.addCleanup(authenticate.stop)
+
+    def test_pages_cut_by_the_deadline_are_completed_by_their_continuation(self):
+        response = self.client.get('/api/discogs/search/', {'q': 'bob', 'deadline_ms': 300})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        token = data['continuation']
+        self.assertTrue(token)
+        self.assertEqual(SearchContinuation.objects.get(token=token).username, 'bob')
+        self.assertEqual([item['release_id'] for item in data['results'] if item.get('stats_pending')], [101])
+        self.assertNotIn('max-age', response['Cache-Control'])
+
+        # Still pending: the same token comes back
+        response = self.client.get('/api/discogs/search/', {'continuation': token, 'deadline_ms': 50})
+        self.assertEqual(response.json()['continuation'], token)
+
+        self.discogs.released.set()
+        response = self.client.get('/api/discogs/search/', {'continuation': token})
+        self.assertEqual(response.status_code, 200)
+        resumed = response.json()
+        self.assertIsNone(resumed['continuation'])
+        self.assertEqual(resumed['pagination'], data['pagination'])
+        self.assertEqual(sorted(item['id'] for item in resumed['results']), [1000, 1001, 1002, 1003])
+        self.assertTrue(all('stats_pending' not in item and item['num_for_sale'] == 3 for item in resumed['results']))
+        self.assertEqual(len(self.discogs.stats_calls()), 4)
+
+        # Kept until it expires, so a retry gets the page again
+        self.assertEqual(self.client.get('/api/discogs/search/', {'continuation': token}).status_code, 200)
+
+    def test_unknown_and_expired_continuations_are_not_found(self):
+        self.assertEqual(self.client.get('/api/discogs/search/', {'continuation': 'unknown'}).status_code, 404)
+
+        token = save_continuation('bob', 1, 50, [make_listing(1000, 100)], {'page': 1, 'pages': 1, 'per_page': 50, 'items': 1})
+        SearchContinuation.objects.filter(token=token).update(created_at=timezone.now() - timedelta(days=1))
+        self.assertEqual(self.client.get('/api/discogs/search/', {'continuation': token}).status_code, 404)
+
+# Serves the wantlists too (release ids, in the order they were added), and records the wantlist pages asked
+class FakeWantlistClient(FakeDiscogsClient):
+
+    def __init__(self, inventories=None, wantlists=None):
+        super().__init__(inventories)
+        self.wantlists = wantlists or {}
+        self.want_pages = []
+
+    def _get(self, url):
+        parsed = urlparse(url)
+        match = WANTS_PATH.search(parsed.path)
+        if match is None:
+            return super()._get(url)
+
+        params = parse_qs(parsed.query)
+        page_num = int(params['page'][0])
+        per_page = int(params['per_page'][0])
+        self.want_pages.append(page_num)
+
+        wants = self.wantlists[match.group(1)]
+        return {
+            'pagination': {'page': page_num, 'pages': max(1, (len(wants) + per_page - 1) // per_page), 'per_page': per_page, 'items': len(wants)},
+            'wants': [{'id': release_id} for release_id in wants[(page_num - 1) * per_page:page_num * per_page]],
+        }
+
+# Pages of two wants or listings, to cross page boundaries with a few of them
+@mock.patch('diggerweb_backend.discogs_api.wantlist.MAX_ITEMS_PER_PAGE', 2)
+class WantlistTests(SimpleTestCase):
+
+    def setUp(self):
+        self.discogs = FakeWantlistClient({'bob': [make_listing(1000 + i, 100 + i) for i in range(10)]}, {'alice': [1, 2, 3, 4, 5]})
+        self.cache = WantlistCache()
+
+    def load(self):
+        self.discogs.want_pages = []
+        return self.cache.get(self.discogs, 'alice')
+
+    @override_settings(DISCOGS_WANTLIST_TTL=0, DISCOGS_WANTLIST_MAX_AGE=3600)
+    def test_unchanged_wantlists_are_checked_on_their_first_page(self):
+        wantlist = self.load()
+        self.assertEqual(wantlist.release_ids, {1, 2, 3, 4, 5})
+        self.assertEqual(self.discogs.want_pages, [1, 2, 3])
+
+        self.assertIs(self.load(), wantlist)
+        self.assertEqual(self.discogs.want_pages, [1])
+
+    @override_settings(DISCOGS_WANTLIST_TTL=0, DISCOGS_WANTLIST_MAX_AGE=3600)
+    def test_added_wants_download_the_tail_pages_only(self):
+        self.load()
+        self.discogs.wantlists['alice'] += [6, 7, 8]
+
+        wantlist = self.load()
+        self.assertEqual(wantlist.release_ids, {1, 2, 3, 4, 5, 6, 7, 8})
+        self.assertEqual(wantlist.items, 8)
+        # The old last page had room for one of the new wants
+        self.assertEqual(self.discogs.want_pages, [1, 3, 4])
+
+    @override_settings(DISCOGS_WANTLIST_TTL=0, DISCOGS_WANTLIST_MAX_AGE=3600)
+    def test_removed_wants_reload_the_whole_wantlist(self):
+        self.load()
+        self.discogs.wantlists['alice'].remove(4)
+
+        self.assertEqual(self.load().release_ids, {1, 2, 3, 5})
+        self.assertEqual(self.discogs.want_pages, [1, 2])
+
+        # Same count, other first page
+        self.discogs.wantlists['alice'] = [9, 2, 3, 5]
+        self.assertEqual(self.load().release_ids, {2, 3, 5, 9})
+        self.assertEqual(self.discogs.want_pages, [1, 2])
+
+    @override_settings(DISCOGS_WANTLIST_TTL=300, DISCOGS_WANTLIST_MAX_AGE=3600)
+    def test_wantlists_are_trusted_until_their_ttl(self):
+        wantlist = self.load()
+        self.discogs.wantlists['alice'].append(6)
+        self.assertIs(self.load(), wantlist)
+        self.assertEqual(self.discogs.want_pages, [])
+
+    @override_settings(DISCOGS_WANTLIST_TTL=0, DISCOGS_WANTLIST_MAX_AGE=0)
+    def test_old_wantlists_are_reloaded(self):
+        self.load()
+        self.load()
+        self.assertEqual(self.discogs.want_pages, [1, 2, 3])
+
+    # Newest listings first: releases 109 and 108 on page 1, 107 and 106 on page 2
+    def test_scan_stops_once_every_want_is_found(self):
+        results, found, scan_info = match_inventory(self.discogs, 'bob', {108, 106})
+        self.assertEqual(found, {108, 106})
+        self.assertEqual([item['id'] for item in results], [1008, 1006])
+        self.assertEqual((scan_info['stopped'], scan_info['pages_scanned'], scan_info['next_page']), (SCAN_ALL_FOUND, 2, None))
+        self.assertEqual(len(self.discogs.calls), 2)
+
+    def test_scan_goes_on_to_the_end_or_the_page_limit(self):
+        results, found, scan_info = match_inventory(self.discogs, 'bob', {100, 42})
+        self.assertEqual(found, {100})
+        self.assertEqual((scan_info['stopped'], scan_info['pages_scanned'], scan_info['pages_total']), (SCAN_END, 5, 5))
+
+        results, found, scan_info = match_inventory(self.discogs, 'bob', {100, 42}, start_page=2, max_pages=2)
+        self.assertEqual(found, set())
+        self.assertEqual((scan_info['stopped'], scan_info['pages_scanned'], scan_info['next_page']), (SCAN_PAGE_LIMIT, 2, 4))
@@ -1,7 +1,22 @@
 from django.urls import re_path, include
-from .views import DiscogsSearchView, DiscogsAuthorizeView, DiscogsCallbackView
+from .views import DiscogsSearchView, DiscogsSearchStreamView, DiscogsBatchSearchView, DiscogsWantlistMatchView, DiscogsReleaseHistoryView, DiscogsSellerHistoryView, DiscogsReleaseOffersView, DiscogsExportView, DiscogsScoresView, DiscogsAccountsView, DiscogsWatchlistView, DiscogsWatchedSellerView, DiscogsAuthorizeView, DiscogsCallbackView, discogs_metrics
+from .async_views import discogs_search_async
 
 urlpatterns = [
+	# Anchored, as the unanchored "search/" pattern would match them too
+	re_path(r'^search/async/$', discogs_search_async, name='discogs-search-async'),
+	re_path(r'^search/stream/$', DiscogsSearchStreamView.as_view(), name='discogs-search-stream'),
+	re_path(r'^search/batch/$', DiscogsBatchSearchView.as_view(), name='discogs-search-batch'),
+	re_path(r'^wants/match/$', DiscogsWantlistMatchView.as_view(), name='discogs-wants-match'),
+	re_path(r'^scores/$', DiscogsScoresView.as_view(), name='discogs-scores'),
+	re_path(r'^export/$', DiscogsExportView.as_view(), name='discogs-export'),
+	re_path(r'^history/release/(?P<release_id>\d+)/$', DiscogsReleaseHistoryView.as_view(), name='discogs-history-release'),
+	re_path(r'^history/seller/(?P<username>[^/]+)/$', DiscogsSellerHistoryView.as_view(), name='discogs-history-seller'),
+	re_path(r'^offers/(?P<release_id>\d+)/$', DiscogsReleaseOffersView.as_view(), name='discogs-offers'),
+	re_path(r'^accounts/$', DiscogsAccountsView.as_view(), name='discogs-accounts'),
+	re_path(r'^watch/$', DiscogsWatchlistView.as_view(), name='discogs-watchlist'),
+	re_path(r'^watch/(?P<username>[^/]+)/$', DiscogsWatchedSellerView.as_view(), name='discogs-watched-seller'),
+	re_path(r'^metrics/$', discogs_metrics, name='discogs-metrics'),
 	re_path("search/", DiscogsSearchView.as_view(), name='discogs-search'),
     re_path('authorize/', DiscogsAuthorizeView.as_view(), name='discogs-authorize'),
     re_path('callback/', DiscogsCallbackView.as_view(), name='discogs-callback')
@@ -1,37 +1,93 @@
 # Copyright 2025 Giorgio Gamba
 
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.utils import timezone
+
 from .models import DiscogsCredentials
 
-# Unique ID for just one line needed
-CREDENTIALS_ID = 1
+logger = logging.getLogger(__name__)
+
+# In-memory copy of the pool of credentials, so that searches don't hit the DB. It is reset by save_access_token
+# and revoke_access_token in this process and expires after DISCOGS_CREDENTIALS_CACHE_TTL, to see the tokens
+# saved or revoked by other workers
+_credentials_cache = {'credentials': None, 'loaded_at': 0.0}
+_credentials_lock = threading.Lock()
 
-def save_access_token(token, secret):
+def invalidate_credentials_cache():
+    with _credentials_lock:
+        _credentials_cache['credentials'] = None
+
+# Adds the token of an authorized account to the pool. A new token of an account already in the pool
+# replaces the old one, as both would draw on the same budget
+def save_access_token(token, secret, username=''):
 
     try:
-        credentials, created = DiscogsCredentials.objects.update_or_create(
-            pk=CREDENTIALS_ID,
-            defaults={'access_token': token, 'access_secret': secret}
-        )
+        credentials = DiscogsCredentials.objects.filter(access_token=token).first()
+        if credentials is None and username:
+            credentials = DiscogsCredentials.objects.filter(username__iexact=username).order_by('-last_updated').first()
+
+        created = credentials is None
         if created:
-            print("Discogs credentials created in DB")
+            credentials = DiscogsCredentials()
+
+        credentials.access_token = token
+        credentials.access_secret = secret
+        credentials.username = username or credentials.username
+        credentials.revoked_at = None
+        credentials.save()
+
+        invalidate_credentials_cache()
+        if created:
+            logger.info("Discogs credentials of %s added to the pool", username or 'unknown account')
         else:
-            print("Discogs credentials updated in DB")
+            logger.info("Discogs credentials of %s updated in DB", username or 'unknown account')
         return True
     except Exception as e:
-        print(f"Error while saving Discogs credentials: {e}")
+        logger.error("Error while saving Discogs credentials: %s", e)
         return False
 
-def load_access_token():
+# Takes a token rejected by Discogs out of the pool, until its account is authorized again
+def revoke_access_token(token):
     try:
-        credentials = DiscogsCredentials.objects.filter(pk=CREDENTIALS_ID).first()
-        if credentials:
-            print("Loaded from DB Discogs Credentials")
-            # TODO add cryptography
-            return credentials.access_token, credentials.access_secret
-        else:
-            print("No Discogs Credentials found in the DB")
-            return None, None
-        
+        revoked = DiscogsCredentials.objects.filter(access_token=token, revoked_at__isnull=True).update(revoked_at=timezone.now())
+        invalidate_credentials_cache()
+        if revoked:
+            logger.warning("Discogs credentials %s... revoked, removed from the pool", token[:4])
+    except Exception as e:
+        logger.error("Error while revoking Discogs credentials: %s", e)
+
+# (token, secret) of the accounts of the pool not revoked, the most recently authorized first
+def load_credentials_pool():
+    with _credentials_lock:
+        credentials = _credentials_cache['credentials']
+        if credentials and time.monotonic() - _credentials_cache['loaded_at'] < settings.DISCOGS_CREDENTIALS_CACHE_TTL:
+            return credentials
+
+    try:
+        # TODO add cryptography
+        rows = DiscogsCredentials.objects.filter(revoked_at__isnull=True).order_by('-last_updated', '-pk')
+        credentials = [(row.access_token, row.access_secret) for row in rows]
+        logger.debug("Loaded from DB %d Discogs Credentials", len(credentials))
     except Exception as e:
-        print(f"Error while loading Discogs credentials: {e}")
-        return None, None
\ No newline at end of file
+        logger.error("Error while loading Discogs credentials: %s", e)
+        return []
+
+    # An empty pool isn't cached, so that the first authorization is seen right away by every worker
+    if credentials:
+        with _credentials_lock:
+            _credentials_cache['credentials'] = credentials
+            _credentials_cache['loaded_at'] = time.monotonic()
+    return credentials
+
+# Credentials of the account the views work on behalf of (identity, wantlist): the most recently authorized
+def load_access_token():
+    credentials = load_credentials_pool()
+    if credentials:
+        return credentials[0]
+
+    logger.info("No Discogs Credentials found in the DB")
+    return None, None
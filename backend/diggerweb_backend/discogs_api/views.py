@@ -3,38 +3,65 @@
 from django.shortcuts import render
 
 import os
-import traceback
+import math
+import time
+import logging
 import discogs_client
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-import time
+from rest_framework.permissions import IsAdminUser
+from django.http import HttpResponse, StreamingHttpResponse
 from django.urls import reverse
+from django.conf import settings
 from .utils import save_access_token, load_access_token
-from urllib.parse import urlencode
-
-APPLICATION_AGENT_NAME = 'diggerweb/1.0'
+from .models import DiscogsCredentials, Listing, Seller, WatchedSeller
+from .client import DiscogsClient, get_authenticated_client, get_identity
+from .credentials import describe_accounts
+from .constants import DISCOGS_CONSUMER_KEY, DISCOGS_CONSUMER_SECRET
+from .listings import fetch_inventory_page, get_release_id, build_item, num_for_sale_sort_key, parse_pagination_params
+from .stats import fetch_marketplace_stats_bulk
+from .crawler import get_seller, get_snapshot, get_latest_snapshot, describe_snapshot, for_sale_listings
+from .filters import DEFAULT_SORT, LOCAL_ONLY_PARAMS, parse_listing_filters, parse_sort, decode_cursor, apply_listing_filters, order_listings, after_cursor, encode_cursor
+from .streaming import STREAM_CONTENT_TYPES, get_stream_format, search_events
+from .singleflight import coalesce, load_shared_result, store_shared_result
+from .metrics import PHASE_CREDENTIALS, PHASE_IDENTITY, PHASE_STATS, collect, render_prometheus, request_timing, timed
+from .ratelimit import budget_snapshot
+from .batch import parse_usernames, search_inventories
+from .dumps import add_release_details
+from .offers import annotate_cheaper_elsewhere, record_offers, release_offers
+from .history import record_listing_prices, release_points, release_trends, listing_price_changes
+from .http_cache import etag_matches, search_max_age, set_search_cache_control, snapshot_etag
+from .response_cache import load_search_page, search_cache_key, search_cache_ttl, store_search_page
+from .export import (EXPORT_CONTENT_TYPES, EXPORT_FORMAT_CSV, EXPORT_SOURCE_LIVE, EXPORT_SOURCE_SNAPSHOT, decode_export_cursor,
+                     export_lines, fetch_first_page, live_items, snapshot_items)
+from .continuations import enrich_page, load_continuation, resume_continuation
+from .wantlist import WANTLIST_CACHE, match_inventory, match_listings
+from .scoring import MAX_TOP, load_inventory_arrays, parse_score_weights, parse_top, rank_inventory
+from .watchlist import describe_watch, has_watched_snapshot, unwatch_seller, watch_seller
+from .permissions import IsAdminUserOrReadOnly
+
+logger = logging.getLogger(__name__)
 
 DISCOGS_API_ERROR = 'Discogs API error'
 ERROR_KEY = 'error'
 
-# Executes module authorization once that the module is started or re-saved in development
-DISCOGS_CONSUMER_KEY = os.getenv('DISCOGS_CONSUMER_KEY')
-DISCOGS_CONSUMER_SECRET = os.getenv('DISCOGS_CONSUMER_SECRET')
-
 DISCOGS_REQUEST_TOKEN_KEY = 'discogs_request_token'
 DISCOGS_REQUEST_TOKEN_SECRET = 'discogs_request_secret'
 
 DISCOGS_AUTHORIZE_KEY = 'discogs-authorize'
 
-BASE_API_URL = 'https://api.discogs.com'
-DISCOGS_MARKETPLACE_STATS_URL = "https://api.discogs.com/marketplace/stats/"
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Search modes: live pages from Discogs, or pages of the local inventory snapshot
+SEARCH_MODE_LIVE = 'live'
+SEARCH_MODE_SNAPSHOT = 'snapshot'
 
 # Handles the authentication request from frontend to backend
 class DiscogsAuthorizeView(APIView):
 
     def get(self, request, *args, **kwargs):
-        client = discogs_client.Client(APPLICATION_AGENT_NAME)
+        client = DiscogsClient()
         client.set_consumer_key(DISCOGS_CONSUMER_KEY, DISCOGS_CONSUMER_SECRET)
 
         try:
@@ -49,7 +76,7 @@ class DiscogsAuthorizeView(APIView):
         except discogs_client.exceptions.DiscogsAPIError as api_error:
             return Response({ERROR_KEY: f"{DISCOGS_API_ERROR}: {api_error}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         except Exception as e:
-            traceback.print_exc()
+            logger.exception("Error during authorization initiation")
             return Response({ERROR_KEY: f"Server internal error during authorization initiation: {e}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 # Handles authentication flow completion and return to application
@@ -62,7 +89,7 @@ class DiscogsCallbackView(APIView):
         if not oauth_verifier or not oauth_token:
             return Response({ERROR_KEY: "Missing oauth_verifier or oauth_token in callback"}, status=status.HTTP_400_BAD_REQUEST)
 
-        client = discogs_client.Client(APPLICATION_AGENT_NAME)
+        client = DiscogsClient()
         client.set_consumer_key(DISCOGS_CONSUMER_KEY, DISCOGS_CONSUMER_SECRET)
 
         if not client:
@@ -83,27 +110,116 @@ class DiscogsCallbackView(APIView):
 
             # Get access tokens and cleanup temporary ones
             access_token, access_secret = client.get_access_token(oauth_verifier)
-            save_access_token(access_token, access_secret)
             del request.session[DISCOGS_REQUEST_TOKEN_KEY]
-            del request.session[DISCOGS_CONSUMER_SECRET]
+            del request.session[DISCOGS_REQUEST_TOKEN_SECRET]
+
+            # The account joins the pool of credentials, or gets its new token if it is already there
+            identity = get_identity(get_authenticated_client(access_token, access_secret))
+            save_access_token(access_token, access_secret, identity.username)
 
             # TODO close popup via javascript
-            return Response({"message": "Authorization successful! You can close this window."}, status=status.HTTP_200_OK)
+            return Response({
+                "message": "Authorization successful! You can close this window.",
+                "username": identity.username,
+                "accounts": DiscogsCredentials.objects.filter(revoked_at__isnull=True).count()
+            }, status=status.HTTP_200_OK)
 
         except discogs_client.exceptions.HTTPError as http_error:
             return Response({ERROR_KEY: f"{DISCOGS_API_ERROR} during token exchange ({http_error.status_code}): {http_error.msg}"}, status=http_error.status_code)
         except discogs_client.exceptions.DiscogsAPIError as api_error:
              return Response({ERROR_KEY: f"{DISCOGS_API_ERROR} during token exchange: {api_error}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         except Exception as e:
-            traceback.print_exc()
+            logger.exception("Error during callback processing")
             return Response({ERROR_KEY: f"Server internal error during callback processing: {e}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+# Base class of the views working on behalf of the authorized Discogs account
+class DiscogsAuthenticatedView(APIView):
+
+    # Every request is timed, and the breakdown of its phases is returned in the Server-Timing header
+    def dispatch(self, request, *args, **kwargs):
+        with request_timing(self.__class__.__name__) as timing:
+            response = super().dispatch(request, *args, **kwargs)
+            timing.status = response.status_code
+        response['Server-Timing'] = timing.server_timing()
+        return response
+
+    # Returns the authenticated client and identity, or the error response to send back
+    def authenticate_discogs(self, request):
+
+        with timed(PHASE_CREDENTIALS):
+            access_token, access_secret = load_access_token()
+
+        if not access_token or not access_secret:
+            logger.info("Authorization data missing. Authorization is needed")
+            auth_url = request.build_absolute_uri(reverse(DISCOGS_AUTHORIZE_KEY))
+            return None, None, Response({
+                ERROR_KEY: "Discogs authorization required.",
+                "authorize_url": auth_url
+            }, status=status.HTTP_401_UNAUTHORIZED)
+
+        try:
+            client = get_authenticated_client(access_token, access_secret)
+
+            # Verify authentication by making a simple call, unless it has been verified recently
+            with timed(PHASE_IDENTITY):
+                identity = get_identity(client)
+            logger.debug("Authenticated as Discogs user: %s", identity.username)
+
+        except (discogs_client.exceptions.HTTPError, discogs_client.exceptions.DiscogsAPIError) as auth_error:
+            logger.warning("Discogs authentication failed: %s", auth_error)
+            auth_url = request.build_absolute_uri(reverse(DISCOGS_AUTHORIZE_KEY))
+            return None, None, Response({
+                ERROR_KEY: f"Invalid or expired Discogs credentials. Please re-authorize. ({auth_error})",
+                "authorize_url": auth_url
+            }, status=status.HTTP_401_UNAUTHORIZED)
+        
+        except Exception as e:
+             logger.exception("Error initializing Discogs client: %s", e)
+             return None, None, Response({ERROR_KEY: f"Failed to initialize Discogs client: {e}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        return client, identity, None
+
+    # Maps an HTTP error received from Discogs while working on the inventory of username
+    def discogs_error_response(self, request, http_error, username):
+        status_code = http_error.status_code if hasattr(http_error, 'status_code') else 500
+        if status_code == 401: # Unauthorized during search - token might have been revoked
+             auth_url = request.build_absolute_uri(reverse(DISCOGS_AUTHORIZE_KEY))
+             return Response({
+                  ERROR_KEY: f"Discogs API authentication error ({status_code}). Please re-authorize. ({http_error.msg})",
+                  "authorize_url": auth_url
+             }, status=status_code)
+        elif status_code == 404:
+             return Response({ERROR_KEY: f"Discogs user '{username}' not found or inventory is private/empty. ({http_error.msg})"}, status=status_code)
+        else:
+             return Response({ERROR_KEY: f"{DISCOGS_API_ERROR} ({status_code}): {http_error.msg}"}, status=status_code)
+
+# Completes the items of a live page: year, formats, labels and genres from the imported data dumps, then
+# prices to the history and to the index of the known offers, which then tells where else the releases are
+# cheaper. record=False for pages already recorded (continuations). This is bookkeeping on top of a search
+# that succeeded: errors are logged and the page is served without the missing fields
+def finish_live_page(username, output_results, record=True):
+    try:
+        add_release_details(output_results)
+    except Exception as e:
+        logger.exception("Error while adding the release details to the page of %s: %s", username, e)
+
+    try:
+        seller = get_seller(username)
+        if record:
+            record_listing_prices(seller, output_results)
+            record_offers(seller, output_results)
+        annotate_cheaper_elsewhere(output_results, seller)
+    except Exception as e:
+        logger.exception("Error while indexing the offers of the page of %s: %s", username, e)
+
+    return output_results
+
 # Handles Discogs DB researches
-class DiscogsSearchView(APIView):
+class DiscogsSearchView(DiscogsAuthenticatedView):
         
     def searchUserInventory_API_Filtered(self, client, username, page_num, items_per_page):
 
-        print(f"Looking for \"For Sale\" items at page {page_num} for user {username} ({items_per_page} items/pag)")
+        logger.debug("Looking for \"For Sale\" items at page %d for user %s (%d items/page)", page_num, username, items_per_page)
 
         # Default pagination info in case of early error
         pagination_info = {'page': page_num, 'pages': 0, 'per_page': items_per_page, 'items': 0, 'urls': {}}
@@ -111,152 +227,165 @@ class DiscogsSearchView(APIView):
         output_results = []
 
         try:
-            # Build the complete research path
-            endpoint = f'/users/{username}/inventory'
-
-            params = {
-                'status': 'For Sale',
-                'page': page_num,
-                'per_page': items_per_page,
-            }
-
-            query_string = urlencode(params)
-            full_path_with_query = f"{BASE_API_URL}{endpoint}?{query_string}"
+            listings_data, pagination_info = fetch_inventory_page(client, username, page_num, items_per_page)
 
-            # Execyte call and check results
-            response_data = client._get(full_path_with_query)
-            if not isinstance(response_data, dict) or 'pagination' not in response_data or 'listings' not in response_data:
-                 print(f"Struttura risposta API inattesa: {response_data}")
-                 raise ValueError("Struttura risposta invalida ricevuta dall'API Discogs")
+            logger.debug("Received response. Paging: %s. Listings ('For Sale') in page: %d", pagination_info, len(listings_data))
 
-            pagination_api = response_data.get('pagination', {})
-            listings_data = response_data.get('listings', [])
-
-            pagination_info = {
-                'page': pagination_api.get('page', page_num),
-                'pages': pagination_api.get('pages', 0),
-                'per_page': pagination_api.get('per_page', items_per_page),
-                'items': pagination_api.get('count', pagination_api.get('items', 0)),
-                'urls': pagination_api.get('urls', {})
-            }
-
-            print(f"Received response. Paging: {pagination_info}. Listings ('For Sale') in page: {len(listings_data)}")
+            # Stats lookups are independent, so they run in parallel governed by the rate limiter
+            release_ids = [get_release_id(listing_dict) for listing_dict in listings_data]
+            with timed(PHASE_STATS):
+                stats_by_release = fetch_marketplace_stats_bulk(client, [release_id for release_id in release_ids if release_id])
 
             for listing_dict in listings_data:
                 try:
-
-                    release_info = listing_dict.get('release', {})
-                    release_id = release_info.get('id')
+                    release_id = get_release_id(listing_dict)
                     if not release_id:
                         continue
 
-                    price_info = listing_dict.get('price', {})
-
-                    stats_path = f"{DISCOGS_MARKETPLACE_STATS_URL}{release_id}"
-                    stats_response = None
-                    stats_error_msg = None
-
-                    try:
-                        stats_response = client._get(stats_path)
-                        time.sleep(1)
-
-                    except discogs_client.exceptions.HTTPError as stats_http_err:
-                        print(f" HTTPError {stats_http_err.status_code} while retrieving stats for release {release_id}: {stats_http_err.msg}")
-                        num_for_sale = None
-                        stats_error_msg = f"Stats not available ({stats_http_err.status_code})"
-                        time.sleep(1)
-
-                    except Exception as stats_e:
-                        print(f" Unexcpected error while retriveing stats for release {release_id}: {stats_e}")
-                        num_for_sale = None
-                        stats_error_msg = f"Error - Stats not availble"
-                        time.sleep(1)
-
-                    else:
-                        num_for_sale = stats_response.get('num_for_sale') if stats_response else None
-
-                    artists_list = release_info.get('artists', [])
-                    artists_str = ", ".join(a.get('name', 'N/A') for a in artists_list) if artists_list else 'N/A'
-
-                    item_data = {
-                        'url': listing_dict.get('uri', listing_dict.get('resource_url')),
-                        'release_id': release_id,
-                        'title': release_info.get('description', 'N/A'), 
-                        'artist': artists_str,
-                        'num_for_sale': num_for_sale,
-                        'price': price_info.get('value'),
-                        'currency': price_info.get('currency'),
-                        'condition': listing_dict.get('condition', 'N/A'),
-                        'sleeve_condition': listing_dict.get('sleeve_condition', 'N/A'),
-                        'id': listing_dict.get('id'),
-                        'status': listing_dict.get('status')
-                    }
-
-                    if stats_error_msg:
-                        item_data['stats_error'] = stats_error_msg
-
-                    output_results.append(item_data)
+                    stats_response, stats_error_msg = stats_by_release[release_id]
+                    output_results.append(build_item(listing_dict, stats_response, stats_error_msg))
 
                 except Exception as item_e:
                     listing_id_str = listing_dict.get('id', 'Unknown')
-                    print(f" Skipping item {listing_id_str} causes error during elaboration: {item_e}")
-                    traceback.print_exc()
+                    logger.exception("Skipping item %s, error during elaboration: %s", listing_id_str, item_e)
                     output_results.append({'id': listing_id_str,'error': f"Unexpected error while elaborating: {item_e}"})
 
-            output_results.sort(key=lambda item: item.get('num_for_sale', -1), reverse=False)
-
-            return output_results, pagination_info
+            output_results.sort(key=num_for_sale_sort_key, reverse=False)
 
         except discogs_client.exceptions.HTTPError as http_err:
-             print(f"HTTPError during research for {username} (Page {page_num}): {http_err}")
+             logger.warning("HTTPError during research for %s (page %d): %s", username, page_num, http_err)
              raise http_err
         
         except ValueError as val_err:
-             print(f"ValueError during API elaboration: {val_err}")
+             logger.warning("ValueError during API elaboration: %s", val_err)
              raise val_err
         
         except Exception as e:
-            print(f"Unexpected error during research {username} (Pagie {page_num}): {e}")
-            traceback.print_exc()
+            logger.exception("Unexpected error during research %s (page %d): %s", username, page_num, e)
             return [], pagination_info
 
-    def get(self, request, *args, **kwargs):
+        return finish_live_page(username, output_results), pagination_info
 
-        access_token, access_secret = load_access_token()
+    # Same as searchUserInventory_API_Filtered, but the stats lookups are only waited for until the deadline
+    # (time.monotonic() value). Returns also the continuation token of the page when some stats are pending
+    def searchUserInventory_Deadline(self, client, username, page_num, items_per_page, deadline):
 
-        if not access_token or not access_secret:
-            print("Authorization data missing. Authroization is needed")
-            auth_url = request.build_absolute_uri(reverse(DISCOGS_AUTHORIZE_KEY))
-            return Response({
-                ERROR_KEY: "Discogs authorization required.",
-                "authorize_url": auth_url
-            }, status=status.HTTP_401_UNAUTHORIZED)
+        listings_data, pagination_info = fetch_inventory_page(client, username, page_num, items_per_page)
 
-        client = discogs_client.Client(APPLICATION_AGENT_NAME)
-        if not client:
-            print("Unable to instantiate Discogs client. Returning...")
-            return
-        
-        try:
-            client.set_consumer_key(DISCOGS_CONSUMER_KEY, DISCOGS_CONSUMER_SECRET)
-            client.set_token(access_token, access_secret)
+        with timed(PHASE_STATS):
+            output_results, continuation = enrich_page(client, username, page_num, items_per_page, listings_data, pagination_info, deadline)
 
-            # Verify authentication by making a simple call
-            identity = client.identity()
-            print(f"Authenticated as Discogs user: {identity.username}")
+        return finish_live_page(username, output_results), pagination_info, continuation
 
-        except (discogs_client.exceptions.HTTPError, discogs_client.exceptions.DiscogsAPIError) as auth_error:
-            print(f"Discogs authentication failed: {auth_error}")
-            auth_url = request.build_absolute_uri(reverse(DISCOGS_AUTHORIZE_KEY))
-            return Response({
-                ERROR_KEY: f"Invalid or expired Discogs credentials. Please re-authorize. ({auth_error})",
-                "authorize_url": auth_url
-            }, status=status.HTTP_401_UNAUTHORIZED)
-        
-        except Exception as e:
-             print(f"Error initializing Discogs client: {e}")
-             traceback.print_exc()
-             return Response({ERROR_KEY: f"Failed to initialize Discogs client: {e}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    # Completes a page answered before its deadline, with the stats looked up in background meanwhile
+    def searchUserInventory_Continuation(self, client, continuation, deadline=None):
+
+        with timed(PHASE_STATS):
+            output_results, token = resume_continuation(client, continuation, deadline)
+
+        return finish_live_page(continuation.username, output_results, record=False), continuation.pagination, token
+
+    # Identical searches running at the same time, in this worker or in the others, share a single computation
+    def searchUserInventory_Coalesced(self, client, username, page_num, items_per_page):
+        key = ('search', username.lower(), page_num, items_per_page)
+
+        def store_shared(result):
+            output_results, pagination_info = result
+            # Failed searches come back empty, they must not be served to the others
+            if output_results or pagination_info['pages']:
+                store_shared_result(key, result)
+
+        return coalesce(key,
+                        lambda: self.searchUserInventory_API_Filtered(client, username, page_num, items_per_page),
+                        load_shared=lambda: load_shared_result(key),
+                        store_shared=store_shared)
+
+    # Response of a page found in the shared cache, revalidated with its ETag like a page just built
+    def cachedSearchResponse(self, request, cached_page):
+        etag = cached_page['etag']
+        if etag and etag_matches(request, etag):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response(cached_page['data'], status=cached_page['status'])
+
+        if etag:
+            response['ETag'] = etag
+        response['X-Cache'] = 'hit'
+        return set_search_cache_control(response, cached_page['max_age'])
+
+    # Serves the page from the local snapshot of the whole inventory, so filters and sort are global.
+    # With a cursor the page starts right after it (keyset pagination), otherwise page_num is used
+    def searchUserInventory_Snapshot(self, seller, snapshot, running, page_num, items_per_page, filters=None, sort=DEFAULT_SORT, cursor=None):
+
+        logger.debug("Looking for snapshot items at page %d for user %s (%d items/page)", page_num, seller.username, items_per_page)
+
+        snapshot_info = describe_snapshot(snapshot, running)
+
+        if snapshot is None:
+            pagination_info = {'page': page_num, 'pages': 0, 'per_page': items_per_page, 'items': 0, 'urls': {}, 'next_cursor': None}
+            return [], pagination_info, snapshot_info
+
+        # Items without stats go last here, so that PostgreSQL can walk the (seller, status, <sort key>) indexes
+        listings = apply_listing_filters(for_sale_listings(seller), filters or {})
+        items_count = listings.count()
+        listings = order_listings(listings, sort)
+
+        if cursor is not None:
+            listings = after_cursor(listings, sort, *cursor)
+            page_num = None
+            offset = 0
+        else:
+            offset = (page_num - 1) * items_per_page
+
+        # One more row tells whether there is a next page
+        page_listings = list(listings[offset:offset + items_per_page + 1])
+        next_cursor = encode_cursor(sort, page_listings[items_per_page - 1]) if len(page_listings) > items_per_page else None
+
+        pagination_info = {
+            'page': page_num,
+            'pages': math.ceil(items_count / items_per_page),
+            'per_page': items_per_page,
+            'items': items_count,
+            'urls': {},
+            'next_cursor': next_cursor
+        }
+
+        output_results = [listing.to_item() for listing in page_listings[:items_per_page]]
+        annotate_cheaper_elsewhere(output_results, seller)
+        return output_results, pagination_info, snapshot_info
+
+    def get(self, request, *args, **kwargs):
+        start = time.monotonic()
+
+        client, identity, error_response = self.authenticate_discogs(request)
+        if error_response is not None:
+            return error_response
+
+        # Latency budget of the request: stats not known when it runs out are sent later, through a continuation
+        deadline = None
+        if request.query_params.get('deadline_ms'):
+            try:
+                deadline_ms = int(request.query_params['deadline_ms'])
+                if deadline_ms < 1:
+                    raise ValueError
+                deadline = start + deadline_ms / 1000
+
+            except ValueError:
+                 return Response({ERROR_KEY: "'deadline_ms' parameter must be a positive integer."}, status=status.HTTP_400_BAD_REQUEST)
+
+        token = request.query_params.get('continuation')
+        if token:
+            continuation = load_continuation(token)
+            if continuation is None:
+                 return Response({ERROR_KEY: "Unknown or expired 'continuation' parameter."}, status=status.HTTP_404_NOT_FOUND)
+
+            output_results, pagination_info, token = self.searchUserInventory_Continuation(client, continuation, deadline)
+            response = Response({
+                'pagination': pagination_info,
+                'results': output_results,
+                'continuation': token
+            }, status=status.HTTP_200_OK)
+            return set_search_cache_control(response, None if token else search_max_age())
 
         username = request.query_params.get('q')
 
@@ -265,45 +394,575 @@ class DiscogsSearchView(APIView):
 
         # Get pagination parameters
         try:
-            page_num = int(request.query_params.get('page', 1))
-            items_per_page = int(request.query_params.get('per_page', 50))
-
-            # Handle edge cases
-            if items_per_page < 1:
-                items_per_page = 1
-            if items_per_page > 100:
-                items_per_page = 100 # Respect Discogs limits (usually 100 max)
-            if page_num < 1:
-                page_num = 1
+            page_num, items_per_page = parse_pagination_params(request.query_params)
 
         except ValueError:
              return Response({ERROR_KEY: "'page' and 'per_page' parameters must be integers."}, status=status.HTTP_400_BAD_REQUEST)
 
+        # Watched sellers are kept warm in background: their searches use the snapshot unless asked otherwise
+        mode = request.query_params.get('mode') or (SEARCH_MODE_SNAPSHOT if has_watched_snapshot(username) else SEARCH_MODE_LIVE)
+        if mode not in (SEARCH_MODE_LIVE, SEARCH_MODE_SNAPSHOT):
+             return Response({ERROR_KEY: f"'mode' parameter must be '{SEARCH_MODE_LIVE}' or '{SEARCH_MODE_SNAPSHOT}'."}, status=status.HTTP_400_BAD_REQUEST)
+
+        if mode == SEARCH_MODE_SNAPSHOT:
+            try:
+                filters = parse_listing_filters(request.query_params)
+                sort = parse_sort(request.query_params.get('sort'))
+                cursor = request.query_params.get('cursor')
+                cursor = decode_cursor(cursor, sort) if cursor else None
+
+            except ValueError as filter_error:
+                 return Response({ERROR_KEY: str(filter_error)}, status=status.HTTP_400_BAD_REQUEST)
+
+        elif any(name in request.query_params for name in LOCAL_ONLY_PARAMS):
+             return Response({ERROR_KEY: f"Filters, 'sort' and 'cursor' need mode={SEARCH_MODE_SNAPSHOT}."}, status=status.HTTP_400_BAD_REQUEST)
+
+        # 'refresh' starts a sync of the snapshot right away, without waiting for it to age
+        refresh = request.query_params.get('refresh') in ('1', 'true')
+
+        # Repeated pages come from the shared cache. Pages with a deadline or a refresh are computed again
+        cache_key = None
+        if search_cache_ttl() and deadline is None and not refresh:
+            cache_key = search_cache_key(username, mode, page_num, items_per_page, request.query_params)
+            cached_page = load_search_page(cache_key) if cache_key else None
+            if cached_page is not None:
+                return self.cachedSearchResponse(request, cached_page)
+
         try:
-            output_results, pagination_info = self.searchUserInventory_API_Filtered(client, username, page_num, items_per_page)
+            if mode == SEARCH_MODE_SNAPSHOT:
+                seller = get_seller(username)
+                snapshot, running = get_snapshot(client, seller, refresh)
+
+                # Polls of a snapshot that didn't change are answered before building the page
+                etag = snapshot_etag(request.query_params, snapshot, running)
+                if etag_matches(request, etag):
+                    response = Response(status=status.HTTP_304_NOT_MODIFIED)
+                else:
+                    output_results, pagination_info, snapshot_info = self.searchUserInventory_Snapshot(seller, snapshot, running, page_num, items_per_page,
+                                                                                                        filters, sort, cursor)
+
+                    response_data = {
+                        'pagination': pagination_info,
+                        'results': output_results,
+                        'snapshot': snapshot_info
+                    }
+                    # No snapshot to serve yet, the crawl progress tells the client when to come back
+                    response_status = status.HTTP_200_OK if snapshot_info['id'] else status.HTTP_202_ACCEPTED
+                    response = Response(response_data, status=response_status)
+
+                    # Only pages that won't change until the next refresh of the seller
+                    if cache_key and snapshot and running is None:
+                        store_search_page(cache_key, response_data, response_status, etag)
+
+                response['ETag'] = etag
+                response['X-Cache'] = 'miss'
+                return set_search_cache_control(response, search_max_age() if snapshot and running is None else None)
+
+            if deadline is not None:
+                output_results, pagination_info, token = self.searchUserInventory_Deadline(client, username, page_num, items_per_page, deadline)
+
+                response_data = {
+                    'pagination': pagination_info,
+                    'results': output_results,
+                    'continuation': token
+                }
+                return set_search_cache_control(Response(response_data, status=status.HTTP_200_OK), None if token else search_max_age())
+
+            output_results, pagination_info = self.searchUserInventory_Coalesced(client, username, page_num, items_per_page)
 
             response_data = {
                 'pagination': pagination_info,
                 'results': output_results
             }
+            # Failed searches come back empty, they must not be served to the others
+            if cache_key and (output_results or pagination_info['pages']):
+                store_search_page(cache_key, response_data, status.HTTP_200_OK)
+
+            # The ETag of live pages is computed on their content by ConditionalGetMiddleware
+            response = Response(response_data, status=status.HTTP_200_OK)
+            response['X-Cache'] = 'miss'
+            return set_search_cache_control(response, search_max_age())
+
+        except discogs_client.exceptions.HTTPError as http_error:
+            return self.discogs_error_response(request, http_error, username)
+        except discogs_client.exceptions.DiscogsAPIError as api_error:
+            return Response({ERROR_KEY: f"{DISCOGS_API_ERROR}: {api_error}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        
+        except Exception as e:
+            logger.exception("Unexpected server error during search for user %s", username)
+            return Response({ERROR_KEY: "Server internal error during research"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+# Searches the same page of the inventories of several sellers at once, and merges the results by release
+class DiscogsBatchSearchView(DiscogsAuthenticatedView):
+
+    def get(self, request, *args, **kwargs):
+
+        client, identity, error_response = self.authenticate_discogs(request)
+        if error_response is not None:
+            return error_response
+
+        usernames = parse_usernames(request.query_params)
+
+        if not usernames:
+             return Response({ERROR_KEY: "Missing 'q' parameter (comma separated usernames)."}, status=status.HTTP_400_BAD_REQUEST)
+        if len(usernames) > settings.DISCOGS_BATCH_MAX_SELLERS:
+             return Response({ERROR_KEY: f"At most {settings.DISCOGS_BATCH_MAX_SELLERS} sellers can be searched at once."}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            page_num, items_per_page = parse_pagination_params(request.query_params)
+
+        except ValueError:
+             return Response({ERROR_KEY: "'page' and 'per_page' parameters must be integers."}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            filters = parse_listing_filters(request.query_params)
+
+        except ValueError as filter_error:
+             return Response({ERROR_KEY: str(filter_error)}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            output_results, sellers_info = search_inventories(client, usernames, page_num, items_per_page, filters)
+
+            response_data = {
+                'page': page_num,
+                'per_page': items_per_page,
+                'sellers': sellers_info,
+                'results': output_results
+            }
             return Response(response_data, status=status.HTTP_200_OK)
 
         except discogs_client.exceptions.HTTPError as http_error:
-            status_code = http_error.status_code if hasattr(http_error, 'status_code') else 500
-            if status_code == 401: # Unauthorized during search - token might have been revoked
-                 auth_url = request.build_absolute_uri(reverse(DISCOGS_AUTHORIZE_KEY))
-                 return Response({
-                      ERROR_KEY: f"Discogs API authentication error ({status_code}). Please re-authorize. ({http_error.msg})",
-                      "authorize_url": auth_url
-                 }, status=status_code)
-            elif status_code == 404:
-                 return Response({ERROR_KEY: f"Discogs user '{username}' not found or inventory is private/empty. ({http_error.msg})"}, status=status_code)
+            return self.discogs_error_response(request, http_error, ', '.join(usernames))
+        except discogs_client.exceptions.DiscogsAPIError as api_error:
+            return Response({ERROR_KEY: f"{DISCOGS_API_ERROR}: {api_error}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        except Exception as e:
+            logger.exception("Unexpected server error during batch search for users %s", usernames)
+            return Response({ERROR_KEY: "Server internal error during research"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+# Which of the wants of the authorized user are on sale by a seller. The inventory is scanned once, without
+# stats lookups, and the scan stops as soon as every want has been found
+class DiscogsWantlistMatchView(DiscogsAuthenticatedView):
+
+    def get(self, request, *args, **kwargs):
+
+        client, identity, error_response = self.authenticate_discogs(request)
+        if error_response is not None:
+            return error_response
+
+        username = request.query_params.get('q')
+
+        if not username:
+             return Response({ERROR_KEY: "Missing 'q' parameter (username)."}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            start_page = max(1, int(request.query_params.get('page', 1)))
+
+        except ValueError:
+             return Response({ERROR_KEY: "'page' parameter must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+
+        mode = request.query_params.get('mode', SEARCH_MODE_LIVE)
+        if mode not in (SEARCH_MODE_LIVE, SEARCH_MODE_SNAPSHOT):
+             return Response({ERROR_KEY: f"'mode' parameter must be '{SEARCH_MODE_LIVE}' or '{SEARCH_MODE_SNAPSHOT}'."}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            wantlist = WANTLIST_CACHE.get(client, identity.username)
+            wanted = wantlist.release_ids
+
+            response_data = {'wantlist': wantlist.describe()}
+            response_status = status.HTTP_200_OK
+
+            if mode == SEARCH_MODE_SNAPSHOT:
+                seller = get_seller(username)
+                snapshot, running = get_snapshot(client, seller)
+                response_data['snapshot'] = describe_snapshot(snapshot, running)
+
+                if snapshot is None:
+                    output_results, found = [], set()
+                    response_status = status.HTTP_202_ACCEPTED
+                else:
+                    output_results, found = match_listings(for_sale_listings(seller), wanted)
+
+            elif wanted:
+                output_results, found, response_data['scan'] = match_inventory(client, username, wanted, start_page)
             else:
-                 return Response({ERROR_KEY: f"{DISCOGS_API_ERROR} ({status_code}): {http_error.msg}"}, status=status_code)
+                output_results, found, response_data['scan'] = [], set(), None
+
+            response_data['found'] = len(found)
+            response_data['results'] = output_results
+            return Response(response_data, status=response_status)
+
+        except discogs_client.exceptions.HTTPError as http_error:
+            return self.discogs_error_response(request, http_error, username)
         except discogs_client.exceptions.DiscogsAPIError as api_error:
             return Response({ERROR_KEY: f"{DISCOGS_API_ERROR}: {api_error}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-        
+
+        except Exception as e:
+            logger.exception("Unexpected server error during wantlist match for user %s", username)
+            return Response({ERROR_KEY: "Server internal error during research"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+# Ranks the whole inventory snapshot of a seller by a composite deal and rarity score, and returns the top
+# listings. The components are weighted by the 'w_deal', 'w_rarity', 'w_condition' and 'w_price' parameters;
+# the snapshot filters narrow the listings scored
+class DiscogsScoresView(DiscogsAuthenticatedView):
+
+    def get(self, request, *args, **kwargs):
+
+        client, identity, error_response = self.authenticate_discogs(request)
+        if error_response is not None:
+            return error_response
+
+        username = request.query_params.get('q')
+
+        if not username:
+             return Response({ERROR_KEY: "Missing 'q' parameter (username)."}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            weights = parse_score_weights(request.query_params)
+            filters = parse_listing_filters(request.query_params)
+
+        except ValueError as score_error:
+             return Response({ERROR_KEY: str(score_error)}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            top = parse_top(request.query_params.get('top'))
+
+        except ValueError:
+             return Response({ERROR_KEY: f"'top' parameter must be an integer between 1 and {MAX_TOP}."}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            seller = get_seller(username)
+            snapshot, running = get_snapshot(client, seller)
+
+            response_data = {
+                'seller': seller.username,
+                'weights': weights,
+                'snapshot': describe_snapshot(snapshot, running)
+            }
+
+            if snapshot is None:
+                # No snapshot to score yet, the crawl progress tells the client when to come back
+                response_data.update({'scored': 0, 'results': []})
+                return Response(response_data, status=status.HTTP_202_ACCEPTED)
+
+            arrays = load_inventory_arrays(apply_listing_filters(for_sale_listings(seller), filters))
+            ranked = rank_inventory(arrays, weights, top)
+
+            listings = Listing.objects.in_bulk([listing_id for listing_id, _, _ in ranked], field_name='listing_id')
+            output_results = []
+            for listing_id, score, components in ranked:
+                item = listings[listing_id].to_item()
+                item['score'] = score
+                item['score_components'] = components
+                output_results.append(item)
+            annotate_cheaper_elsewhere(output_results, seller)
+
+            response_data.update({'scored': len(arrays), 'results': output_results})
+            return Response(response_data, status=status.HTTP_200_OK)
+
+        except discogs_client.exceptions.HTTPError as http_error:
+            return self.discogs_error_response(request, http_error, username)
+        except discogs_client.exceptions.DiscogsAPIError as api_error:
+            return Response({ERROR_KEY: f"{DISCOGS_API_ERROR}: {api_error}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        except Exception as e:
+            logger.exception("Unexpected server error during scoring of the inventory of %s", username)
+            return Response({ERROR_KEY: "Server internal error during scoring"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+# Streaming variant of DiscogsSearchView: the page and its raw listings are sent right away,
+# then every listing is pushed again as soon as its num_for_sale is known
+class DiscogsSearchStreamView(DiscogsAuthenticatedView):
+
+    # Errors are still rendered as JSON, even when the client only accepts text/event-stream
+    def perform_content_negotiation(self, request, force=False):
+        return super().perform_content_negotiation(request, force=True)
+
+    def get(self, request, *args, **kwargs):
+
+        client, identity, error_response = self.authenticate_discogs(request)
+        if error_response is not None:
+            return error_response
+
+        username = request.query_params.get('q')
+
+        if not username:
+             return Response({ERROR_KEY: "Missing 'q' parameter (username)."}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            page_num, items_per_page = parse_pagination_params(request.query_params)
+
+        except ValueError:
+             return Response({ERROR_KEY: "'page' and 'per_page' parameters must be integers."}, status=status.HTTP_400_BAD_REQUEST)
+
+        # The inventory page is downloaded before streaming, so that its errors still get a proper status code
+        try:
+            listings_data, pagination_info = fetch_inventory_page(client, username, page_num, items_per_page)
+
+        except discogs_client.exceptions.HTTPError as http_error:
+            return self.discogs_error_response(request, http_error, username)
+
         except Exception as e:
-            print(f"Unexpected server error during search for user {username}:")
-            traceback.print_exc()
+            logger.exception("Unexpected server error during search for user %s", username)
             return Response({ERROR_KEY: "Server internal error during research"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        stream_format = get_stream_format(request)
+        response = StreamingHttpResponse(search_events(client, listings_data, pagination_info, stream_format),
+                                         content_type=STREAM_CONTENT_TYPES[stream_format])
+        response['Cache-Control'] = 'no-cache'
+        # Stops nginx-like proxies from buffering the events
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+# Whole inventory of a seller as a CSV or JSON Lines download ('format' parameter), streamed one row at a
+# time with flat memory. Rows come from the last complete snapshot when there is one, otherwise from the
+# Discogs pages ('source' forces either). Every row carries a cursor: passing the last one received as
+# 'cursor' resumes an interrupted download right after it. Snapshot filters apply to both sources
+class DiscogsExportView(DiscogsAuthenticatedView):
+
+    # Errors are still rendered as JSON, whatever the requested format
+    def perform_content_negotiation(self, request, force=False):
+        return super().perform_content_negotiation(request, force=True)
+
+    def get(self, request, *args, **kwargs):
+
+        client, identity, error_response = self.authenticate_discogs(request)
+        if error_response is not None:
+            return error_response
+
+        username = request.query_params.get('q')
+
+        if not username:
+             return Response({ERROR_KEY: "Missing 'q' parameter (username)."}, status=status.HTTP_400_BAD_REQUEST)
+
+        export_format = request.query_params.get('format', EXPORT_FORMAT_CSV)
+        if export_format not in EXPORT_CONTENT_TYPES:
+             return Response({ERROR_KEY: f"'format' parameter must be one of: {', '.join(EXPORT_CONTENT_TYPES)}."}, status=status.HTTP_400_BAD_REQUEST)
+
+        source = request.query_params.get('source')
+        if source not in (None, EXPORT_SOURCE_SNAPSHOT, EXPORT_SOURCE_LIVE):
+             return Response({ERROR_KEY: f"'source' parameter must be '{EXPORT_SOURCE_SNAPSHOT}' or '{EXPORT_SOURCE_LIVE}'."}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            filters = parse_listing_filters(request.query_params)
+            cursor = request.query_params.get('cursor')
+            cursor_page, after_id = 1, None
+            if cursor:
+                cursor_source, cursor_page, after_id = decode_export_cursor(cursor)
+                if source not in (None, cursor_source):
+                    raise ValueError("The 'cursor' parameter belongs to a different source.")
+                source = cursor_source
+
+        except ValueError as param_error:
+             return Response({ERROR_KEY: str(param_error)}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Looked up without creating it: the live export creates it once Discogs returned the first page
+        seller = Seller.objects.filter(username__iexact=username).first()
+        snapshot = get_latest_snapshot(seller) if seller is not None and source != EXPORT_SOURCE_LIVE else None
+        if source is None:
+            source = EXPORT_SOURCE_SNAPSHOT if snapshot else EXPORT_SOURCE_LIVE
+
+        if source == EXPORT_SOURCE_SNAPSHOT:
+            if snapshot is None:
+                 return Response({ERROR_KEY: f"No complete snapshot of the inventory of '{username}' yet."}, status=status.HTTP_404_NOT_FOUND)
+            items = snapshot_items(seller, filters, after_id)
+
+        else:
+            # The first page is downloaded before streaming, so that its errors still get a proper status code
+            try:
+                first_page = fetch_first_page(client, username, max(1, cursor_page))
+
+            except discogs_client.exceptions.HTTPError as http_error:
+                return self.discogs_error_response(request, http_error, username)
+
+            except Exception as e:
+                logger.exception("Unexpected server error during export for user %s", username)
+                return Response({ERROR_KEY: "Server internal error during export"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+            if seller is None:
+                seller = get_seller(username)
+
+            # 'stats=0' exports only the stats already cached, without waiting for the missing lookups
+            lookup_stats = request.query_params.get('stats') not in ('0', 'false')
+            items = live_items(client, seller, first_page, filters, after_id, lookup_stats)
+
+        response = StreamingHttpResponse(export_lines(items, export_format), content_type=EXPORT_CONTENT_TYPES[export_format])
+        response['Content-Disposition'] = f'attachment; filename="{seller.username}-inventory.{export_format}"'
+        response['X-Export-Source'] = source
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+# Listings of a release known from the inventories crawled or searched, cheapest first in every currency.
+# Accepts the 'currency' and 'min_condition' filters. No call to Discogs
+class DiscogsReleaseOffersView(APIView):
+
+    def get(self, request, release_id, *args, **kwargs):
+        try:
+            filters = parse_listing_filters(request.query_params)
+
+        except ValueError as filter_error:
+             return Response({ERROR_KEY: str(filter_error)}, status=status.HTTP_400_BAD_REQUEST)
+
+        offers = release_offers(int(release_id), filters.get('currency'), filters.get('min_condition'))
+        return Response({
+            'release_id': int(release_id),
+            'offers': len(offers),
+            'results': offers
+        }, status=status.HTTP_200_OK)
+
+# Reads the 'days' query parameter: the trends window, up to the history retention
+def parse_history_days(query_params):
+    days = int(query_params.get('days', settings.DISCOGS_HISTORY_DEFAULT_DAYS))
+    if not 1 <= days <= settings.DISCOGS_HISTORY_RETENTION_DAYS:
+        raise ValueError
+    return days
+
+# Availability and lowest price of a release over time, from the stats observed by the searches
+class DiscogsReleaseHistoryView(APIView):
+
+    def get(self, request, release_id, *args, **kwargs):
+        try:
+            days = parse_history_days(request.query_params)
+
+        except ValueError:
+             return Response({ERROR_KEY: f"'days' parameter must be an integer between 1 and {settings.DISCOGS_HISTORY_RETENTION_DAYS}."}, status=status.HTTP_400_BAD_REQUEST)
+
+        release_id = int(release_id)
+        return Response({
+            'release_id': release_id,
+            'days': days,
+            'trend': release_trends([release_id], days).get(release_id),
+            'points': release_points(release_id, days)
+        }, status=status.HTTP_200_OK)
+
+# Trends of every release a seller offers (or offered in the window), rarest-getting first, and the
+# listings whose price changed
+class DiscogsSellerHistoryView(APIView):
+
+    def get(self, request, username, *args, **kwargs):
+        try:
+            days = parse_history_days(request.query_params)
+
+        except ValueError:
+             return Response({ERROR_KEY: f"'days' parameter must be an integer between 1 and {settings.DISCOGS_HISTORY_RETENTION_DAYS}."}, status=status.HTTP_400_BAD_REQUEST)
+
+        seller = Seller.objects.filter(username__iexact=username).first()
+        if seller is None:
+             return Response({ERROR_KEY: f"No history for seller '{username}'."}, status=status.HTTP_404_NOT_FOUND)
+
+        release_ids = seller.price_history.values('release_id').distinct()
+        trends = release_trends(release_ids, days)
+
+        output_results = [{'release_id': release_id, **trend} for release_id, trend in trends.items()]
+        output_results.sort(key=lambda trend: (trend['num_for_sale_per_day'] is None, trend['num_for_sale_per_day'] or 0))
+
+        slopes = [(trend['num_for_sale_per_day'], trend['lowest_price_per_day']) for trend in trends.values()]
+        summary = {
+            'releases': len(trends),
+            'rarer': sum(1 for num_for_sale, _ in slopes if num_for_sale is not None and num_for_sale < 0),
+            'more_common': sum(1 for num_for_sale, _ in slopes if num_for_sale is not None and num_for_sale > 0),
+            'cheaper': sum(1 for _, lowest_price in slopes if lowest_price is not None and lowest_price < 0),
+            'pricier': sum(1 for _, lowest_price in slopes if lowest_price is not None and lowest_price > 0),
+        }
+
+        return Response({
+            'seller': seller.username,
+            'days': days,
+            'summary': summary,
+            'results': output_results,
+            'price_changes': listing_price_changes(seller, days)
+        }, status=status.HTTP_200_OK)
+
+# Accounts of the credentials pool, with their rate limit budget and health, for staff users only.
+# Tokens are never shown
+class DiscogsAccountsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        accounts = describe_accounts(DiscogsCredentials.objects.order_by('-last_updated', '-pk'))
+        return Response({
+            'active': sum(1 for account in accounts if account['active']),
+            'results': accounts
+        }, status=status.HTTP_200_OK)
+
+# Reads an optional refresh interval in seconds of the watchlist requests
+def parse_watch_interval(data, name):
+    value = data.get(name)
+    if value in (None, ''):
+        return None
+    value = int(value)
+    if value < 60:
+        raise ValueError
+    return value
+
+# Sellers whose inventory and marketplace stats are refreshed in background by the run_jobs workers.
+# POST adds a seller ('username', optional 'inventory_interval' and 'stats_interval' in seconds). Changes
+# are reserved to staff users, as every watched seller spends the shared rate limit budget
+class DiscogsWatchlistView(DiscogsAuthenticatedView):
+    permission_classes = [IsAdminUserOrReadOnly]
+
+    def get(self, request, *args, **kwargs):
+        watches = WatchedSeller.objects.select_related('seller').order_by('seller__username')
+        output_results = [describe_watch(watch) for watch in watches]
+        return Response({
+            'watched': len(output_results),
+            'results': output_results
+        }, status=status.HTTP_200_OK)
+
+    def post(self, request, *args, **kwargs):
+        if not isinstance(request.data, dict):
+             return Response({ERROR_KEY: "The body must be an object with a 'username' field."}, status=status.HTTP_400_BAD_REQUEST)
+
+        username = str(request.data.get('username') or '').strip()
+        if not username:
+             return Response({ERROR_KEY: "Missing 'username' parameter."}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            inventory_interval = parse_watch_interval(request.data, 'inventory_interval')
+            stats_interval = parse_watch_interval(request.data, 'stats_interval')
+
+        except (TypeError, ValueError):
+             return Response({ERROR_KEY: "'inventory_interval' and 'stats_interval' must be integers of at least 60 seconds."}, status=status.HTTP_400_BAD_REQUEST)
+
+        client, identity, error_response = self.authenticate_discogs(request)
+        if error_response is not None:
+            return error_response
+
+        # The seller is only created once Discogs knows it: its refreshes would run forever otherwise
+        try:
+            fetch_inventory_page(client, username, 1, 1)
+
+        except discogs_client.exceptions.HTTPError as http_error:
+            return self.discogs_error_response(request, http_error, username)
+
+        except Exception as e:
+            logger.exception("Unexpected server error while checking the seller %s", username)
+            return Response({ERROR_KEY: "Server internal error while checking the seller"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        watch, created = watch_seller(get_seller(username), inventory_interval, stats_interval)
+        return Response(describe_watch(watch), status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+
+# Removes a seller from the watchlist. Its snapshot is kept
+class DiscogsWatchedSellerView(APIView):
+    permission_classes = [IsAdminUserOrReadOnly]
+
+    def delete(self, request, username, *args, **kwargs):
+        seller = Seller.objects.filter(username__iexact=username).first()
+        if seller is None or not unwatch_seller(seller):
+             return Response({ERROR_KEY: f"Seller '{username}' is not watched."}, status=status.HTTP_404_NOT_FOUND)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+# Prometheus scrape endpoint: counters and histograms of all the workers, plus the shared rate limit budgets
+def discogs_metrics(request):
+    counters, histograms = collect()
+
+    gauges = []
+    for token_hash, remaining, capacity in budget_snapshot():
+        gauges.append(('discogs_ratelimit_remaining', {'token': token_hash}, remaining))
+        gauges.append(('discogs_ratelimit_capacity', {'token': token_hash}, capacity))
+
+    active = DiscogsCredentials.objects.filter(revoked_at__isnull=True).count()
+    gauges.append(('discogs_credentials', {'state': 'active'}, active))
+    gauges.append(('discogs_credentials', {'state': 'revoked'}, DiscogsCredentials.objects.count() - active))
+
+    return HttpResponse(render_prometheus(counters, histograms, gauges), content_type=PROMETHEUS_CONTENT_TYPE)
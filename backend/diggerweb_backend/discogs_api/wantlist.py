@@ -0,0 +1,182 @@
+# Copyright 2025 Giorgio Gamba
+
+import logging
+import math
+import threading
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+
+from .constants import BASE_API_URL
+from .listings import MAX_ITEMS_PER_PAGE, fetch_inventory_page, get_release_id, build_item
+from .metrics import PHASE_WANTLIST, timed
+
+logger = logging.getLogger(__name__)
+
+# Why a wantlist match stopped scanning the inventory
+SCAN_ALL_FOUND = 'all_found'
+SCAN_END = 'end'
+SCAN_PAGE_LIMIT = 'page_limit'
+
+# Releases matched per query on the local listings, below the SQLite variables limit
+SNAPSHOT_MATCH_CHUNK = 500
+
+def wantlist_page_url(username, page_num):
+    query_string = urlencode({'page': page_num, 'per_page': MAX_ITEMS_PER_PAGE})
+    return f"{BASE_API_URL}/users/{username}/wants?{query_string}"
+
+# Downloads one page of the wantlist of a user. Returns the release ids on it and the number of wants
+def fetch_wantlist_page(client, username, page_num):
+    with timed(PHASE_WANTLIST):
+        response_data = client._get(wantlist_page_url(username, page_num))
+
+    if not isinstance(response_data, dict) or 'wants' not in response_data:
+        logger.error("Unexpected wantlist response: %s", response_data)
+        raise ValueError("Invalid wantlist response received from the Discogs API")
+
+    release_ids = [want.get('id') for want in response_data['wants'] if want.get('id')]
+    return release_ids, response_data.get('pagination', {}).get('items', len(release_ids))
+
+def _pages(items):
+    return max(1, math.ceil(items / MAX_ITEMS_PER_PAGE))
+
+# Release ids wanted by a user. first_page is kept to tell cheaply whether the wantlist changed
+class Wantlist:
+
+    def __init__(self, username, release_ids, items, first_page):
+        self.username = username
+        self.release_ids = frozenset(release_ids)
+        self.items = items
+        self.first_page = first_page
+        self.loaded_at = time.time()
+        self.checked_at = time.monotonic()
+        self.full_load_at = time.monotonic()
+
+    def describe(self):
+        return {'username': self.username, 'wants': len(self.release_ids), 'loaded_at': self.loaded_at}
+
+# Wantlists of the users of this worker. An entry is trusted for DISCOGS_WANTLIST_TTL, then the first page
+# is downloaded again: if nothing changed the entry is kept, if wants were only added (Discogs lists them in
+# the order they were added) just the tail pages are downloaded. Anything else, or an entry older than
+# DISCOGS_WANTLIST_MAX_AGE, means a full reload
+class WantlistCache:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.user_locks = {}
+
+    def _user_lock(self, key):
+        with self.lock:
+            return self.user_locks.setdefault(key, threading.Lock())
+
+    def get(self, client, username):
+        key = username.lower()
+        # Concurrent matches of the same user wait for a single load
+        with self._user_lock(key):
+            with self.lock:
+                wantlist = self.entries.get(key)
+
+            now = time.monotonic()
+            if wantlist is not None and now - wantlist.checked_at < settings.DISCOGS_WANTLIST_TTL:
+                return wantlist
+
+            if wantlist is None or now - wantlist.full_load_at >= settings.DISCOGS_WANTLIST_MAX_AGE:
+                wantlist = self._load(client, username)
+            else:
+                wantlist = self._refresh(client, wantlist)
+
+            with self.lock:
+                self.entries[key] = wantlist
+            return wantlist
+
+    def _load(self, client, username, first_page=None, items=None):
+        if first_page is None:
+            first_page, items = fetch_wantlist_page(client, username, 1)
+
+        release_ids = set(first_page)
+        for page_num in range(2, _pages(items) + 1):
+            page_ids, _ = fetch_wantlist_page(client, username, page_num)
+            release_ids.update(page_ids)
+
+        logger.debug("Loaded the wantlist of %s: %d wants", username, len(release_ids))
+        return Wantlist(username, release_ids, items, first_page)
+
+    def _refresh(self, client, wantlist):
+        first_page, items = fetch_wantlist_page(client, wantlist.username, 1)
+
+        if first_page != wantlist.first_page or items < wantlist.items:
+            return self._load(client, wantlist.username, first_page, items)
+
+        if items > wantlist.items:
+            # The old last page may have had room for some of the new wants
+            release_ids = set(wantlist.release_ids)
+            for page_num in range(_pages(wantlist.items), _pages(items) + 1):
+                page_ids, _ = fetch_wantlist_page(client, wantlist.username, page_num) if page_num > 1 else (first_page, items)
+                release_ids.update(page_ids)
+
+            logger.debug("Wantlist of %s grew from %d to %d wants", wantlist.username, wantlist.items, items)
+            refreshed = Wantlist(wantlist.username, release_ids, items, first_page)
+            refreshed.full_load_at = wantlist.full_load_at
+            return refreshed
+
+        wantlist.checked_at = time.monotonic()
+        return wantlist
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+WANTLIST_CACHE = WantlistCache()
+
+# Scans the "For Sale" inventory of a seller from start_page, keeping the listings of wanted releases.
+# Stops when every want has been found, at the last page or after max_pages pages. Stats are not looked up
+def match_inventory(client, username, wanted, start_page=1, max_pages=None):
+    max_pages = max_pages or settings.DISCOGS_WANTLIST_MAX_PAGES
+    results = []
+    found = set()
+    page_num = start_page
+    pages_scanned = 0
+    pagination_info = {'pages': 0, 'items': 0}
+
+    while True:
+        listings_data, pagination_info = fetch_inventory_page(client, username, page_num, MAX_ITEMS_PER_PAGE)
+        pages_scanned += 1
+
+        hits = {get_release_id(listing_dict) for listing_dict in listings_data} & wanted
+        if hits:
+            found |= hits
+            results.extend(build_item(listing_dict, None) for listing_dict in listings_data if get_release_id(listing_dict) in hits)
+
+        if found == wanted:
+            stopped = SCAN_ALL_FOUND
+        elif page_num >= pagination_info['pages']:
+            stopped = SCAN_END
+        elif pages_scanned >= max_pages:
+            stopped = SCAN_PAGE_LIMIT
+        else:
+            page_num += 1
+            continue
+        break
+
+    scan_info = {
+        'start_page': start_page,
+        'pages_scanned': pages_scanned,
+        'pages_total': pagination_info['pages'],
+        'items_total': pagination_info['items'],
+        'stopped': stopped,
+        'next_page': page_num + 1 if stopped == SCAN_PAGE_LIMIT else None,
+    }
+    return results, found, scan_info
+
+# Same as match_inventory, on the local snapshot of the inventory
+def match_listings(listings, wanted):
+    wanted = sorted(wanted)
+    results = []
+    found = set()
+    for offset in range(0, len(wanted), SNAPSHOT_MATCH_CHUNK):
+        for listing in listings.filter(release_id__in=wanted[offset:offset + SNAPSHOT_MATCH_CHUNK]).order_by('listing_id'):
+            results.append(listing.to_item())
+            found.add(listing.release_id)
+    return results, found
@@ -0,0 +1,158 @@
+# Copyright 2025 Giorgio Gamba
+
+import logging
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .client import get_authenticated_client
+from .crawler import claim_crawl, describe_snapshot, execute_snapshot, for_sale_listings, get_latest_snapshot, get_running_snapshot, next_snapshot_kind, update_listing_stats
+from .jobs import enqueue_job
+from .models import InventorySnapshot, MarketplaceStats, Seller, WatchedSeller
+from .ratelimit import PRIORITY_REFRESH, upstream_priority
+from .stats import refetch_marketplace_stats_bulk
+from .utils import load_access_token
+
+logger = logging.getLogger(__name__)
+
+JOB_REFRESH_INVENTORY = 'refresh_inventory'
+JOB_REFRESH_STATS = 'refresh_stats'
+
+def inventory_interval(watch):
+    return watch.inventory_interval or settings.DISCOGS_WATCH_INVENTORY_INTERVAL
+
+def stats_interval(watch):
+    return watch.stats_interval or settings.DISCOGS_WATCH_STATS_INTERVAL
+
+# Next run after the interval, moved randomly by up to DISCOGS_WATCH_JITTER of it, so that the sellers
+# watched at the same time don't all refresh together
+def _next_run(now, interval):
+    jitter = interval * settings.DISCOGS_WATCH_JITTER
+    return now + timedelta(seconds=interval + random.uniform(-jitter, jitter))
+
+# Adds the seller to the watchlist, or updates its intervals. Its first refreshes are due right away
+def watch_seller(seller, inventory_interval=None, stats_interval=None):
+    watch, created = WatchedSeller.objects.get_or_create(seller=seller, defaults={
+        'inventory_interval': inventory_interval,
+        'stats_interval': stats_interval,
+    })
+    if not created:
+        watch.inventory_interval = inventory_interval
+        watch.stats_interval = stats_interval
+        watch.save(update_fields=['inventory_interval', 'stats_interval'])
+    return watch, created
+
+def unwatch_seller(seller):
+    return WatchedSeller.objects.filter(seller=seller).delete()[0] > 0
+
+# True if the seller is watched and its snapshot is ready: its searches are served from the snapshot by default
+def has_watched_snapshot(username):
+    return InventorySnapshot.objects.filter(seller__username__iexact=username, seller__watch__isnull=False,
+                                            status=InventorySnapshot.STATUS_COMPLETE).exists()
+
+# Queues the refreshes of the watched sellers that are due. Every due time is moved forward with a conditional
+# UPDATE before queueing, so several workers scheduling at once queue each refresh once. Returns the jobs queued
+def schedule_due_refreshes():
+    now = timezone.now()
+    queued = 0
+
+    for watch in WatchedSeller.objects.filter(Q(next_inventory_at__lte=now) | Q(next_stats_at__lte=now)).select_related('seller'):
+        if watch.next_inventory_at <= now:
+            moved = WatchedSeller.objects.filter(pk=watch.pk, next_inventory_at=watch.next_inventory_at).update(
+                next_inventory_at=_next_run(now, inventory_interval(watch)))
+            if moved:
+                _, created = enqueue_job(JOB_REFRESH_INVENTORY, f"inventory:{watch.seller_id}", {'seller_id': watch.seller_id})
+                queued += created
+
+        if watch.next_stats_at <= now:
+            moved = WatchedSeller.objects.filter(pk=watch.pk, next_stats_at=watch.next_stats_at).update(
+                next_stats_at=_next_run(now, stats_interval(watch)))
+            if moved:
+                _, created = enqueue_job(JOB_REFRESH_STATS, f"stats:{watch.seller_id}", {'seller_id': watch.seller_id})
+                queued += created
+
+    if queued:
+        logger.info("%d watchlist refreshes queued", queued)
+    return queued
+
+# Client of the primary account. Without credentials the job fails, and is retried later
+def _job_client():
+    access_token, access_secret = load_access_token()
+    if not access_token or not access_secret:
+        raise RuntimeError("Discogs authorization required, complete the OAuth flow first")
+    return get_authenticated_client(access_token, access_secret)
+
+# Crawls or syncs the inventory snapshot of the seller, in the worker thread. A crawl already running
+# (e.g. started by a search) is left alone
+def refresh_inventory_job(payload):
+    seller = Seller.objects.get(pk=payload['seller_id'])
+    client = _job_client()
+
+    snapshot, created = claim_crawl(seller, next_snapshot_kind(seller))
+    if not created:
+        logger.info("Inventory of %s already being crawled (snapshot %d)", seller.username, snapshot.pk)
+        return
+
+    execute_snapshot(client, snapshot)
+
+# Releases of the listings of the seller whose marketplace stats are missing or older than the interval, oldest first
+def stale_release_ids(seller, max_age, limit):
+    release_ids = set(for_sale_listings(seller).values_list('release_id', flat=True))
+    cutoff = timezone.now() - timedelta(seconds=max_age)
+
+    fresh = set()
+    stale = []
+    for release_id, fetched_at in MarketplaceStats.objects.filter(release_id__in=release_ids).values_list('release_id', 'fetched_at'):
+        if fetched_at >= cutoff:
+            fresh.add(release_id)
+        else:
+            stale.append((fetched_at, release_id))
+
+    missing = sorted(release_ids - fresh - {release_id for _, release_id in stale})
+    stale.sort()
+    return (missing + [release_id for _, release_id in stale])[:limit]
+
+# Fetches again the stale marketplace stats of the listings of the seller and applies them to the snapshot
+# listings. Its calls go after interactive searches, before the crawls
+def refresh_stats_job(payload):
+    seller = Seller.objects.get(pk=payload['seller_id'])
+    watch = WatchedSeller.objects.filter(seller=seller).first()
+    max_age = stats_interval(watch) if watch else settings.DISCOGS_WATCH_STATS_INTERVAL
+
+    release_ids = stale_release_ids(seller, max_age, settings.DISCOGS_WATCH_STATS_BATCH)
+    if not release_ids:
+        return
+
+    client = _job_client()
+    with upstream_priority(PRIORITY_REFRESH):
+        # Stats refreshed by a search while the job was queued are recent enough to keep
+        results = refetch_marketplace_stats_bulk(client, release_ids, max_age)
+
+    stats_by_release = {release_id: stats for release_id, (stats, error) in results.items() if stats}
+    updated = update_listing_stats(seller, stats_by_release)
+    logger.info("Stats of %d releases of %s refreshed, %d listings updated", len(stats_by_release), seller.username, updated)
+
+    errors = len(release_ids) - len(stats_by_release)
+    if errors and not stats_by_release:
+        raise RuntimeError(f"No stats could be refreshed for {seller.username} ({errors} errors)")
+
+JOB_HANDLERS = {
+    JOB_REFRESH_INVENTORY: refresh_inventory_job,
+    JOB_REFRESH_STATS: refresh_stats_job,
+}
+
+# Watch settings and snapshot state of a watched seller, as reported by the watchlist endpoint
+def describe_watch(watch):
+    seller = watch.seller
+    return {
+        'seller': seller.username,
+        'inventory_interval': inventory_interval(watch),
+        'stats_interval': stats_interval(watch),
+        'next_inventory_at': watch.next_inventory_at,
+        'next_stats_at': watch.next_stats_at,
+        'watched_since': watch.created_at,
+        'snapshot': describe_snapshot(get_latest_snapshot(seller), get_running_snapshot(seller)),
+    }
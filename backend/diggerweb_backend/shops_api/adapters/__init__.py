@@ -0,0 +1,28 @@
+# Copyright 2025 Giorgio Gamba
+
+import threading
+
+from django.conf import settings
+
+from .decks import DecksAdapter
+from .hardwax import HardwaxAdapter
+from .juno import JunoAdapter
+
+# One module per shop: a new shop is an adapter class (see base.ShopAdapter) added here. Adapters run only
+# when listed in SHOPS_ENABLED, which is empty until their selectors are checked against the live sites
+ADAPTER_CLASSES = {adapter_class.name: adapter_class for adapter_class in (DecksAdapter, HardwaxAdapter, JunoAdapter)}
+
+# Adapters are per process, each with its connection pool and its cache
+_adapters = {}
+_adapters_lock = threading.Lock()
+
+def get_adapter(name):
+    with _adapters_lock:
+        adapter = _adapters.get(name)
+        if adapter is None:
+            adapter = ADAPTER_CLASSES[name]()
+            _adapters[name] = adapter
+        return adapter
+
+def enabled_shops():
+    return [name.strip() for name in settings.SHOPS_ENABLED.split(',') if name.strip() in ADAPTER_CLASSES]
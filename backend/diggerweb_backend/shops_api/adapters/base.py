@@ -0,0 +1,254 @@
+# Copyright 2025 Giorgio Gamba
+
+import json
+import os
+import re
+import threading
+from html.parser import HTMLParser
+
+import httpx
+from django.conf import settings
+
+from ..cache import ParseCache
+from ...discogs_api.constants import APPLICATION_AGENT_NAME
+
+# Elements without a closing tag, never pushed on the parser stack
+VOID_ELEMENTS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'source', 'track', 'wbr'}
+
+CURRENCY_SYMBOLS = {'€': 'EUR', '£': 'GBP', '$': 'USD', '¥': 'JPY'}
+CURRENCY_CODE = re.compile(r'\b(EUR|GBP|USD|JPY|CHF)\b')
+PRICE_NUMBER = re.compile(r'\d+(?:[.,]\d{3})*(?:[.,]\d{1,2})?')
+
+SOLD_OUT_WORDS = ('sold out', 'out of stock', 'ausverkauft', 'not available')
+
+# Raised on network errors, timeouts and unexpected responses of a shop
+class ShopError(Exception):
+    pass
+
+# Collects the products of a search page: every element whose class contains item_class starts a product,
+# the text of the elements inside it whose class matches one of field_classes goes to that field. The link
+# of the product is the href of its link_class element, or of its first link
+class ProductListParser(HTMLParser):
+
+    def __init__(self, item_class, field_classes, link_class=None):
+        super().__init__(convert_charrefs=True)
+        self.item_class = item_class
+        self.field_classes = field_classes
+        self.link_class = link_class
+        self.products = []
+        # Depth of the open elements, and the depths at which the current product and field started
+        self.depth = 0
+        self.item_depth = None
+        self.field = None
+        self.field_depth = None
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        classes = (attrs.get('class') or '').split()
+
+        if tag not in VOID_ELEMENTS:
+            self.depth += 1
+
+        if self.item_depth is None:
+            if self.item_class in classes:
+                self.item_depth = self.depth
+                self.products.append({})
+            return
+
+        product = self.products[-1]
+        if tag == 'a' and attrs.get('href') and ((self.link_class and self.link_class in classes) or (not self.link_class and 'url' not in product)):
+            product['url'] = attrs['href']
+
+        if self.field is None and tag not in VOID_ELEMENTS:
+            for field, class_name in self.field_classes.items():
+                if class_name in classes:
+                    self.field = field
+                    self.field_depth = self.depth
+                    product.setdefault(field, '')
+                    break
+
+    def handle_endtag(self, tag):
+        if tag in VOID_ELEMENTS:
+            return
+
+        if self.field is not None and self.depth == self.field_depth:
+            self.field = None
+            self.field_depth = None
+        if self.item_depth is not None and self.depth == self.item_depth:
+            self.item_depth = None
+        self.depth = max(0, self.depth - 1)
+
+    def handle_data(self, data):
+        if self.field is not None:
+            product = self.products[-1]
+            product[self.field] = f"{product[self.field]} {data}" if product[self.field] else data
+
+def clean_text(value):
+    return ' '.join((value or '').split())
+
+# Reads value and currency of a price as shown by the shops: "12,99 €", "£9.49", "EUR 14.50"
+def parse_price(text):
+    text = clean_text(text)
+    currency = next((code for symbol, code in CURRENCY_SYMBOLS.items() if symbol in text), None)
+    if currency is None:
+        code = CURRENCY_CODE.search(text)
+        currency = code.group(1) if code else None
+
+    number = PRICE_NUMBER.search(text)
+    if number is None:
+        return None, currency
+
+    value = number.group(0)
+    # The last separator followed by 1 or 2 digits is the decimal one
+    decimal = re.search(r'[.,](\d{1,2})$', value)
+    integer_part = value[:decimal.start()] if decimal else value
+    integer_part = integer_part.replace('.', '').replace(',', '')
+    try:
+        return float(f"{integer_part}.{decimal.group(1)}" if decimal else integer_part), currency
+    except ValueError:
+        return None, currency
+
+# Letters and digits only, lower case: "BC-02" and "bc 02" compare equal
+def normalize(value):
+    return re.sub(r'[^0-9a-z]+', '', (value or '').lower())
+
+def _words(value):
+    return set(re.findall(r'[0-9a-z]+', (value or '').lower()))
+
+# How a shop product matches the release looked up: 'catno' when the catalog numbers are the same, 'title'
+# when it carries every word of the title and at least one of the artist, None otherwise
+def match_product(product, query):
+    if query.get('catno') and normalize(product.get('catno')) == normalize(query['catno']):
+        return 'catno'
+
+    title_words = _words(query.get('title'))
+    product_words = _words(product.get('title')) | _words(product.get('artist'))
+    artist_words = _words(query.get('artist'))
+    if title_words and title_words <= product_words and (not artist_words or artist_words & product_words):
+        return 'title'
+    return None
+
+# Lookup of releases on a shop. Subclasses give the search URL of a query and parse the page. Every adapter
+# keeps its own keep-alive connection pool, its timeout and its cache of parsed pages. The base URL and the
+# timeout can be overridden with SHOPS_<NAME>_URL and SHOPS_<NAME>_TIMEOUT, e.g. to point at the mock server
+class ShopAdapter:
+    name = None
+    label = None
+    default_base_url = None
+    search_path = '/'
+    # Seconds, SHOPS_TIMEOUT when None
+    timeout = None
+    # 'html' or 'json'
+    response_format = 'html'
+    # Currency of the prices shown without one
+    currency = None
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.http_client = None
+        self.cache = ParseCache(settings.SHOPS_CACHE_SIZE, settings.SHOPS_CACHE_TTL)
+
+    @property
+    def base_url(self):
+        return os.getenv(f"SHOPS_{self.name.upper()}_URL", self.default_base_url).rstrip('/')
+
+    def get_timeout(self):
+        return float(os.getenv(f"SHOPS_{self.name.upper()}_TIMEOUT", self.timeout or settings.SHOPS_TIMEOUT))
+
+    def get_http_client(self):
+        with self.lock:
+            if self.http_client is None or self.http_client.is_closed:
+                limits = httpx.Limits(max_connections=settings.SHOPS_MAX_CONNECTIONS, max_keepalive_connections=settings.SHOPS_MAX_CONNECTIONS)
+                self.http_client = httpx.Client(timeout=self.get_timeout(), limits=limits, follow_redirects=True,
+                                                headers={'User-Agent': APPLICATION_AGENT_NAME})
+            return self.http_client
+
+    # Text searched on the shop: the catalog number when known, as it is the most selective, otherwise artist and title
+    def search_text(self, query):
+        return query.get('catno') or ' '.join(value for value in (query.get('artist'), query.get('title')) if value)
+
+    def search_params(self, query):
+        raise NotImplementedError
+
+    # Products of a search page, as dicts with artist, title, label, catno, price, availability and url
+    def parse(self, body):
+        raise NotImplementedError
+
+    def fetch(self, url, params):
+        try:
+            response = self.get_http_client().get(url, params=params)
+        except httpx.TimeoutException:
+            raise ShopError(f"{self.label} didn't answer within {self.get_timeout():g}s")
+        except httpx.HTTPError as e:
+            raise ShopError(f"{self.label} unreachable: {e}")
+
+        if response.status_code == 404:
+            return None
+        if response.status_code != 200:
+            raise ShopError(f"{self.label} answered {response.status_code}")
+
+        if self.response_format == 'json':
+            try:
+                return response.json()
+            except ValueError:
+                raise ShopError(f"{self.label} sent an invalid JSON response")
+        return response.text
+
+    def is_available(self, product):
+        availability = clean_text(product.get('availability')).lower()
+        if not availability:
+            return None
+        return not any(word in availability for word in SOLD_OUT_WORDS)
+
+    # Turns a parsed product into a result: clean fields, price and currency, absolute url
+    def build_result(self, product):
+        price, currency = parse_price(product.get('price'))
+        url = product.get('url')
+        if url and url.startswith('/'):
+            url = f"{self.base_url}{url}"
+
+        return {
+            'shop': self.name,
+            'artist': clean_text(product.get('artist')),
+            'title': clean_text(product.get('title')),
+            'label': clean_text(product.get('label')),
+            'catno': clean_text(product.get('catno')),
+            'price': price,
+            'currency': currency or self.currency,
+            'available': self.is_available(product),
+            'url': url,
+        }
+
+    # Searches the release on the shop. Returns the results and whether they came from the cache.
+    # Raises ShopError when the shop can't be searched
+    def lookup(self, query):
+        params = self.search_params(query)
+        url = f"{self.base_url}{self.search_path}"
+        cache_key = f"{url}?{json.dumps(params, sort_keys=True)}"
+
+        results = self.cache.get(cache_key)
+        if results is not None:
+            return results, True
+
+        body = self.fetch(url, params)
+        results = [self.build_result(product) for product in self.parse(body)] if body else []
+        self.cache.put(cache_key, results)
+        return results, False
+
+    def close(self):
+        with self.lock:
+            if self.http_client is not None:
+                self.http_client.close()
+                self.http_client = None
+
+# Adapter of a shop whose search pages list the products in HTML elements found by class (see ProductListParser)
+class HtmlShopAdapter(ShopAdapter):
+    item_class = None
+    field_classes = {}
+    link_class = None
+
+    def parse(self, body):
+        parser = ProductListParser(self.item_class, self.field_classes, self.link_class)
+        parser.feed(body)
+        parser.close()
+        return parser.products
@@ -0,0 +1,25 @@
+# Copyright 2025 Giorgio Gamba
+
+from .base import HtmlShopAdapter
+
+# decks.de, Frankfurt: electronic music vinyl, prices in EUR
+class DecksAdapter(HtmlShopAdapter):
+    name = 'decks'
+    label = 'decks.de'
+    default_base_url = 'https://www.decks.de'
+    search_path = '/decks/workfloor/search_db.php'
+    currency = 'EUR'
+
+    item_class = 'cover1'
+    field_classes = {
+        'artist': 'artist',
+        'title': 'title',
+        'label': 'label',
+        'catno': 'catno',
+        'price': 'preis',
+        'availability': 'stock',
+    }
+    link_class = 'detail'
+
+    def search_params(self, query):
+        return {'such': self.search_text(query), 'wosuchen': 'alles'}
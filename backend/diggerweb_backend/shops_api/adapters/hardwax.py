@@ -0,0 +1,31 @@
+# Copyright 2025 Giorgio Gamba
+
+from .base import HtmlShopAdapter
+
+# Hard Wax, Berlin: techno, house and dub, prices in EUR
+class HardwaxAdapter(HtmlShopAdapter):
+    name = 'hardwax'
+    label = 'Hard Wax'
+    default_base_url = 'https://hardwax.com'
+    search_path = '/'
+    currency = 'EUR'
+
+    item_class = 'listing'
+    field_classes = {
+        'artist': 'listing-artist',
+        'title': 'listing-title',
+        'label': 'listing-label',
+        'catno': 'listing-catno',
+        'price': 'listing-price',
+        'availability': 'listing-status',
+    }
+    link_class = 'listing-link'
+
+    def search_params(self, query):
+        return {'search': self.search_text(query)}
+
+    # Artists are shown as "Artist:" before the title
+    def build_result(self, product):
+        result = super().build_result(product)
+        result['artist'] = result['artist'].rstrip(':').strip()
+        return result
@@ -0,0 +1,26 @@
+# Copyright 2025 Giorgio Gamba
+
+from .base import HtmlShopAdapter
+
+# Juno Records, London: large catalogue, prices in GBP. Its search pages are heavier than the others
+class JunoAdapter(HtmlShopAdapter):
+    name = 'juno'
+    label = 'Juno Records'
+    default_base_url = 'https://www.juno.co.uk'
+    search_path = '/search/'
+    currency = 'GBP'
+    timeout = 6.0
+
+    item_class = 'dv-item'
+    field_classes = {
+        'artist': 'juno-artist',
+        'title': 'juno-title',
+        'label': 'juno-label',
+        'catno': 'juno-catno',
+        'price': 'pl-big-price',
+        'availability': 'juno-stock',
+    }
+    link_class = 'juno-title'
+
+    def search_params(self, query):
+        return {'q[all][]': self.search_text(query), 'solrorder': 'relevancy'}
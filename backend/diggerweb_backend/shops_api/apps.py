@@ -0,0 +1,6 @@
+from django.apps import AppConfig
+
+
+class ShopsApiConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'diggerweb_backend.shops_api'
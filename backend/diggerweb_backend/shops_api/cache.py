@@ -0,0 +1,40 @@
+# Copyright 2025 Giorgio Gamba
+
+import threading
+import time
+from collections import OrderedDict
+
+# In-process LRU of parsed shop pages: search URL -> (results, expiry). Shops change slowly and parsing a page
+# costs more than serving it from here, so the same release looked up again within the TTL costs nothing
+class ParseCache:
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+
+            results, expires_at = entry
+            if time.monotonic() >= expires_at:
+                del self.entries[key]
+                return None
+
+            self.entries.move_to_end(key)
+            return results
+
+    def put(self, key, results):
+        with self.lock:
+            self.entries[key] = (results, time.monotonic() + self.ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
@@ -0,0 +1,96 @@
+# Copyright 2025 Giorgio Gamba
+
+import logging
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from django.conf import settings
+
+from .adapters import get_adapter
+from .adapters.base import ShopError, match_product
+from ..discogs_api.models import Listing, Release
+
+logger = logging.getLogger(__name__)
+
+# Shops are searched in parallel, so a lookup takes as long as the slowest shop instead of the sum of them
+SHOP_EXECUTOR = ThreadPoolExecutor(max_workers=settings.SHOPS_MAX_WORKERS, thread_name_prefix='shop-lookup')
+
+SHOP_STATUS_OK = 'ok'
+SHOP_STATUS_ERROR = 'error'
+SHOP_STATUS_TIMEOUT = 'timeout'
+
+MATCH_ORDER = {'catno': 0, 'title': 1, None: 2}
+
+# Trailing "(12", Album)" of the Discogs listing descriptions
+DESCRIPTION_FORMAT = re.compile(r'\s*\([^()]*\)\s*$')
+
+# Title of a release from the description of its Discogs listings, "Artist - Title (Format)"
+def title_from_description(description, artist):
+    title = DESCRIPTION_FORMAT.sub('', description or '')
+    if artist and title.lower().startswith(f"{artist.lower()} - "):
+        title = title[len(artist) + 3:]
+    return title.strip()
+
+# Artist, title and catalog number of a Discogs release, from the imported dumps or from the listings seen
+# by the searches and crawls. None if the release is unknown
+def release_query(release_id):
+    release = Release.objects.filter(release_id=release_id).first()
+    if release is not None:
+        return {'artist': release.artist, 'title': release.title, 'catno': release.catno.split(',')[0].strip()}
+
+    listing = Listing.objects.filter(release_id=release_id).order_by('-updated_at').first()
+    if listing is not None:
+        return {'artist': listing.artist, 'title': title_from_description(listing.title, listing.artist), 'catno': ''}
+    return None
+
+# Runs in the shop pool: never raises, the outcome of the shop is in the returned dict
+def _lookup_shop(name, query):
+    adapter = get_adapter(name)
+    start = time.perf_counter()
+    shop_result = {'shop': name, 'label': adapter.label, 'status': SHOP_STATUS_OK, 'cached': False, 'results': []}
+
+    try:
+        results, shop_result['cached'] = adapter.lookup(query)
+        matched = [dict(result, match=match_product(result, query)) for result in results]
+        matched.sort(key=lambda result: (MATCH_ORDER[result['match']], result['price'] is None, result['price'] or 0))
+        shop_result['results'] = matched[:settings.SHOPS_MAX_RESULTS]
+
+    except ShopError as e:
+        logger.warning("Lookup on %s failed: %s", name, e)
+        shop_result.update({'status': SHOP_STATUS_ERROR, 'error': str(e)})
+    except Exception as e:
+        logger.exception("Unexpected error during lookup on %s: %s", name, e)
+        shop_result.update({'status': SHOP_STATUS_ERROR, 'error': f"Lookup on {adapter.label} failed"})
+
+    shop_result['elapsed_ms'] = round((time.perf_counter() - start) * 1000, 1)
+    return shop_result
+
+# Cheapest available copy of the release in every currency, among the matching results of all the shops
+def cheapest_matches(shop_results):
+    cheapest = {}
+    for shop_result in shop_results:
+        for result in shop_result['results']:
+            if result['match'] is None or result['price'] is None or result['available'] is False:
+                continue
+            best = cheapest.get(result['currency'])
+            if best is None or result['price'] < best['price']:
+                cheapest[result['currency']] = result
+    return sorted(cheapest.values(), key=lambda result: (result['currency'] or '', result['price']))
+
+# Looks up the release on the given shops at once. A shop slower than its own timeout is reported as such
+# without delaying the others; its page still lands in the cache for the next lookup
+def lookup_release(query, shops):
+    futures = {name: SHOP_EXECUTOR.submit(_lookup_shop, name, query) for name in shops}
+    time_limit = max((get_adapter(name).get_timeout() for name in shops), default=0)
+    wait(futures.values(), timeout=time_limit + 0.5)
+
+    shop_results = []
+    for name, future in futures.items():
+        if future.done():
+            shop_results.append(future.result())
+        else:
+            adapter = get_adapter(name)
+            shop_results.append({'shop': name, 'label': adapter.label, 'status': SHOP_STATUS_TIMEOUT, 'cached': False, 'results': [],
+                                 'error': f"{adapter.label} didn't answer within {adapter.get_timeout():g}s"})
+    return shop_results
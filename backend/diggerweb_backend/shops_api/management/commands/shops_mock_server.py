@@ -0,0 +1,39 @@
+# Copyright 2025 Giorgio Gamba
+
+from django.core.management.base import BaseCommand, CommandError
+
+from diggerweb_backend.shops_api.mock_server import FIXTURES_DIR, MockShopServer
+
+def parse_latencies(values):
+    latencies = {}
+    for value in values or []:
+        shop, _, milliseconds = value.partition('=')
+        try:
+            latencies[shop] = float(milliseconds) / 1000
+        except ValueError:
+            raise CommandError(f"Invalid latency '{value}', expected shop=milliseconds")
+    return latencies
+
+# Serves the saved shop pages as a local stand-in of the shops, so that the lookups can run without
+# touching the real ones
+class Command(BaseCommand):
+    help = "Runs a local stand-in of the shops searched by the lookups, serving saved pages"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8766)
+        parser.add_argument('--fixtures', default=FIXTURES_DIR, help="Directory of the <shop>.html pages")
+        parser.add_argument('--latency', nargs='*', help="Latency of some shops, as shop=milliseconds")
+
+    def handle(self, *args, **options):
+        server = MockShopServer(options['fixtures'], host=options['host'], port=options['port'], latencies=parse_latencies(options['latency']))
+
+        self.stdout.write(f"Mock shops listening on {server.base_url}, point the backend at them with:")
+        for shop in server.shops():
+            self.stdout.write(f"  SHOPS_{shop.upper()}_URL={server.base_url}/{shop}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.httpd.server_close()
@@ -0,0 +1,80 @@
+# Copyright 2025 Giorgio Gamba
+
+import os
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+# Stand-in of the shops serving saved search pages: every request under /<shop>/ gets fixtures/<shop>.html,
+# whatever the query, after the latency of the shop. Point an adapter at it with SHOPS_<NAME>_URL=<base_url>/<shop>
+class MockShopServer:
+
+    def __init__(self, fixtures_dir=FIXTURES_DIR, host='127.0.0.1', port=0, latencies=None):
+        self.fixtures_dir = fixtures_dir
+        # Shop -> seconds
+        self.latencies = latencies or {}
+
+        self.lock = threading.Lock()
+        self.calls = Counter()
+
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def shops(self):
+        return sorted(file_name[:-5] for file_name in os.listdir(self.fixtures_dir) if file_name.endswith('.html'))
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name='mock-shops', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def serve_forever(self):
+        self.httpd.serve_forever()
+
+    def _page(self, shop):
+        path = os.path.join(self.fixtures_dir, f"{shop}.html")
+        if not shop.isidentifier() or not os.path.isfile(path):
+            return None
+        with open(path, 'rb') as fixture_file:
+            return fixture_file.read()
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                shop = self.path.lstrip('/').split('/', 1)[0].split('?', 1)[0]
+                with server.lock:
+                    server.calls[shop] += 1
+
+                time.sleep(server.latencies.get(shop, 0.0))
+                page = server._page(shop)
+                if page is None:
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(page)))
+                self.end_headers()
+                self.wfile.write(page)
+
+        return Handler
@@ -0,0 +1,125 @@
+# Copyright 2025 Giorgio Gamba
+
+import os
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from .adapters import ADAPTER_CLASSES, get_adapter
+from .adapters.base import match_product, parse_price
+from .lookup import SHOP_STATUS_OK, cheapest_matches, lookup_release
+from .mock_server import FIXTURES_DIR, MockShopServer
+
+QUERY = {'artist': 'Basic Channel', 'title': 'Quadrant Dub', 'catno': 'BC-04'}
+
+def read_fixture(shop):
+    with open(os.path.join(FIXTURES_DIR, f"{shop}.html"), encoding='utf8') as fixture_file:
+        return fixture_file.read()
+
+def parse_fixture(shop):
+    adapter = ADAPTER_CLASSES[shop]()
+    return [adapter.build_result(product) for product in adapter.parse(read_fixture(shop))]
+
+# The fixtures are hand written stand-ins of the search pages: these tests pin the parsing of the markup
+# the adapters expect, they don't prove that the live sites still use it
+class ParserTests(SimpleTestCase):
+
+    def test_decks(self):
+        results = parse_fixture('decks')
+        self.assertEqual([result['catno'] for result in results], ['BC-04', 'BC 04 RE', 'M-4'])
+        self.assertEqual(results[0], {
+            'shop': 'decks',
+            'artist': 'Basic Channel',
+            'title': 'Quadrant Dub',
+            'label': 'Basic Channel',
+            'catno': 'BC-04',
+            'price': 14.99,
+            'currency': 'EUR',
+            'available': True,
+            'url': 'https://www.decks.de/track/basic_channel-quadrant_dub/a1b2c3',
+        })
+        self.assertFalse(results[1]['available'])
+
+    def test_hardwax(self):
+        results = parse_fixture('hardwax')
+        self.assertEqual([(result['artist'], result['title']) for result in results],
+                         [('Basic Channel', 'Quadrant Dub'), ('Rhythm & Sound', 'Music A Fi Rule')])
+        self.assertEqual((results[0]['price'], results[0]['currency'], results[0]['catno']), (13.5, 'EUR', 'BC-04'))
+        self.assertEqual(results[0]['url'], 'https://hardwax.com/84512/basic-channel/quadrant-dub/')
+        self.assertEqual([result['available'] for result in results], [True, False])
+
+    def test_juno(self):
+        results = parse_fixture('juno')
+        self.assertEqual([(result['title'], result['price'], result['currency']) for result in results],
+                         [('Quadrant Dub', 10.99, 'GBP'), ('BCD', 24.99, 'GBP')])
+        # The link of the title, not the one of the artist
+        self.assertEqual(results[0]['url'], 'https://www.juno.co.uk/products/basic-channel-quadrant-dub/112233-01/')
+        self.assertEqual([result['available'] for result in results], [True, False])
+
+    def test_prices(self):
+        self.assertEqual(parse_price('12,99 €'), (12.99, 'EUR'))
+        self.assertEqual(parse_price('£9.49'), (9.49, 'GBP'))
+        self.assertEqual(parse_price('EUR 14.50'), (14.5, 'EUR'))
+        self.assertEqual(parse_price('1.234,50 €'), (1234.5, 'EUR'))
+        self.assertEqual(parse_price('$1,234.50'), (1234.5, 'USD'))
+        self.assertEqual(parse_price('sold out'), (None, None))
+
+    def test_matches(self):
+        self.assertEqual(match_product({'catno': 'bc 04', 'title': 'Something else'}, QUERY), 'catno')
+        self.assertEqual(match_product({'catno': 'BC 04 RE', 'artist': 'Basic Channel', 'title': 'Quadrant Dub (Repress)'}, QUERY), 'title')
+        self.assertIsNone(match_product({'catno': 'M-4', 'artist': 'Maurizio', 'title': 'M4'}, QUERY))
+
+# Lookups through the adapters against the mock server, which serves the same fixtures
+class LookupTests(SimpleTestCase):
+
+    def setUp(self):
+        self.server = MockShopServer(latencies={'juno': 1.0}).start()
+        self.addCleanup(self.server.stop)
+
+        environ = {f"SHOPS_{shop.upper()}_URL": f"{self.server.base_url}/{shop}" for shop in ADAPTER_CLASSES}
+        environ['SHOPS_JUNO_TIMEOUT'] = '5'
+        environ_patch = mock.patch.dict(os.environ, environ)
+        environ_patch.start()
+        self.addCleanup(environ_patch.stop)
+
+        # Adapters are per process: start without connections or cached pages
+        for shop in ADAPTER_CLASSES:
+            get_adapter(shop).close()
+            get_adapter(shop).cache.clear()
+
+    def test_cheapest_available_match_in_every_currency(self):
+        shop_results = lookup_release(QUERY, list(ADAPTER_CLASSES))
+        self.assertEqual([shop_result['status'] for shop_result in shop_results], [SHOP_STATUS_OK] * 3)
+
+        cheapest = cheapest_matches(shop_results)
+        self.assertEqual([(result['shop'], result['price'], result['currency']) for result in cheapest],
+                         [('hardwax', 13.5, 'EUR'), ('juno', 10.99, 'GBP')])
+
+        # Parsed pages are reused
+        shop_results = lookup_release(QUERY, ['decks'])
+        self.assertTrue(shop_results[0]['cached'])
+        self.assertEqual(self.server.calls['decks'], 1)
+
+    def test_slow_shop_does_not_hold_back_the_others(self):
+        with mock.patch.dict(os.environ, {'SHOPS_JUNO_TIMEOUT': '0.2'}):
+            get_adapter('juno').close()
+            shop_results = {shop_result['shop']: shop_result for shop_result in lookup_release(QUERY, list(ADAPTER_CLASSES))}
+
+        self.assertNotEqual(shop_results['juno']['status'], SHOP_STATUS_OK)
+        self.assertEqual(shop_results['juno']['results'], [])
+        self.assertEqual(shop_results['decks']['status'], SHOP_STATUS_OK)
+        self.assertEqual(shop_results['hardwax']['status'], SHOP_STATUS_OK)
+
+    @override_settings(SHOPS_ENABLED='')
+    def test_lookups_are_off_until_shops_are_enabled(self):
+        response = self.client.get('/api/shops/lookup/', {'catno': 'BC-04'})
+        self.assertEqual(response.status_code, 503)
+
+    @override_settings(SHOPS_ENABLED='decks,hardwax')
+    def test_lookup_endpoint(self):
+        response = self.client.get('/api/shops/lookup/', {'artist': 'Basic Channel', 'title': 'Quadrant Dub', 'catno': 'BC-04'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([shop_result['shop'] for shop_result in response.json()['shops']], ['decks', 'hardwax'])
+
+        response = self.client.get('/api/shops/lookup/', {'catno': 'BC-04', 'shops': 'juno'})
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,6 @@
+from django.urls import re_path
+from .views import ShopLookupView
+
+urlpatterns = [
+	re_path(r'^lookup/$', ShopLookupView.as_view(), name='shops-lookup'),
+]
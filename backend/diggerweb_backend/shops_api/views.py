@@ -0,0 +1,55 @@
+# Copyright 2025 Giorgio Gamba
+
+import logging
+import time
+
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from rest_framework import status
+
+from .adapters import enabled_shops
+from .lookup import cheapest_matches, lookup_release, release_query
+
+logger = logging.getLogger(__name__)
+
+ERROR_KEY = 'error'
+
+# Looks up a release on the other shops (decks.de, Hard Wax, Juno...) at once. The release is given by its
+# Discogs 'release_id' (artist, title and catalog number are taken from the local data) or by 'artist',
+# 'title' and 'catno'. 'shops' restricts the lookup to some of the enabled shops
+class ShopLookupView(APIView):
+
+    def get(self, request, *args, **kwargs):
+        start = time.perf_counter()
+
+        release_id = request.query_params.get('release_id')
+        if release_id:
+            if not release_id.isdigit():
+                 return Response({ERROR_KEY: "'release_id' parameter must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+
+            query = release_query(int(release_id))
+            if query is None:
+                 return Response({ERROR_KEY: f"Release {release_id} unknown, pass 'artist' and 'title' or 'catno' instead."}, status=status.HTTP_404_NOT_FOUND)
+        else:
+            query = {name: (request.query_params.get(name) or '').strip() for name in ('artist', 'title', 'catno')}
+            if not query['catno'] and not query['title']:
+                 return Response({ERROR_KEY: "Missing 'release_id', 'title' or 'catno' parameter."}, status=status.HTTP_400_BAD_REQUEST)
+
+        shops = enabled_shops()
+        if not shops:
+             return Response({ERROR_KEY: "No shop enabled, see the SHOPS_ENABLED setting."}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+        if request.query_params.get('shops'):
+            requested = [name.strip() for name in request.query_params['shops'].split(',') if name.strip()]
+            unknown = [name for name in requested if name not in shops]
+            if unknown:
+                 return Response({ERROR_KEY: f"Unknown or disabled shops: {', '.join(unknown)}. Available: {', '.join(shops)}."}, status=status.HTTP_400_BAD_REQUEST)
+            shops = requested
+
+        shop_results = lookup_release(query, shops)
+        return Response({
+            'query': query,
+            'shops': shop_results,
+            'cheapest': cheapest_matches(shop_results),
+            'elapsed_ms': round((time.perf_counter() - start) * 1000, 1)
+        }, status=status.HTTP_200_OK)